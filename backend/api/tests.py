@@ -1,3 +1,40 @@
-from django.test import TestCase
+from django.conf import settings
+from django.test import SimpleTestCase
+from django.urls import reverse
+from unittest import mock
+import os
+import subprocess
+import sys
+import tempfile
+from furniture_detector.model import metrics
 
-# Create your tests here.
+
+class MetricsEndpointTests(SimpleTestCase):
+    def test_scrape_is_prometheus_text(self):
+        metrics.cache_lookup("detection", True)
+
+        response = self.client.get(reverse("metrics"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        body = response.content.decode()
+        self.assertIn("# TYPE fengshui_cache_lookups_total counter", body)
+        self.assertIn('fengshui_cache_lookups_total{cache="detection",result="hit"}', body)
+
+    def test_multiprocess_mode_includes_worker_processes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # a "worker": another process recording into the shared directory
+        subprocess.run(
+            [sys.executable, "-c",
+             "from furniture_detector.model import metrics; metrics.observe('inference', 0.2); "
+             "metrics.cache_lookup('dimension', False)"],
+            cwd=settings.BASE_DIR, env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": directory.name}, check=True,
+        )
+
+        with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory.name}):
+            response = self.client.get(reverse("metrics"))
+
+        body = response.content.decode()
+        self.assertIn('fengshui_stage_seconds_count{stage="inference"} 1.0', body)
+        self.assertIn('fengshui_cache_lookups_total{cache="dimension",result="miss"} 1.0', body)
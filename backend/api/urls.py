@@ -1,10 +1,11 @@
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from .views import health
+from .views import health, metrics
 
 urlpatterns = [
     path('health', health, name='health_check'),
+    path('metrics', metrics, name='metrics'),
     path('furnitures/', include('furniture_detector.urls'))
 
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -1,9 +1,17 @@
+from django.http import HttpResponse
 from django.shortcuts import render
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
 import requests
+from furniture_detector.model import metrics as pipeline_metrics
 
 @api_view(['GET'])
 def health(request):
     text = request.data.get('text')
     return Response(f'Copy that: {text}', status=200)
+
+
+def metrics(request):
+    """ Prometheus scrape endpoint, aggregated over every process of the host in multiprocess mode. """
+    body, content_type = pipeline_metrics.render()
+    return HttpResponse(body, content_type=content_type)
@@ -0,0 +1,45 @@
+"""
+Microbenchmark: per-box Python loop vs columnar `Detections` post-processing.
+
+Run from backend/:
+    python -m benchmarks.bench_postprocess
+"""
+import timeit
+import torch
+from ultralytics.engine.results import Boxes
+
+from furniture_detector.model.detections import Detections
+
+
+def synthetic_boxes(n: int, num_classes: int = 20) -> Boxes:
+    xy = torch.rand(n, 2) * 1000
+    wh = torch.rand(n, 2) * 300 + 1
+    conf = torch.rand(n, 1)
+    cls = torch.randint(0, num_classes, (n, 1)).float()
+    return Boxes(torch.cat([xy, xy + wh, conf, cls], dim=1), orig_shape=(1400, 1400))
+
+
+def loop_postprocess(boxes: Boxes) -> list:
+    """ The pre-columnar implementation. """
+    detections = []
+    for box in boxes:
+        detections.append({
+            "class_id": int(box.cls),
+            "confidence": float(box.conf),
+            "bbox": box.xyxy[0].tolist()
+        })
+    return detections
+
+
+def main(sizes=(10, 50, 200), number=200):
+    print(f"{'boxes':>6} {'loop (us)':>12} {'columnar (us)':>14} {'+to_dicts (us)':>15} {'speedup':>8}")
+    for n in sizes:
+        boxes = synthetic_boxes(n)
+        loop = timeit.timeit(lambda: loop_postprocess(boxes), number=number) / number * 1e6
+        columnar = timeit.timeit(lambda: Detections.from_boxes(boxes), number=number) / number * 1e6
+        with_dicts = timeit.timeit(lambda: Detections.from_boxes(boxes).to_dicts(), number=number) / number * 1e6
+        print(f"{n:>6} {loop:>12.1f} {columnar:>14.1f} {with_dicts:>15.1f} {loop / with_dicts:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
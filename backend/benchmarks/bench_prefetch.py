@@ -0,0 +1,111 @@
+"""
+Images/sec of `stream_folder` with and without decode/preprocess prefetching
+(model.prefetch.Prefetcher).
+
+Writes a folder of synthetic JPEGs (or uses --folder) and streams it through
+the model once per prefetch depth. Depth 0 is the serial path: read, decode,
+resize and infer one batch after another on one thread. Higher depths
+decode the next batches in --workers threads while the current batch runs.
+Also reports the peak RSS growth, which should stay bounded by depth x batch
+buffers whatever the folder size.
+
+The detector is YOLOModel (default) or ONNXModel (--backend onnx) on --weights
+(default: yolov8n.yaml architecture, random weights, no download). CPU only.
+Overlap needs spare cores: on a single core, decoding and inference take turns.
+
+Run from backend/:
+    python -m benchmarks.bench_prefetch --images 64 --depths 0 1 2 4 --output prefetch.json
+"""
+import argparse
+import json
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+
+
+def write_images(folder: str, count: int, width: int, height: int):
+    import cv2
+
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    for i in range(count):
+        image = background.copy()
+        cv2.rectangle(image, (i * 13 % (width // 2), height // 4), (width // 2, height * 3 // 4), (0, 0, 255), -1)
+        cv2.imwrite(os.path.join(folder, f"{i:05d}.jpg"), image)
+
+
+def load(args):
+    if args.backend == "onnx":
+        from furniture_detector.model.onnx_runtime import ONNXModel
+
+        model = ONNXModel(model_path=args.weights)
+    else:
+        from furniture_detector.model.yolo import YOLOModel
+
+        model = YOLOModel(model_path=args.weights, device="cpu")
+    model.load_model(batch_size=args.batch_size, imgsz=args.imgsz, prefetch_workers=args.workers)
+    model.warmup(iterations=1)
+    return model
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folder", help="folder of images (default: synthetic JPEGs)")
+    parser.add_argument("--images", type=int, default=64, help="number of synthetic images")
+    parser.add_argument("--size", type=int, nargs=2, default=[1920, 1080], help="synthetic image width height")
+    parser.add_argument("--backend", choices=["yolo", "onnx"], default="yolo")
+    parser.add_argument("--weights", default="yolov8n.yaml", help=".pt weights or a model .yaml (yolo only)")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=2, help="prefetch threads")
+    parser.add_argument("--depths", type=int, nargs="*", default=[0, 1, 2, 4], help="prefetch depths, 0 = serial")
+    parser.add_argument("--repeat", type=int, default=2, help="runs per depth, best is reported")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    folder = args.folder
+    if not folder:
+        folder = tempfile.mkdtemp(prefix="bench_prefetch_")
+        write_images(folder, args.images, *args.size)
+
+    model = load(args)
+    count = model.count_images(folder)
+    results = {}
+    for depth in args.depths:
+        # the model's Prefetcher (and its buffer ring) is kept across depths
+        model.prefetch_depth = model.prefetcher.depth = depth
+        base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for _ in model.stream_folder(folder):
+                pass
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[str(depth)] = {
+            "images": count,
+            "seconds": best,
+            "images_per_sec": count / best,
+            "peak_rss_growth_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss) / 1024,
+        }
+
+    serial = results.get("0", {}).get("images_per_sec")
+    print(f"{args.backend}, {count} images, batch {args.batch_size}, {args.workers} workers, "
+          f"{os.cpu_count()} CPUs")
+    print(f"{'depth':>6} {'seconds':>8} {'img/s':>7} {'speedup':>8} {'peak +MB':>9}")
+    for depth, r in results.items():
+        speedup = f"{r['images_per_sec'] / serial:.2f}x" if serial else "-"
+        print(f"{depth:>6} {r['seconds']:>8.2f} {r['images_per_sec']:>7.1f} {speedup:>8} "
+              f"{r['peak_rss_growth_mb']:>9.0f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"backend": args.backend, "folder": folder, "batch_size": args.batch_size,
+                       "workers": args.workers, "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
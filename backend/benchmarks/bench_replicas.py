@@ -0,0 +1,120 @@
+"""
+Throughput of a model replica pool against replica count.
+
+For every replica count, loads the model through ModelManager with
+`replicas: n` and `threads_per_replica: cpus // n`, then has concurrent
+clients call the unchanged `model.predict_image(image)` and reports aggregate
+images/sec, the speedup over one replica using every core, and the scaling
+efficiency (speedup / n). "default" is a single unpinned instance with torch's
+default thread count, for reference.
+
+Needs torch and ultralytics; by default the model is built from the
+yolov8n.yaml architecture (random weights, no download). CPU only.
+
+Run from backend/:
+    python -m benchmarks.bench_replicas --images 64 --output replicas.json
+"""
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+
+from .common import setup_django
+
+setup_django()
+
+from furniture_detector.model.registry import ModelManager
+from furniture_detector.model.replicas import available_cpus
+
+CATEGORY = "bench"
+
+
+def register(name: str, weights: str, imgsz: int, replicas: int = None, threads: int = None):
+    info = {
+        "class": "YOLOModel",
+        "required_vram": 0.1,
+        "constructor_kwargs": {"model_path": weights, "device": "cpu"},
+        "loader_kwargs": {"batch_size": 1, "imgsz": imgsz},
+    }
+    if replicas:
+        info["replicas"] = replicas
+        info["threads_per_replica"] = threads
+    ModelManager.add_model(name, info, model_category=CATEGORY)
+
+
+def throughput(name: str, images: int, clients: int, imgsz: int) -> dict:
+    model = ModelManager.get_model(name, CATEGORY)
+    model.warmup()
+    image = np.random.default_rng(0).integers(0, 255, (imgsz, imgsz, 3), dtype=np.uint8)
+
+    remaining = [images]
+    lock = threading.Lock()
+    latencies = []
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            model.predict_image(image)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    ModelManager.unload_model(name)
+
+    return {
+        "images_per_sec": images / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="yolov8n.yaml", help=".pt weights or a model .yaml")
+    parser.add_argument("--imgsz", type=int, default=320)
+    parser.add_argument("--images", type=int, default=64, help="images per replica count")
+    parser.add_argument("--replicas", type=int, nargs="*",
+                        help="replica counts to try (default: powers of two up to the CPU count)")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    cpus = len(available_cpus())
+    counts = args.replicas or [n for n in (1, 2, 4, 8, 16, 32, 64, 128) if n <= cpus]
+
+    register("replicas_default", args.weights, args.imgsz)
+    results = {"default": throughput("replicas_default", args.images, clients=max(counts), imgsz=args.imgsz)}
+    for n in counts:
+        name = f"replicas_{n}"
+        register(name, args.weights, args.imgsz, replicas=n, threads=max(1, cpus // n))
+        # twice as many clients as replicas keeps every replica's queue non-empty
+        results[str(n)] = throughput(name, args.images, clients=2 * n, imgsz=args.imgsz)
+
+    base = results[str(counts[0])]["images_per_sec"] / counts[0]
+    print(f"{cpus} CPUs, {args.images} images at {args.imgsz}px")
+    print(f"{'replicas':>9} {'img/s':>9} {'speedup':>8} {'eff':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for key, stats in results.items():
+        n = int(key) if key.isdigit() else 1
+        stats["speedup"] = stats["images_per_sec"] / base
+        stats["efficiency"] = stats["speedup"] / n
+        print(f"{key:>9} {stats['images_per_sec']:>9.2f} {stats['speedup']:>7.2f}x {stats['efficiency']:>6.2f} "
+              f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cpus": cpus, "imgsz": args.imgsz, "images": args.images, "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
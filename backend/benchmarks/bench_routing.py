@@ -0,0 +1,149 @@
+"""
+Model swaps under mixed traffic: one shared queue vs model-affinity queues.
+
+Simulates a fleet of worker processes, each with its own ModelManager, two
+stub models (StubDetector, --load-ms to load, --infer-ms per job) and a host
+memory budget that fits only one of them, so serving the other model means an
+evict + reload ("swap"). Half of the workers keep stub0 resident, the other
+half stub1. Mixed traffic (--mix of stub0 jobs) arrives at --rate jobs/s.
+
+    shared    MODEL_QUEUES=off: every job on the default queue, any worker takes it
+    affinity  MODEL_QUEUES=model: jobs routed by queues.route_task (as process_image
+              would be), workers consume their models' queues (queues.worker_queues)
+
+Workers take one job at a time (prefetch multiplier 1). The broker is a set
+of multiprocessing queues, so no Redis or Celery worker is needed. Reports
+swaps, throughput and queue wait percentiles per mode.
+
+Run from backend/:
+    python -m benchmarks.bench_routing --workers 4 --jobs 400 --output routing.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import time
+
+import numpy as np
+
+BUDGET_GB = 1.5   # one 1 GB stub model fits, two don't
+MODES = {"shared": "off", "affinity": "model"}
+
+
+def worker(index, models, mode, broker, results, stop, load_seconds, infer_seconds):
+    os.environ["MODEL_HOST_BUDGET_GB"] = str(BUDGET_GB)
+    from .common import setup_django
+
+    setup_django(MODEL_QUEUES=mode, WORKER_MODELS=",".join(models))
+    from furniture_detector import queues
+    from furniture_detector.model.registry import ModelManager
+    from .stubs import STUB_CATEGORY, register_stub_models
+
+    register_stub_models(2, load_seconds=load_seconds, infer_seconds=infer_seconds)
+    subscribed = [broker[name] for name in ["celery"] + queues.worker_queues()]
+    ModelManager.preload(models, warmup=False)
+
+    turn = 0
+    while not stop.is_set():
+        # round-robin over subscribed queues, one job at a time
+        source = subscribed[turn % len(subscribed)]
+        turn += 1
+        try:
+            model_name, enqueued_at = source.get(timeout=0.005)
+        except queue.Empty:
+            continue
+        started = time.perf_counter()
+        resident = {m["name"] for m in ModelManager.residency_report()["models"]}
+        with ModelManager.lease(model_name, STUB_CATEGORY) as model:
+            model.predict_image(None)
+        results.put({"worker": index, "model": model_name, "swap": model_name not in resident,
+                     "wait": started - enqueued_at, "done": time.perf_counter()})
+
+
+def run(mode: str, args) -> dict:
+    from django.conf import settings
+    from furniture_detector import queues
+    from furniture_detector.tasks import process_image
+
+    settings.MODEL_QUEUES = mode
+    ctx = multiprocessing.get_context("spawn")
+    broker = {name: ctx.Queue() for name in ["celery"] + queues.model_queues(["stub0", "stub1"])}
+    results, stop = ctx.Queue(), ctx.Event()
+
+    processes = [
+        ctx.Process(target=worker, args=(i, [f"stub{i % 2}"], mode, broker, results, stop,
+                                         args.load_ms / 1000, args.infer_ms / 1000))
+        for i in range(args.workers)
+    ]
+    for p in processes:
+        p.start()
+    # let every worker preload before traffic starts
+    time.sleep(args.startup_s)
+
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for i in range(args.jobs):
+        model_name = "stub0" if rng.random() < args.mix else "stub1"
+        route = queues.route_task(process_image.name, (), {"model_name": model_name}, {}, task=process_image)
+        broker[route["queue"] if route else "celery"].put((model_name, time.perf_counter()))
+        time.sleep(max(0.0, start + (i + 1) / args.rate - time.perf_counter()))
+
+    done = [results.get() for _ in range(args.jobs)]
+    stop.set()
+    for p in processes:
+        p.join()
+
+    waits = np.array([d["wait"] for d in done]) * 1000
+    elapsed = max(d["done"] for d in done) - start
+    swaps = sum(d["swap"] for d in done)
+    return {
+        "jobs": args.jobs,
+        "swaps": swaps,
+        "swap_rate": swaps / args.jobs,
+        "seconds": elapsed,
+        "jobs_per_sec": args.jobs / elapsed,
+        "wait_p50_ms": float(np.percentile(waits, 50)),
+        "wait_p95_ms": float(np.percentile(waits, 95)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4, help="worker processes (even: half per model)")
+    parser.add_argument("--jobs", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=50, help="arriving jobs per second")
+    parser.add_argument("--mix", type=float, default=0.5, help="fraction of stub0 jobs")
+    parser.add_argument("--load-ms", type=float, default=200, help="stub model load time")
+    parser.add_argument("--infer-ms", type=float, default=20, help="stub inference time per job")
+    parser.add_argument("--startup-s", type=float, default=5, help="time given to workers to start")
+    parser.add_argument("--modes", nargs="*", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    # both stub models are "preloaded", so they get a queue of their own (see queues.routed_models)
+    os.environ["PRELOAD_MODELS"] = "stub0,stub1"
+    from .common import setup_django
+
+    setup_django()
+    from .stubs import register_stub_models
+
+    register_stub_models(2)
+
+    results = {name: run(MODES[name], args) for name in args.modes}
+
+    print(f"{args.workers} workers, {args.jobs} jobs at {args.rate}/s, {args.mix:.0%} stub0, "
+          f"load {args.load_ms:.0f} ms, inference {args.infer_ms:.0f} ms")
+    print(f"{'mode':<9} {'swaps':>6} {'rate':>6} {'seconds':>8} {'jobs/s':>7} {'wait p50':>9} {'wait p95':>9}")
+    for name, r in results.items():
+        print(f"{name:<9} {r['swaps']:>6} {r['swap_rate']:>6.1%} {r['seconds']:>8.2f} {r['jobs_per_sec']:>7.1f} "
+              f"{r['wait_p50_ms']:>9.1f} {r['wait_p95_ms']:>9.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Startup benchmark for the web / ASGI tier.
+
+Boots Django in a fresh interpreter and imports what a web process imports
+(URLconf, views, ASGI routing), then reports wall time, peak RSS and whether
+the deep-learning stack got imported. The "eager" scenario additionally
+imports the YOLO model module, which is what every process used to pay.
+
+Run from backend/:
+    python -m benchmarks.bench_startup [--repeat 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    "web": "",
+    "eager": "import furniture_detector.model.yolo; import ultralytics",
+}
+
+PROBE = """
+import json, os, resource, sys, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+import django
+django.setup()
+import core.urls, api.routing
+{extra}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "torch_imported": "torch" in sys.modules,
+    "ultralytics_imported": "ultralytics" in sys.modules,
+}}))
+"""
+
+
+def run(scenario: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(extra=SCENARIOS[scenario])],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(repeat: int = 3) -> dict:
+    results = {}
+    for scenario in SCENARIOS:
+        runs = [run(scenario) for _ in range(repeat)]
+        best = min(runs, key=lambda r: r["seconds"])
+        results[scenario] = best
+        print(f"{scenario:>6}: {best['seconds']:.2f}s, peak RSS {best['peak_rss_mb']:.0f} MB, "
+              f"torch imported: {best['torch_imported']}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args().repeat)
@@ -0,0 +1,90 @@
+"""
+Latency and memory of tiled inference (YOLOModel.predict_tiled) against image size.
+
+For each image size, runs a synthetic image through the tiled path and
+reports the tile count, latency, latency per tile and the peak RSS growth.
+Latency should scale with the tile count. Peak memory should stay near the
+decoded image plus one tile batch. For comparison, "full_res" runs the same
+image untiled at full resolution (imgsz = longest side), which is what
+tiling avoids.
+
+Needs torch and ultralytics; by default the model is built from the
+yolov8n.yaml architecture (random weights, no download). CPU only.
+
+Run from backend/:
+    python -m benchmarks.bench_tiling --sizes 1280 2560 5120 --output tiling.json
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import time
+
+import numpy as np
+
+
+def run(weights: str, size: int, imgsz: int, tile_batch: int, full_res: bool, queue):
+    # fresh process per case, so ru_maxrss is this case's peak
+    from furniture_detector.model.yolo import YOLOModel
+    from furniture_detector.model import ops
+
+    model = YOLOModel(model_path=weights, device="cpu")
+    model.load_model(batch_size=tile_batch, imgsz=imgsz, tiling={"full_image": False})
+    image = np.random.default_rng(0).integers(0, 255, (size // 2, size, 3), dtype=np.uint8)
+    model.warmup(iterations=1)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if full_res:
+        model.imgsz = size
+        start = time.perf_counter()
+        model._predict(image)
+        tiles = 1
+    else:
+        tiles = len(ops.tile_origins(size, size // 2, imgsz, model.tiling["overlap"]))
+        start = time.perf_counter()
+        model.predict_tiled(image)
+    elapsed = time.perf_counter() - start
+
+    queue.put({
+        "image": f"{size}x{size // 2}",
+        "tiles": tiles,
+        "seconds": elapsed,
+        "ms_per_tile": elapsed / tiles * 1000,
+        "peak_rss_growth_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss) / 1024,
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="yolov8n.yaml", help=".pt weights or a model .yaml")
+    parser.add_argument("--imgsz", type=int, default=640, help="tile size")
+    parser.add_argument("--tile-batch", type=int, default=4, help="tiles per forward pass")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1280, 2560, 5120], help="image widths (2:1 panoramas)")
+    parser.add_argument("--full-res", action="store_true", help="also run each image untiled at full resolution")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for size in args.sizes:
+        for mode in (["tiled", "full_res"] if args.full_res else ["tiled"]):
+            queue = ctx.Queue()
+            process = ctx.Process(target=run, args=(args.weights, size, args.imgsz, args.tile_batch,
+                                                    mode == "full_res", queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            results[f"{mode}.{size}"] = result
+
+    print(f"{'case':<16} {'image':>10} {'tiles':>6} {'seconds':>8} {'ms/tile':>8} {'peak +MB':>9}")
+    for name, r in results.items():
+        print(f"{name:<16} {r['image']:>10} {r['tiles']:>6} {r['seconds']:>8.2f} {r['ms_per_tile']:>8.1f} "
+              f"{r['peak_rss_growth_mb']:>9.0f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"imgsz": args.imgsz, "tile_batch": args.tile_batch, "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Frame-stream pipeline (model.streaming.StreamPipeline) on a local video file.
+
+Writes a synthetic video (or uses --video), plays it at its own frame rate
+through the pipeline and reports, per target FPS: frames decoded / inferred /
+dropped, achieved inference FPS and end-to-end latency (frame read -> detections
+ready) percentiles. CPU only.
+
+The detector is YOLOModel on --weights (default: yolov8n.yaml architecture,
+random weights, no download), or a StubDetector sleeping --stub-ms per frame
+with --stub.
+
+Run from backend/:
+    python -m benchmarks.bench_video --seconds 10 --fps 5 10 30 --output video.json
+"""
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+
+
+def write_video(path: str, seconds: float, fps: int, width: int, height: int):
+    import cv2
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    for i in range(int(seconds * fps)):
+        frame = background.copy()
+        x = (i * 7) % (width - 100)
+        cv2.rectangle(frame, (x, height // 3), (x + 100, height // 3 + 80), (0, 0, 255), -1)
+        writer.write(frame)
+    writer.release()
+
+
+def detector(args):
+    if args.stub:
+        from .stubs import StubDetector
+
+        model = StubDetector(infer_seconds=args.stub_ms / 1000.0)
+    else:
+        from furniture_detector.model.yolo import YOLOModel
+
+        model = YOLOModel(model_path=args.weights, device="cpu")
+    model.load_model(batch_size=1, imgsz=args.imgsz)
+    model.warmup()
+    return model.predict_image
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="video file to play (default: a synthetic one)")
+    parser.add_argument("--seconds", type=float, default=10, help="length of the synthetic video")
+    parser.add_argument("--source-fps", type=int, default=30, help="frame rate of the synthetic video")
+    parser.add_argument("--fps", type=float, nargs="*", default=[5, 10, 30], help="target inference FPS values")
+    parser.add_argument("--queue-size", type=int, default=2)
+    parser.add_argument("--weights", default="yolov8n.yaml", help=".pt weights or a model .yaml")
+    parser.add_argument("--imgsz", type=int, default=320)
+    parser.add_argument("--stub", action="store_true", help="use a sleeping stub detector instead of YOLO")
+    parser.add_argument("--stub-ms", type=float, default=50, help="stub inference time per frame")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    from furniture_detector.model.streaming import StreamPipeline
+
+    video = args.video
+    if not video:
+        video = os.path.join(tempfile.mkdtemp(prefix="bench_video_"), "synthetic.avi")
+        write_video(video, args.seconds, args.source_fps, 1280, 720)
+
+    predict = detector(args)
+    results = {}
+    for fps in args.fps:
+        pipeline = StreamPipeline(predict, target_fps=fps, queue_size=args.queue_size, name="bench")
+        results[str(fps)] = pipeline.run_video(video, realtime=True)
+
+    print(f"{'target':>7} {'decoded':>8} {'inferred':>9} {'dropped':>8} {'fps':>6} {'p50 ms':>7} {'p95 ms':>7}")
+    for fps, r in results.items():
+        print(f"{fps:>7} {r['decoded']:>8} {r['inferred']:>9} {r['dropped']:>8} {r['fps']:>6.1f} "
+              f"{r['latency_p50_ms'] or 0:>7.1f} {r['latency_p95_ms'] or 0:>7.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"video": video, "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
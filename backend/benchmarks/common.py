@@ -0,0 +1,50 @@
+import statistics
+import time
+
+
+def measure(fn, number: int = 1000, repeat: int = 5, setup=None) -> dict:
+    """
+    Times `fn` `number` times per round over `repeat` rounds.
+    Returns per-call statistics in microseconds (best round is the least noisy).
+    """
+    rounds = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - start) / number * 1e6)
+    return {
+        "best_us": min(rounds),
+        "median_us": statistics.median(rounds),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+_django_ready = False
+
+
+def setup_django(**overrides):
+    """
+    Configures Django with the project settings, an in-memory channel layer and
+    an in-memory database, so benchmarks never need Redis or a GPU.
+    """
+    global _django_ready
+    if _django_ready:
+        return
+
+    import os
+    import django
+    from django.conf import settings
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    settings.CHANNEL_LAYERS = {
+        "default": {"BACKEND": "channels.layers.InMemoryChannelLayer", "CONFIG": {"capacity": 1_000_000}},
+    }
+    settings.DATABASES["default"] = {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}
+    for key, value in overrides.items():
+        setattr(settings, key, value)
+    django.setup()
+    _django_ready = True
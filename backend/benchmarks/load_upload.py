@@ -0,0 +1,176 @@
+"""
+Local load test of the upload endpoints with many concurrent slow clients.
+
+Drives the project's Django ASGI app in-process. Every simulated client
+trickles a multipart upload in `--chunks` pieces, `--chunk-delay-ms` apart
+(a slow mobile connection), then waits for the response. The same load is
+run against the sync DRF view (`upload/`) and the async view (`upload/async/`).
+For each view the script reports completed uploads, wall time, latency
+percentiles and the peak number of threads the process used.
+
+Tasks are published to Celery's in-memory broker unless --broker is given
+(e.g. redis://localhost:6379/0 to include the real publish round trip).
+Nothing is consumed: this measures the web tier only.
+
+Run from backend/:
+    python -m benchmarks.load_upload --clients 200 --output upload_load.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=200, help="concurrent uploads")
+    parser.add_argument("--chunks", type=int, default=20, help="body pieces per upload")
+    parser.add_argument("--chunk-delay-ms", type=float, default=50, help="delay between body pieces")
+    parser.add_argument("--size", type=int, default=640, help="side of the uploaded JPEG in px")
+    parser.add_argument("--broker", default="memory://", help="Celery broker URL")
+    parser.add_argument("--views", nargs="*", default=["sync", "async"], choices=["sync", "async"])
+    parser.add_argument("--output", help="write JSON results to this file")
+    return parser.parse_args(argv)
+
+
+ARGS = parse_args()
+WORKDIR = tempfile.mkdtemp(prefix="upload_load_")
+
+from .common import setup_django
+
+setup_django(
+    DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": os.path.join(WORKDIR, "db.sqlite3"),
+                           "OPTIONS": {"timeout": 60}}},
+    MEDIA_ROOT=WORKDIR,
+    CELERY_BROKER_URL=ARGS.broker,
+    CELERY_RESULT_BACKEND="cache+memory://",
+    ALLOWED_HOSTS=["*"],
+)
+
+from django.core.asgi import get_asgi_application
+from django.core.management import call_command
+
+URLS = {"sync": "/api/furnitures/upload/", "async": "/api/furnitures/upload/async/"}
+
+
+def jpeg_bytes(size: int) -> bytes:
+    from PIL import Image
+
+    pixels = np.random.default_rng(0).integers(0, 255, (size, size, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def multipart(image: bytes, session_id: str, task_id: str):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in (("session_id", session_id), ("task_id", task_id)):
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="upload.jpg"\r\n'
+                 f'Content-Type: image/jpeg\r\n\r\n'.encode() + image + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+async def slow_upload(app, url: str, body: bytes, content_type: str, chunks: int, delay: float) -> dict:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": url, "raw_path": url.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"localhost"), (b"content-type", content_type.encode()),
+                    (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+    }
+    step = -(-len(body) // chunks)
+    pieces = [body[i:i + step] for i in range(0, len(body), step)]
+    sent = 0
+    disconnect = asyncio.Event()
+
+    async def receive():
+        nonlocal sent
+        if sent < len(pieces):
+            if sent:
+                await asyncio.sleep(delay)
+            sent += 1
+            return {"type": "http.request", "body": pieces[sent - 1], "more_body": sent < len(pieces)}
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    response = {}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            disconnect.set()
+
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    return {"status": response.get("status"), "seconds": time.perf_counter() - start}
+
+
+async def run_view(app, view: str, image: bytes) -> dict:
+    peak_threads = threading.active_count()
+    running = True
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while running:
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.01)
+
+    sampler = asyncio.ensure_future(sample_threads())
+    start = time.perf_counter()
+    results = await asyncio.gather(*[
+        slow_upload(app, URLS[view], *multipart(image, f"load-{view}", f"{view}-{i}"),
+                    chunks=ARGS.chunks, delay=ARGS.chunk_delay_ms / 1000.0)
+        for i in range(ARGS.clients)
+    ])
+    elapsed = time.perf_counter() - start
+    running = False
+    await sampler
+
+    latencies = [r["seconds"] for r in results if r["status"] == 200]
+    return {
+        "completed": len(latencies),
+        "failed": len(results) - len(latencies),
+        "wall_seconds": elapsed,
+        "uploads_per_sec": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000) if latencies else None,
+        "p95_ms": float(np.percentile(latencies, 95) * 1000) if latencies else None,
+        "peak_threads": peak_threads,
+    }
+
+
+def main():
+    call_command("migrate", verbosity=0)
+    app = get_asgi_application()
+    image = jpeg_bytes(ARGS.size)
+    # floor: the time every client spends trickling its body
+    floor_ms = (ARGS.chunks - 1) * ARGS.chunk_delay_ms
+
+    results = {}
+    for view in ARGS.views:
+        results[view] = asyncio.run(run_view(app, view, image))
+
+    print(f"{ARGS.clients} clients, {len(image) / 1024:.0f} KB each in {ARGS.chunks} chunks "
+          f"({floor_ms:.0f} ms transfer floor)")
+    print(f"{'view':>6} {'ok':>5} {'fail':>5} {'wall s':>7} {'up/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'threads':>8}")
+    for view, r in results.items():
+        print(f"{view:>6} {r['completed']:>5} {r['failed']:>5} {r['wall_seconds']:>7.2f} {r['uploads_per_sec']:>7.1f} "
+              f"{r['p50_ms'] or 0:>8.0f} {r['p95_ms'] or 0:>8.0f} {r['peak_threads']:>8}")
+
+    if ARGS.output:
+        with open(ARGS.output, "w") as f:
+            json.dump({"args": vars(ARGS), "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+CPU-only microbenchmark suite for the hot paths around inference.
+
+Run from backend/:
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --output new.json --compare bench.json
+
+Results are JSON ({"meta": ..., "results": {name: {"best_us", "median_us", ...}}})
+so runs from different commits can be compared. No GPU, weights or Redis needed:
+models are StubDetector instances registered through ModelManager.register_class.
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+
+from .common import measure, setup_django
+
+setup_django()
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import connection
+
+from furniture_detector.model.detections import Detections
+from furniture_detector.model.registry import ModelManager
+from furniture_detector.model.residency import ResidencyManager
+from furniture_detector.models import Furniture, Picture, Task
+from furniture_detector.progress import progress_emitter
+from furniture_detector.tasks import furniture_rows, send_progress
+from .stubs import register_stub_models, synthetic_detections
+
+BOX_COUNTS = (10, 50, 200)
+
+
+def bench_registry() -> dict:
+    name = register_stub_models(count=1, prefix="registry_stub")[0]
+    ModelManager.get_model(name)
+
+    def lease():
+        with ModelManager.lease(name):
+            pass
+
+    def miss():
+        ModelManager.unload_model(name)
+        ModelManager.get_model(name)
+
+    return {
+        "registry.get_model.hit": measure(lambda: ModelManager.get_model(name), number=20000),
+        "registry.lease.hit": measure(lease, number=20000),
+        "registry.get_model.miss": measure(miss, number=200),
+    }
+
+
+def bench_eviction(resident: int = 50) -> dict:
+    residency = ResidencyManager(host_budget_gb=float(resident))
+    for i in range(resident):
+        residency.add(f"m{i}", "cpu", memory_gb=1.0, load_seconds=0.1 * (i % 7))
+        residency.touch(f"m{i}")
+    residency.decisions.clear()
+
+    def plan():
+        residency.plan_eviction("new", "cpu", required_gb=resident / 2)
+        residency.decisions.clear()
+
+    return {f"eviction.plan.{resident}_resident": measure(plan, number=2000)}
+
+
+def bench_postprocess() -> dict:
+    results = {}
+    try:
+        from .bench_postprocess import loop_postprocess, synthetic_boxes
+    except ImportError:
+        # torch / ultralytics not installed: only the dict view can be measured
+        synthetic_boxes = None
+
+    for n in BOX_COUNTS:
+        detections = synthetic_detections(n)
+        results[f"postprocess.to_dicts.{n}"] = measure(detections.to_dicts, number=2000)
+        if synthetic_boxes is not None:
+            boxes = synthetic_boxes(n)
+            results[f"postprocess.from_boxes.{n}"] = measure(lambda: Detections.from_boxes(boxes), number=2000)
+            results[f"postprocess.loop_baseline.{n}"] = measure(lambda: loop_postprocess(boxes), number=100)
+    return results
+
+
+def bench_detected_data_json() -> dict:
+    field = Picture._meta.get_field("detected_data")
+    results = {}
+    for n in BOX_COUNTS:
+        value = synthetic_detections(n).to_dicts()
+
+        def roundtrip():
+            stored = field.get_db_prep_value(value, connection)
+            field.from_db_value(stored, None, connection)
+
+        results[f"detected_data.json_roundtrip.{n}"] = measure(roundtrip, number=500)
+    return results
+
+
+def bench_detection_store(pictures: int = 200, boxes: int = 50) -> dict:
+    """
+    "Detections of class 3 above 0.8 for one task" via Furniture rows and indexes,
+    against scanning every Picture.detected_data blob of the task in Python.
+    """
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+    tasks = [Task.objects.create(id=f"store-task-{i}", session_id=f"store-session-{i % 5}") for i in range(10)]
+    for i in range(pictures):
+        task = tasks[i % len(tasks)]
+        picture = Picture.objects.create(id=f"store-picture-{i}", image_path="", task=task,
+                                         detected_data=synthetic_detections(boxes, seed=i).to_dicts())
+        Furniture.objects.bulk_create(furniture_rows(picture, task.id, picture.detected_data))
+
+    def indexed():
+        list(Furniture.objects.filter(task_id="store-task-0", name="class3", confidence__gte=0.8)
+             .order_by("-confidence")[:100])
+
+    def blob_scan():
+        [d for data in Picture.objects.filter(task_id="store-task-0").values_list("detected_data", flat=True)
+         for d in data if d["class_id"] == 3 and d["confidence"] >= 0.8]
+
+    return {
+        f"detection_store.indexed.{pictures}x{boxes}": measure(indexed, number=200),
+        f"detection_store.blob_scan.{pictures}x{boxes}": measure(blob_scan, number=20),
+    }
+
+
+def bench_send_progress() -> dict:
+    layer = get_channel_layer()
+    channel = async_to_sync(layer.new_channel)()
+    async_to_sync(layer.group_add)("progress_bench", channel)
+
+    def drain():
+        progress_emitter.flush()
+        async_to_sync(layer.flush)()
+        async_to_sync(layer.group_add)("progress_bench", channel)
+
+    def direct():
+        # the old path: one event loop hop and channel layer round trip per event
+        async_to_sync(layer.group_send)("progress_bench", {"type": "task.progress", "event": "bench_event"})
+
+    def delivered():
+        # the same event through the emitter, timed until the loop has sent it
+        send_progress("bench", "bench_event", task_id="t", processed=1)
+        progress_emitter.flush()
+
+    return {
+        "send_progress.direct": measure(direct, number=500, setup=drain),
+        # what a task waits for: only the hand-off to the emitter's loop
+        "send_progress.enqueue": measure(
+            lambda: send_progress("bench", "bench_event", task_id="t", processed=1),
+            number=500, setup=drain,
+        ),
+        # comparable with direct: enqueue plus delivery to the channel layer
+        "send_progress.delivered": measure(delivered, number=500, setup=drain),
+    }
+
+
+SUITES = {
+    "registry": bench_registry,
+    "eviction": bench_eviction,
+    "postprocess": bench_postprocess,
+    "detected_data": bench_detected_data_json,
+    "detection_store": bench_detection_store,
+    "send_progress": bench_send_progress,
+}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: dict, baseline_path: str, threshold: float) -> bool:
+    """
+    Prints current vs baseline per benchmark. Returns False if any got slower than `threshold`.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+
+    ok = True
+    print(f"\n{'benchmark':<42} {'baseline us':>12} {'current us':>12} {'ratio':>7}")
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        ratio = stats["best_us"] / baseline[name]["best_us"]
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{name:<42} {baseline[name]['best_us']:>12.2f} {stats['best_us']:>12.2f} {ratio:>6.2f}x{flag}")
+    return ok
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="*", choices=list(SUITES), help="run only these suites")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="ratio above which a benchmark counts as a regression (default 1.2)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for suite in args.only or SUITES:
+        results.update(SUITES[suite]())
+
+    for name, stats in results.items():
+        print(f"{name:<42} {stats['best_us']:>12.2f} us")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare and not compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+CPU-only stub models for benchmarks. They go through the real ModelManager
+(register_class / add_model / get_model / eviction) without torch or weights.
+"""
+import time
+import numpy as np
+from furniture_detector.model.base_model_for_registry import BaseModel
+from furniture_detector.model.detections import Detections
+from furniture_detector.model.registry import ModelManager
+
+STUB_CATEGORY = "bench"
+
+
+class StubDetector(BaseModel):
+    """
+    Returns `num_boxes` synthetic detections per image.
+    `load_seconds` / `infer_seconds` simulate load and forward-pass cost.
+    """
+
+    def __init__(self, num_boxes: int = 50, load_seconds: float = 0.0, infer_seconds: float = 0.0,
+                 memory_gb: float = 1.0, **kwargs):
+        self.num_boxes = num_boxes
+        self.load_seconds = load_seconds
+        self.infer_seconds = infer_seconds
+        self.memory_gb = memory_gb
+        self.loaded = False
+
+    def load_model(self, **kwargs):
+        if self.load_seconds:
+            time.sleep(self.load_seconds)
+        self.loaded = True
+
+    def unload_model(self):
+        self.loaded = False
+
+    def memory_footprint(self):
+        return int(self.memory_gb * 1024 ** 3)
+
+    def class_names(self) -> dict:
+        return stub_class_names()
+
+    def predict_image(self, image_path, save_path: str = None) -> Detections:
+        return self.predict_batch([image_path])[0]
+
+    def predict_batch(self, image_paths: list, save_path: str = None) -> list:
+        if self.infer_seconds:
+            time.sleep(self.infer_seconds)
+        return [synthetic_detections(self.num_boxes) for _ in image_paths]
+
+
+def synthetic_detections(n: int, num_classes: int = 20, seed: int = 0) -> Detections:
+    rng = np.random.default_rng(seed)
+    xy = rng.random((n, 2), dtype=np.float32) * 1000
+    wh = rng.random((n, 2), dtype=np.float32) * 300 + 1
+    return Detections(rng.integers(0, num_classes, n), rng.random(n, dtype=np.float32),
+                      np.concatenate([xy, xy + wh], axis=1), names=stub_class_names(num_classes))
+
+
+def stub_class_names(num_classes: int = 20) -> dict:
+    return {i: f"class{i}" for i in range(num_classes)}
+
+
+def register_stub_models(count: int = 2, prefix: str = "stub", required_gb: float = 1.0, **constructor_kwargs):
+    """
+    Registers StubDetector and `count` models named f"{prefix}{i}". Returns their names.
+    """
+    ModelManager.register_class("StubDetector", StubDetector)
+    names = []
+    for i in range(count):
+        name = f"{prefix}{i}"
+        ModelManager.add_model(name, {
+            "class": "StubDetector",
+            "required_vram": required_gb,
+            "constructor_kwargs": {"device": "cpu", "memory_gb": required_gb, **constructor_kwargs},
+            "loader_kwargs": {},
+        }, model_category=STUB_CATEGORY)
+        names.append(name)
+    return names
@@ -130,6 +130,59 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = os.getenv('MEDIA_URL', '/media/')
 MEDIA_ROOT = os.getenv('MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
 
+# Detection model used for uploads
+DETECTION_MODEL_NAME = os.getenv('DETECTION_MODEL_NAME', 'furniture_yolo')
+
+# Uploads: if UPLOAD_MAX_SIDE > 0, uploads are decoded once and stored downscaled to
+# that longest side (match the model's imgsz); the original is kept only if UPLOAD_KEEP_ORIGINAL
+UPLOAD_MAX_SIDE = int(os.getenv('UPLOAD_MAX_SIDE', 0))
+UPLOAD_KEEP_ORIGINAL = os.getenv('UPLOAD_KEEP_ORIGINAL', 'False') in ['True', 'true', '1']
+
+# Batch uploads (upload/batch/): max files per request, pictures per Celery task
+UPLOAD_BATCH_MAX_FILES = int(os.getenv('UPLOAD_BATCH_MAX_FILES', 50))
+UPLOAD_BATCH_CHUNK_SIZE = int(os.getenv('UPLOAD_BATCH_CHUNK_SIZE', 8))
+
+# Video uploads (video/): largest accepted file and the container formats accepted
+UPLOAD_VIDEO_MAX_BYTES = int(os.getenv('UPLOAD_VIDEO_MAX_BYTES', 500 * 1024 * 1024))
+UPLOAD_VIDEO_EXTENSIONS = os.getenv('UPLOAD_VIDEO_EXTENSIONS', '.mp4,.mov,.m4v,.avi,.mkv,.webm').split(',')
+
+# Video / live frame streams: frames inferred per second, decoded frames buffered
+# (older ones are dropped when inference falls behind)
+STREAM_TARGET_FPS = float(os.getenv('STREAM_TARGET_FPS', 10))
+STREAM_QUEUE_SIZE = int(os.getenv('STREAM_QUEUE_SIZE', 2))
+# live frame streams (ws/frames/) per web process, and the largest encoded frame accepted;
+# they need INFERENCE_SERVER_SOCKET, the web tier never loads models itself
+STREAM_MAX_CONNECTIONS = int(os.getenv('STREAM_MAX_CONNECTIONS', 8))
+STREAM_MAX_FRAME_BYTES = int(os.getenv('STREAM_MAX_FRAME_BYTES', 5 * 1024 * 1024))
+
+# Optional shared inference server (python manage.py run_inference_server): when set,
+# workers send images to it over this Unix socket instead of loading models themselves
+INFERENCE_SERVER_SOCKET = os.getenv('INFERENCE_SERVER_SOCKET')
+
+# Detection cache (repeat uploads of the same image skip inference)
+DETECTION_CACHE_MAX_ENTRIES = int(os.getenv('DETECTION_CACHE_MAX_ENTRIES', 1024))
+DETECTION_CACHE_TTL = int(os.getenv('DETECTION_CACHE_TTL', 3600))  # seconds
+
+# Picture dimension estimates, cached per (picture, detections version, reference)
+DIMENSION_CACHE_MAX_ENTRIES = int(os.getenv('DIMENSION_CACHE_MAX_ENTRIES', 4096))
+DIMENSION_CACHE_TTL = int(os.getenv('DIMENSION_CACHE_TTL', 3600))  # seconds
+
+# Prometheus metrics (furniture_detector/model/metrics.py), scraped from /api/metrics.
+# Set PROMETHEUS_MULTIPROC_DIR (an existing, per-host directory emptied on restart) to
+# aggregate gunicorn/uvicorn workers and Celery prefork children into one scrape.
+# Workers also serve their host's metrics on this port (0 = off)
+METRICS_WORKER_PORT = int(os.getenv('METRICS_WORKER_PORT', 0))
+
+# Profiling of single uploads (furniture_detector/profiling.py): uploads with `profile=1`,
+# plus this fraction of all uploads, run under a stack sampler and the torch profiler
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+PROFILE_TORCH = os.getenv('PROFILE_TORCH', 'True') in ['True', 'true', '1']
+
+# Progress events: at most one WebSocket send per session every PROGRESS_MIN_INTERVAL_MS
+# (events arriving in between are sent together, repeated ones coalesced)
+PROGRESS_MIN_INTERVAL_MS = float(os.getenv('PROGRESS_MIN_INTERVAL_MS', 100))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -149,6 +202,26 @@ REDIS_PORT = os.getenv('REDIS_PORT', 6379)
 CELERY_BROKER_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}/0'
 CELERY_RESULT_BACKEND = f'redis://{REDIS_HOST}:{REDIS_PORT}/0'
 
+# Model-affinity routing (furniture_detector/queues.py): inference tasks go to a queue per
+# model ("model"), per model category ("category"), or all to the default queue ("off");
+# only preloaded models get a queue, the others' tasks stay on the default queue
+MODEL_QUEUES = os.getenv('MODEL_QUEUES', 'model')
+# models whose queues a worker consumes (comma separated), default: its preloaded models;
+# a worker with neither consumes every model queue
+WORKER_MODELS = os.getenv('WORKER_MODELS')
+CELERY_TASK_ROUTES = ('furniture_detector.queues.route_task',)
+# reserve one task per pool slot, so a long inference doesn't hold queued jobs that an
+# idle worker with the same model could run
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.getenv('CELERY_WORKER_PREFETCH_MULTIPLIER', 1))
+# acknowledge tasks once they ran (redelivered if their worker dies) for every task;
+# the picture inference tasks, which can safely run twice, always do (tasks.py)
+CELERY_TASK_ACKS_LATE = os.getenv('CELERY_TASK_ACKS_LATE', 'False') in ['True', 'true', '1']
+
+# prefork children preload and warm up models before taking tasks, allow them time to do so
+CELERY_WORKER_PROC_ALIVE_TIMEOUT = float(os.getenv('CELERY_WORKER_PROC_ALIVE_TIMEOUT', 300))
+# written once the worker has warmed up its models (readiness probe), removed on shutdown
+WORKER_READY_FILE = os.getenv('WORKER_READY_FILE')
+
 
 # ASGI application
 ASGI_APPLICATION = 'backend.asgi.application'
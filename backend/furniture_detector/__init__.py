@@ -1,12 +1,20 @@
 from .model.registry import ModelManager
-from .model.yolo import YOLOModel
 
 
-# models to load
+# models to load, as import paths: torch / ultralytics are only imported
+# by processes that actually load a model
 models_dict = {
-    "YOLOModel": YOLOModel
+    "YOLOModel": "furniture_detector.model.yolo.YOLOModel",
+    "ONNXModel": "furniture_detector.model.onnx_runtime.ONNXModel",
 }
 
 
-ModelManager.load_config(class_map=models_dict)
+# the models config itself is read on first use
+ModelManager.configure(class_map=models_dict)
 
+
+def __getattr__(name):
+    if name == "YOLOModel":
+        from .model.yolo import YOLOModel
+        return YOLOModel
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,231 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from django.conf import settings
+from .model import metrics
+from .models import Picture
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _named(detections) -> bool:
+    """ False for detections stored before class names were stored with them; those are run again. """
+    return all("name" in d for d in detections)
+
+
+class BoundedLRUCache:
+    """
+    Bounded LRU cache with TTL: entries expire `ttl` seconds after being
+    stored and the least recently used ones are evicted beyond `max_entries`.
+    Subclasses call `_get`/`_put` with `_lock` held and count their lookups.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get(self, key: Tuple):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put(self, key: Tuple, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _count(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class DetectionCache(BoundedLRUCache):
+    """
+    Detections keyed by (content hash, model name, model version).
+
+    When a new version of a model is seen, every entry of the older version
+    is dropped, so changed weights never serve stale detections.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        super().__init__(max_entries, ttl)
+        self._versions: Dict[str, str] = {}
+        # models already warned about being looked up without a version
+        self._unversioned = set()
+
+    def get(self, content_hash: str, model_name: str, model_version: str):
+        with self._lock:
+            self._check_version(model_name, model_version)
+            return self._get((content_hash, model_name, model_version))
+
+    def put(self, content_hash: str, model_name: str, model_version: str, detections):
+        with self._lock:
+            self._check_version(model_name, model_version)
+            self._put((content_hash, model_name, model_version), detections)
+
+    def invalidate_model(self, model_name: str) -> int:
+        """
+        Drops every entry of `model_name`. Returns the number of dropped entries.
+        """
+        with self._lock:
+            return self._drop_model(model_name)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def _check_version(self, model_name: str, model_version: str):
+        if self._versions.get(model_name) != model_version:
+            self._drop_model(model_name)
+            self._versions[model_name] = model_version
+
+    def _drop_model(self, model_name: str) -> int:
+        stale = [key for key in self._entries if key[1] == model_name]
+        for key in stale:
+            del self._entries[key]
+        return len(stale)
+
+    @staticmethod
+    def _stored(content_hash: str, model_name: str, model_version: str):
+        return (
+            Picture.objects
+            .filter(content_hash=content_hash, model_name=model_name,
+                    model_version=model_version, detected_data__isnull=False)
+            .values_list("detected_data", flat=True)
+        )
+
+    def _unknown_version(self, model_name: str):
+        """
+        Counts a lookup without a model version (its weights can't be stat'ed in this
+        process) as a miss, and warns the first time it happens for `model_name`.
+        """
+        with self._lock:
+            warn = model_name not in self._unversioned
+            self._unversioned.add(model_name)
+            self._count(False)
+        metrics.cache_lookup("detection", False)
+        if warn:
+            logger.warning(f"No version for model {model_name}: its weights aren't readable from this "
+                           f"process, so its detections are never served from the cache")
+
+    def _found(self, content_hash: str, model_name: str, model_version: str, detections, stored=None):
+        """ Caches detections `stored` in a Picture and counts the lookup. """
+        if detections is None and stored is not None and _named(stored):
+            detections = stored
+            self.put(content_hash, model_name, model_version, detections)
+
+        with self._lock:
+            self._count(detections is not None)
+        metrics.cache_lookup("detection", detections is not None)
+        return detections
+
+    def lookup(self, content_hash: str, model_name: str, model_version: Optional[str]):
+        """
+        Returns stored detections for this image/model version or None.
+        Falls back to pictures already processed by any process (web or worker)
+        and counts the lookup as a hit or miss.
+        """
+        if not content_hash:
+            return None
+        if not model_version:
+            return self._unknown_version(model_name)
+
+        detections = self.get(content_hash, model_name, model_version)
+        stored = None
+        if detections is None:
+            stored = self._stored(content_hash, model_name, model_version).first()
+        return self._found(content_hash, model_name, model_version, detections, stored)
+
+    async def alookup(self, content_hash: str, model_name: str, model_version: Optional[str]):
+        """
+        `lookup` for async views: the memory cache is checked inline, the Picture
+        fallback goes through the async ORM.
+        """
+        if not content_hash:
+            return None
+        if not model_version:
+            return self._unknown_version(model_name)
+
+        detections = self.get(content_hash, model_name, model_version)
+        stored = None
+        if detections is None:
+            stored = await self._stored(content_hash, model_name, model_version).afirst()
+        return self._found(content_hash, model_name, model_version, detections, stored)
+
+
+class DimensionCache(BoundedLRUCache):
+    """
+    Picture dimension estimates.
+
+    Keys include the picture's model name and version, so reprocessing a
+    picture with other weights (in any process) doesn't serve stale sizes.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 3600):
+        super().__init__(max_entries, ttl)
+
+    def get_or_compute(self, key: Tuple, compute: Callable[[], Any]):
+        """
+        Returns the cached value of `key`, or caches and returns `compute()`.
+        """
+        with self._lock:
+            value = self._get(key)
+            self._count(value is not None)
+        metrics.cache_lookup("dimension", value is not None)
+        if value is not None:
+            return value
+
+        # computed outside the lock; concurrent misses of one key just compute twice
+        value = compute()
+        with self._lock:
+            self._put(key, value)
+        return value
+
+
+detection_cache = DetectionCache(
+    max_entries=settings.DETECTION_CACHE_MAX_ENTRIES,
+    ttl=settings.DETECTION_CACHE_TTL,
+)
+
+dimension_cache = DimensionCache(
+    max_entries=settings.DIMENSION_CACHE_MAX_ENTRIES,
+    ttl=settings.DIMENSION_CACHE_TTL,
+)
@@ -1,8 +1,14 @@
 import json
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 
 PROGRESS_VALUES = []
 
+# close codes of refused frame streams
+CLOSE_UNAVAILABLE = 4503
+CLOSE_TOO_MANY = 4429
+
 
 class TaskProgressConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -23,4 +29,62 @@ class TaskProgressConsumer(AsyncWebsocketConsumer):
         )
 
     async def task_progress(self, event):
-        await self.send(text_data=json.dumps(event))
\ No newline at end of file
+        await self.send(text_data=json.dumps(event))
+
+
+class FrameStreamConsumer(TaskProgressConsumer):
+    """
+    Live frame stream: the client sends encoded (JPEG) frames as binary messages
+    and receives `frame_detections` events for them on the same socket, which
+    joins progress_<session_id> like TaskProgressConsumer.
+    Decoding runs on the pipeline's own threads, never on the event loop, and
+    inference on the shared inference server: streams are refused when
+    INFERENCE_SERVER_SOCKET isn't set, so the web tier never loads a model.
+    At most STREAM_MAX_CONNECTIONS streams run per process.
+    """
+
+    # open streams of this process (consumers all run on its one event loop)
+    active = 0
+
+    async def connect(self):
+        from .streams import frame_pipeline
+
+        self.pipeline = None
+        self.counted = False
+        if not settings.INFERENCE_SERVER_SOCKET:
+            await self.refuse(CLOSE_UNAVAILABLE, "Frame streams need the inference server (INFERENCE_SERVER_SOCKET)")
+            return
+        if FrameStreamConsumer.active >= settings.STREAM_MAX_CONNECTIONS:
+            await self.refuse(CLOSE_TOO_MANY, f"Too many frame streams (max {settings.STREAM_MAX_CONNECTIONS})")
+            return
+
+        FrameStreamConsumer.active += 1
+        self.counted = True
+        await super().connect()
+        self.pipeline = await sync_to_async(frame_pipeline, thread_sensitive=False)(self.session_id)
+        self.pipeline.start_push()
+
+    async def refuse(self, code: int, error: str):
+        # accepted first, so the client gets the reason and not just a failed handshake
+        await self.accept()
+        await self.send(text_data=json.dumps({"type": "stream_error", "error": error}))
+        await self.close(code=code)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if not bytes_data or self.pipeline is None:
+            return
+        if len(bytes_data) > settings.STREAM_MAX_FRAME_BYTES:
+            await self.send(text_data=json.dumps({
+                "type": "stream_error", "error": f"Frame dropped: larger than {settings.STREAM_MAX_FRAME_BYTES} bytes",
+            }))
+            return
+        self.pipeline.push_encoded(bytes_data)
+
+    async def disconnect(self, close_code):
+        if not getattr(self, "counted", False):
+            # refused in connect, never joined the group
+            return
+        FrameStreamConsumer.active -= 1
+        if self.pipeline is not None:
+            await sync_to_async(self.pipeline.stop, thread_sensitive=False)()
+        await super().disconnect(close_code)
@@ -0,0 +1,85 @@
+"""
+Real-world sizes of every detection of a picture from one reference object of
+known size, in one numpy pass over the picture's boxes.
+
+All boxes share the reference's scale (real units per pixel), so sizes are
+only meaningful for objects at a similar distance from the camera.
+"""
+from typing import Any, Dict, Union
+import numpy as np
+from .model.detections import Detections
+
+AXES = ("width", "height", "longest")
+
+
+def reference_index(detections: Detections, class_names: Dict[int, str],
+                    index: int = None, reference_class: Union[int, str] = None) -> int:
+    """
+    The detection used as reference: `index` into the picture's detections, or the
+    most confident detection of `reference_class` (class id or name).
+    """
+    if not len(detections):
+        raise ValueError("The picture has no detections")
+    if index is not None:
+        if not 0 <= index < len(detections):
+            raise ValueError(f"reference_index must be between 0 and {len(detections) - 1}")
+        return index
+
+    if isinstance(reference_class, str) and not reference_class.lstrip("-").isdigit():
+        class_ids = [class_id for class_id, name in class_names.items() if name == reference_class]
+        if not class_ids:
+            raise ValueError(f"Unknown class: {reference_class}")
+        mask = np.isin(detections.class_ids, class_ids)
+    else:
+        mask = detections.class_ids == int(reference_class)
+
+    candidates = np.flatnonzero(mask)
+    if not len(candidates):
+        raise ValueError(f"No detection of class {reference_class} in this picture")
+    return int(candidates[detections.confidences[candidates].argmax()])
+
+
+def estimate_dimensions(detections: Detections, class_names: Dict[int, str], index: int,
+                        reference_length: float, axis: str = "width") -> Dict[str, Any]:
+    """
+    Width / height of every detection in the units of `reference_length`, the
+    real size of detection `index` along `axis` (width, height or its longest side).
+    """
+    if axis not in AXES:
+        raise ValueError(f"reference_axis must be one of {AXES}")
+
+    boxes = detections.boxes
+    sizes = np.stack([boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]], axis=1)
+
+    reference_px = float(sizes[index].max() if axis == "longest" else sizes[index, AXES.index(axis)])
+    if reference_px <= 0:
+        raise ValueError("The reference detection has an empty box")
+    scale = reference_length / reference_px
+    real = np.round(sizes * scale, 2)
+
+    class_ids = detections.class_ids.tolist()
+    return {
+        "reference": {
+            "index": index,
+            "class_id": class_ids[index],
+            "name": class_names[class_ids[index]],
+            "axis": axis,
+            "length": reference_length,
+            "pixels": round(reference_px, 2),
+        },
+        "scale_factor": scale,
+        "detections": [
+            {
+                "index": i,
+                "class_id": class_id,
+                "name": class_names[class_id],
+                "confidence": confidence,
+                "bbox": bbox,
+                "width": width,
+                "height": height,
+            }
+            for i, (class_id, confidence, bbox, (width, height)) in enumerate(zip(
+                class_ids, detections.confidences.tolist(), boxes.tolist(), real.tolist()
+            ))
+        ],
+    }
@@ -0,0 +1,99 @@
+import json
+import os
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from furniture_detector.model import ops
+from furniture_detector.model.evaluation import average_precision, mean_matched_iou
+from furniture_detector.model.registry import ModelManager
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare model variants (e.g. fp32 / fp16 / int8 entries of the models YAML) on a local "
+        "image folder: latency, memory, and detection agreement with a reference model."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("models", nargs="+", help="model names from the models YAML")
+        parser.add_argument("--images", required=True, help="folder of images to run on")
+        parser.add_argument("--reference", help="model treated as ground truth (default: first model)")
+        parser.add_argument("--limit", type=int, default=100, help="max number of images")
+        parser.add_argument("--iou", type=float, default=0.5, help="IoU threshold for mAP")
+        parser.add_argument("--warmup", type=int, default=2, help="warmup images per model")
+        parser.add_argument("--json", action="store_true", help="print the report as JSON")
+
+    def handle(self, *args, **options):
+        folder = options["images"]
+        if not os.path.isdir(folder):
+            raise CommandError(f"No folder at path: {folder}")
+        images = ops.list_images(folder)[:options["limit"]]
+        if not images:
+            raise CommandError(f"No images in {folder}")
+
+        model_names = options["models"]
+        reference = options["reference"] or model_names[0]
+        if reference not in model_names:
+            model_names = [reference, *model_names]
+
+        runs = {}
+        for model_name in model_names:
+            runs[model_name] = self._run_model(model_name, images, options["warmup"])
+
+        report = []
+        ref_detections = runs[reference]["detections"]
+        for model_name in model_names:
+            run = runs[model_name]
+            detections = run["detections"]
+            report.append({
+                "model": model_name,
+                "precision": ModelManager.get_model_info(model_name).get("precision", "fp32"),
+                "latency_ms_mean": statistics.mean(run["latencies"]) * 1000,
+                "latency_ms_p50": statistics.median(run["latencies"]) * 1000,
+                "latency_ms_p95": _percentile(run["latencies"], 95) * 1000,
+                "memory_gb": run["memory_gb"],
+                "mean_iou": statistics.mean(mean_matched_iou(p, r) for p, r in zip(detections, ref_detections)),
+                "map": average_precision(detections, ref_detections, iou_threshold=options["iou"]),
+                "boxes": sum(len(d) for d in detections),
+            })
+
+        if options["json"]:
+            self.stdout.write(json.dumps({"reference": reference, "images": len(images), "models": report}, indent=2))
+            return
+
+        self.stdout.write(f"{len(images)} images, reference: {reference}, mAP@{options['iou']}")
+        self.stdout.write(f"{'model':<24} {'precision':>9} {'mean ms':>9} {'p95 ms':>9} "
+                          f"{'memory GB':>10} {'mean IoU':>9} {'mAP':>7} {'boxes':>7}")
+        for row in report:
+            self.stdout.write(
+                f"{row['model']:<24} {row['precision']:>9} {row['latency_ms_mean']:>9.1f} "
+                f"{row['latency_ms_p95']:>9.1f} {row['memory_gb']:>10.3f} {row['mean_iou']:>9.3f} "
+                f"{row['map']:>7.3f} {row['boxes']:>7}"
+            )
+
+    def _run_model(self, model_name, images, warmup):
+        # measure every variant from a cold start, alone in memory
+        for resident in list(ModelManager.residency_report()["models"]):
+            ModelManager.unload_model(resident["name"])
+
+        with ModelManager.lease(model_name) as model:
+            memory_gb = next(
+                m["memory_gb"] for m in ModelManager.residency_report()["models"] if m["name"] == model_name
+            )
+            for path in images[:warmup]:
+                model.predict_image(path)
+
+            latencies, detections = [], []
+            for path in images:
+                start = time.perf_counter()
+                detections.append(model.predict_image(path))
+                latencies.append(time.perf_counter() - start)
+
+        ModelManager.unload_model(model_name)
+        return {"latencies": latencies, "detections": detections, "memory_gb": memory_gb}
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
@@ -0,0 +1,39 @@
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from furniture_detector.model.inference_server import DEFAULT_SOCKET_PATH, InferenceServer
+from furniture_detector.model.registry import ModelManager
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the local inference server: one process owning the models, serving Celery "
+        "workers and the web tier over a Unix socket (set INFERENCE_SERVER_SOCKET on clients)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", default=settings.INFERENCE_SERVER_SOCKET or DEFAULT_SOCKET_PATH,
+                            help="Unix socket path to listen on")
+        parser.add_argument("--preload", nargs="*",
+                            help="models to load and warm up before serving (default: the configured preload list)")
+
+    def handle(self, *args, **options):
+        preload = options["preload"] if options["preload"] is not None else ModelManager.preload_list()
+        if preload:
+            timings = ModelManager.preload(preload, warmup=True)
+            self.stdout.write(f"Preloaded {', '.join(timings)}")
+
+        server = InferenceServer(options["socket"])
+
+        def stop(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, stop)
+        self.stdout.write(f"Inference server listening on {options['socket']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write("Inference server stopped")
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('furniture_detector', '0004_picture_detected_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='picture',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='picture',
+            name='model_name',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='picture',
+            name='model_version',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('furniture_detector', '0005_picture_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='picture',
+            name='original_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='picture',
+            name='original_path',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='picture',
+            name='original_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='picture',
+            name='scale_factor',
+            field=models.FloatField(default=1.0),
+        ),
+    ]
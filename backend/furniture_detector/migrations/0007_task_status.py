@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('furniture_detector', '0006_picture_scale_factor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='status',
+            field=models.CharField(default='queued', max_length=32),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('furniture_detector', '0007_task_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='furniture',
+            name='class_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='furniture',
+            name='confidence',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='furniture',
+            name='x1',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='furniture',
+            name='x2',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='furniture',
+            name='y1',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='furniture',
+            name='y2',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='picture',
+            name='task',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pictures', to='furniture_detector.task'),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='session_id',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='furniture',
+            index=models.Index(fields=['task', 'name', 'confidence'], name='furniture_task_name_conf'),
+        ),
+        migrations.AddIndex(
+            model_name='furniture',
+            index=models.Index(fields=['task', 'confidence'], name='furniture_task_conf'),
+        ),
+        migrations.AddIndex(
+            model_name='furniture',
+            index=models.Index(fields=['picture', 'confidence'], name='furniture_picture_conf'),
+        ),
+    ]
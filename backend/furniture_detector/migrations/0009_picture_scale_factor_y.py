@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:51
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_scale_factor(apps, schema_editor):
+    # pictures stored before had one factor for both axes
+    Picture = apps.get_model('furniture_detector', 'Picture')
+    Picture.objects.update(scale_factor_y=F('scale_factor'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('furniture_detector', '0008_furniture_detections'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='picture',
+            name='scale_factor_y',
+            field=models.FloatField(default=1.0),
+        ),
+        migrations.RunPython(copy_scale_factor, migrations.RunPython.noop),
+    ]
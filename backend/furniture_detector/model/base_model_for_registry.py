@@ -19,3 +19,23 @@ class BaseModel(ABC):
         Free VRAM / GPU memory / resources used by the model.
         """
         pass
+
+    def memory_footprint(self):
+        """
+        Optional: bytes held by the loaded weights, or None if unknown.
+        Used by ModelManager when the measured memory growth is unreliable.
+        """
+        return None
+
+    def warmup(self, **kwargs):
+        """
+        Optional: run dummy inferences so the first real request doesn't pay
+        for lazy initialization (kernel selection, allocator growth, ...).
+        """
+        pass
+
+    def class_names(self) -> dict:
+        """
+        Optional: {class_id: name} of the loaded model, empty if unknown.
+        """
+        return {}
@@ -0,0 +1,180 @@
+from concurrent.futures import Future, TimeoutError
+from queue import Queue, Empty
+from typing import Dict, Tuple
+from dotenv import load_dotenv
+from .registry import ModelManager
+from . import ops
+import threading
+import logging
+import time
+import os
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# max time the first image of a batch waits for more images to arrive
+DEFAULT_MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', 5))
+# 0 means "use the model's loader_kwargs.batch_size"
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 0))
+# max seconds `predict_image` waits for its detections (model load included), 0 = no limit
+DEFAULT_TIMEOUT = float(os.getenv('INFERENCE_TIMEOUT', 300))
+
+# whether tasks of this process run concurrently, so that their images can share a batch;
+# cleared at worker startup for pools that run one task per process at a time
+_concurrent_tasks = True
+
+
+def set_concurrent_tasks(concurrent: bool):
+    global _concurrent_tasks
+    _concurrent_tasks = concurrent
+
+
+def use_batcher() -> bool:
+    """
+    False in prefork / solo / single-thread workers: every batch would hold one
+    image and only add the max wait to it, so tasks run the model directly.
+    """
+    return _concurrent_tasks
+
+
+class MicroBatcher:
+    """
+    Worker-side batching stage for a single model.
+
+    Images submitted from concurrent tasks are queued and run as one batched
+    forward pass once `max_batch_size` images are pending or the first one
+    has waited `max_wait_ms`. Each caller gets a Future with its own detections.
+    """
+
+    def __init__(self, model_name: str, model_category: str = None,
+                 max_batch_size: int = 16, max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        self.model_name = model_name
+        self.model_category = model_category
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue: Queue = Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, image_path) -> Future:
+        """
+        Queue an image (path or BGR array) for inference. The returned Future resolves to its detections.
+        Paths are decoded on the calling thread, so concurrent callers decode while
+        the current batch runs instead of serially inside the next forward pass.
+        """
+        image = ops.load_image(image_path)
+        future = Future()
+        self._ensure_running()
+        self._queue.put((image, future))
+        return future
+
+    def predict_image(self, image_path, timeout: float = None):
+        """
+        Blocking helper with the same result as `model.predict_image`.
+        Raises TimeoutError after `timeout` seconds (default INFERENCE_TIMEOUT); an
+        image still queued by then is dropped from its batch.
+        """
+        if timeout is None:
+            timeout = DEFAULT_TIMEOUT or None
+        future = self.submit(image_path)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"No detections from {self.model_name} after {timeout}s") from None
+
+    def predict_batch(self, images: list, timeout: float = None) -> list:
+        """
+        `predict_image` for several images: all are queued at once, so they share
+        forward passes with each other (and with concurrent callers).
+        """
+        if timeout is None:
+            timeout = DEFAULT_TIMEOUT or None
+        futures = [self.submit(image) for image in images]
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            return [future.result(timeout=max(0.0, deadline - time.monotonic()) if deadline else None)
+                    for future in futures]
+        except TimeoutError:
+            for future in futures:
+                future.cancel()
+            raise TimeoutError(f"No detections from {self.model_name} after {timeout}s") from None
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f"batcher-{self.model_name}", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                # the thread must survive and no caller may be left waiting
+                logger.exception(f"Batch on {self.model_name} failed")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _run_batch(self, batch: list):
+        # callers that timed out (cancelled futures) are dropped, the others can't be cancelled anymore
+        batch = [(image, future) for image, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        images = [image for image, _ in batch]
+        try:
+            with ModelManager.lease(model_name=self.model_name, model_category=self.model_category) as model:
+                start = time.perf_counter()
+                results = list(model.predict_batch(images))
+            logger.debug(f"Ran batch of {len(images)} on {self.model_name} in {time.perf_counter() - start:.3f}s")
+            if len(results) != len(batch):
+                raise RuntimeError(f"{self.model_name} returned {len(results)} results for a batch of {len(batch)}")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), detections in zip(batch, results):
+            future.set_result(detections)
+
+
+_batchers: Dict[Tuple[str, str], MicroBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(model_name: str, model_category: str = None) -> MicroBatcher:
+    """
+    Returns the process-wide batcher for a model, creating it on first use.
+    Batch size defaults to the model's `loader_kwargs.batch_size` times its `replicas`.
+    """
+    key = (model_name, model_category)
+    with _batchers_lock:
+        if key not in _batchers:
+            max_batch_size = DEFAULT_MAX_BATCH_SIZE
+            if not max_batch_size:
+                model_info = ModelManager.get_model_info(model_name, model_category)
+                max_batch_size = model_info.get('loader_kwargs', {}).get('batch_size', 1)
+                # replica pools split a batch across replicas: fill all of them
+                max_batch_size *= int(model_info.get('replicas', 1))
+            _batchers[key] = MicroBatcher(model_name, model_category, max_batch_size=max_batch_size)
+        return _batchers[key]
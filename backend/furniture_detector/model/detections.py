@@ -0,0 +1,118 @@
+from typing import Dict, List
+import numpy as np
+
+
+class Detections:
+    """
+    Columnar detection results for one image.
+
+    class_ids:   (N,) int32
+    confidences: (N,) float32
+    boxes:       (N, 4) float32, [x1, y1, x2, y2] in image pixels
+    names:       {class_id: name} of the model that produced them, or None (see `with_names`)
+
+    Use `to_dicts()` only where JSON output is needed.
+    """
+
+    __slots__ = ("class_ids", "confidences", "boxes", "names")
+
+    def __init__(self, class_ids, confidences, boxes, names: Dict[int, str] = None):
+        self.class_ids = np.asarray(class_ids, dtype=np.int32).reshape(-1)
+        self.confidences = np.asarray(confidences, dtype=np.float32).reshape(-1)
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.names = names
+
+    @classmethod
+    def empty(cls) -> "Detections":
+        return cls(np.empty(0), np.empty(0), np.empty((0, 4)))
+
+    @classmethod
+    def from_boxes(cls, boxes) -> "Detections":
+        """
+        Build from an ultralytics `Boxes` object with a single device-to-host copy.
+        `boxes.data` rows are [x1, y1, x2, y2, (track_id,) conf, cls].
+        """
+        if boxes is None or len(boxes) == 0:
+            return cls.empty()
+        data = boxes.data.cpu().numpy()
+        return cls(data[:, -1], data[:, -2], data[:, :4])
+
+    @classmethod
+    def from_dicts(cls, detections: List[Dict]) -> "Detections":
+        """
+        Inverse of `to_dicts`, e.g. for `Picture.detected_data`.
+        """
+        if not detections:
+            return cls.empty()
+        names = {d["class_id"]: d["name"] for d in detections if "name" in d}
+        return cls(
+            [d["class_id"] for d in detections],
+            [d["confidence"] for d in detections],
+            [d["bbox"] for d in detections],
+            names=names or None,
+        )
+
+    @classmethod
+    def concat(cls, items: List["Detections"]) -> "Detections":
+        named = [d.names for d in items if d.names is not None]
+        names = {k: v for d in named for k, v in d.items()} if named else None
+        items = [d for d in items if len(d)]
+        if not items:
+            return cls(np.empty(0), np.empty(0), np.empty((0, 4)), names=names)
+        return cls(
+            np.concatenate([d.class_ids for d in items]),
+            np.concatenate([d.confidences for d in items]),
+            np.concatenate([d.boxes for d in items]),
+            names=names,
+        )
+
+    def __len__(self) -> int:
+        return len(self.class_ids)
+
+    def __repr__(self) -> str:
+        return f"Detections(n={len(self)})"
+
+    def take(self, indices) -> "Detections":
+        """ Subset of detections, e.g. the indices kept by `ops.nms`. """
+        return Detections(self.class_ids[indices], self.confidences[indices], self.boxes[indices], self.names)
+
+    def shifted(self, dx: float, dy: float) -> "Detections":
+        """
+        Boxes translated by (dx, dy), e.g. from tile to full-image coordinates.
+        """
+        return Detections(self.class_ids, self.confidences, self.boxes + np.float32([dx, dy, dx, dy]), self.names)
+
+    def scaled(self, factor: float, factor_y: float = None) -> "Detections":
+        """
+        Boxes multiplied by `factor` (x coordinates by `factor`, y by `factor_y` if given),
+        e.g. to map a downscaled image back to the original.
+        """
+        fy = factor if factor_y is None else factor_y
+        return Detections(self.class_ids, self.confidences, self.boxes * np.float32([factor, fy, factor, fy]),
+                          self.names)
+
+    def with_names(self, names: Dict[int, str]) -> "Detections":
+        """
+        The same detections labelled with the model's {class_id: name}.
+        Raises ValueError if a detected class has no name.
+        """
+        missing = sorted(set(self.class_ids.tolist()) - set(names))
+        if missing:
+            raise ValueError(f"No class name for class ids {missing}")
+        return Detections(self.class_ids, self.confidences, self.boxes, dict(names))
+
+    def to_dicts(self) -> List[Dict]:
+        """
+        JSON-ready view: [{"class_id", "confidence", "bbox": [x1, y1, x2, y2]}, ...],
+        plus "name" when the detections carry names.
+        """
+        rows = [
+            {"class_id": class_id, "confidence": confidence, "bbox": bbox}
+            for class_id, confidence, bbox in zip(
+                self.class_ids.tolist(), self.confidences.tolist(), self.boxes.tolist()
+            )
+        ]
+        if self.names is not None:
+            for row in rows:
+                row["name"] = self.names[row["class_id"]]
+        return rows
@@ -0,0 +1,80 @@
+"""
+Agreement metrics between two detectors, treating one as the reference
+(e.g. a reduced-precision variant against its full-precision model).
+"""
+from typing import List
+import numpy as np
+from .detections import Detections
+from .ops import box_iou
+
+
+def mean_matched_iou(pred: Detections, ref: Detections) -> float:
+    """
+    Mean over reference boxes of the best IoU with a predicted box of the same class
+    (0 for reference boxes nothing matches). 1.0 when both are empty.
+    """
+    if len(ref) == 0:
+        return 1.0 if len(pred) == 0 else 0.0
+    if len(pred) == 0:
+        return 0.0
+
+    iou = box_iou(ref.boxes, pred.boxes)
+    iou[ref.class_ids[:, None] != pred.class_ids[None, :]] = 0.0
+    return float(iou.max(axis=1).mean())
+
+
+def average_precision(preds: List[Detections], refs: List[Detections], iou_threshold: float = 0.5) -> float:
+    """
+    mAP@iou_threshold of `preds` against `refs` used as ground truth, averaged over
+    the classes present in `refs`. Returns 1.0 if `refs` holds no boxes and `preds` is empty too.
+    """
+    classes = np.unique(np.concatenate([r.class_ids for r in refs])) if refs else np.empty(0)
+    if classes.size == 0:
+        return 1.0 if all(len(p) == 0 for p in preds) else 0.0
+
+    aps = []
+    for cls in classes:
+        num_refs = 0
+        ref_boxes, matched = [], []
+        for ref in refs:
+            boxes = ref.boxes[ref.class_ids == cls]
+            ref_boxes.append(boxes)
+            matched.append(np.zeros(len(boxes), dtype=bool))
+            num_refs += len(boxes)
+
+        # (confidence, image index, box) for every prediction of this class
+        scored = []
+        for image_idx, pred in enumerate(preds):
+            mask = pred.class_ids == cls
+            for conf, box in zip(pred.confidences[mask], pred.boxes[mask]):
+                scored.append((conf, image_idx, box))
+        scored.sort(key=lambda item: -item[0])
+
+        tp = np.zeros(len(scored))
+        for i, (_, image_idx, box) in enumerate(scored):
+            boxes = ref_boxes[image_idx]
+            if len(boxes) == 0:
+                continue
+            iou = box_iou(box[None, :], boxes)[0]
+            iou[matched[image_idx]] = 0.0
+            best = int(iou.argmax())
+            if iou[best] >= iou_threshold:
+                matched[image_idx][best] = True
+                tp[i] = 1
+
+        if not scored:
+            aps.append(0.0)
+            continue
+
+        tp_cum = np.cumsum(tp)
+        recall = tp_cum / num_refs
+        precision = tp_cum / np.arange(1, len(tp) + 1)
+
+        # area under the precision envelope (VOC all-point interpolation)
+        recall = np.concatenate([[0.0], recall, [1.0]])
+        precision = np.concatenate([[1.0], precision, [0.0]])
+        precision = np.maximum.accumulate(precision[::-1])[::-1]
+        steps = np.where(recall[1:] != recall[:-1])[0]
+        aps.append(float(np.sum((recall[steps + 1] - recall[steps]) * precision[steps + 1])))
+
+    return float(np.mean(aps))
@@ -0,0 +1,327 @@
+"""
+Local inference server shared by every process on a node.
+
+One server process owns the models (through ModelManager) and serves
+Celery workers and the web tier over a Unix socket, so N worker processes
+no longer mean N copies of the same weights. Concurrent requests for the
+same model are micro-batched (see `batching.MicroBatcher`).
+
+Wire protocol: 4-byte big-endian length + JSON, one request / response at a
+time per connection. Image pixels never go through the socket: the client
+copies them into a shared memory segment it owns and reuses, and sends only
+its name, shape and dtype.
+
+Run with:
+    python manage.py run_inference_server --socket /tmp/fengshui-inference.sock
+and point workers at it with INFERENCE_SERVER_SOCKET.
+"""
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict
+from dotenv import load_dotenv
+import atexit
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+import numpy as np
+from .batching import get_batcher
+from .detections import Detections
+from .registry import ModelManager
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = os.getenv('INFERENCE_SERVER_SOCKET', '/tmp/fengshui-inference.sock')
+
+_HEADER = struct.Struct(">I")
+
+
+def _send(sock: socket.socket, message: Dict[str, Any]):
+    payload = json.dumps(message).encode()
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("Inference server connection closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _recv(sock: socket.socket) -> Dict[str, Any]:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, size))
+
+
+# segments created by clients of this process, tracked (and unlinked) by them
+_own_segments = set()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Attaches to a segment owned by a client. Its lifetime is the client's business,
+    so keep this process' resource tracker from unlinking it on exit.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    if name in _own_segments:
+        return shm
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+# -----------------------
+# Server
+# -----------------------
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        # client segments attached by this connection, by name
+        self.segments: Dict[str, shared_memory.SharedMemory] = {}
+
+    def handle(self):
+        while True:
+            try:
+                request = _recv(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                response = self.server.dispatch(request, self.segments)
+            except Exception as e:
+                logger.exception("Inference request failed")
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            try:
+                _send(self.request, response)
+            except OSError:
+                # the client gave up on this request (timeout) and closed the connection
+                return
+
+    def finish(self):
+        for shm in self.segments.values():
+            shm.close()
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _RequestHandler)
+        os.chmod(socket_path, 0o660)
+        self.socket_path = socket_path
+
+    def dispatch(self, request: Dict[str, Any], segments: Dict[str, shared_memory.SharedMemory]):
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid()}
+        if op == "stats":
+            return {"ok": True, "residency": ModelManager.residency_report()}
+        if op == "predict":
+            return self._predict(request, segments)
+        if op == "predict_batch":
+            return self._predict_batch(request, segments)
+        raise ValueError(f"Unknown op: {op}")
+
+    @staticmethod
+    def _segment(name: str, segments: Dict[str, shared_memory.SharedMemory]) -> shared_memory.SharedMemory:
+        shm = segments.get(name)
+        if shm is None:
+            # the client grew its buffer: drop the old attachment
+            for old in segments.values():
+                old.close()
+            segments.clear()
+            shm = segments[name] = _attach(name)
+        return shm
+
+    @staticmethod
+    def _image(shm: shared_memory.SharedMemory, spec: Dict[str, Any]) -> np.ndarray:
+        # copied out before queueing: the client may write its next image into the segment
+        # (or the segment may be closed) while this one still waits for a batch
+        view = np.ndarray(tuple(spec["shape"]), dtype=np.dtype(spec["dtype"]), buffer=shm.buf,
+                          offset=spec.get("offset", 0))
+        return np.array(view, copy=True)
+
+    @staticmethod
+    def _result(model_name: str, detections: Detections) -> Dict[str, Any]:
+        names = ModelManager.get_class_names(model_name)
+        class_ids = detections.class_ids.tolist()
+        return {
+            "class_ids": class_ids,
+            "confidences": detections.confidences.tolist(),
+            "boxes": detections.boxes.tolist(),
+            # the client can't resolve names without the model, send them along
+            "names": [names.get(class_id) for class_id in class_ids],
+        }
+
+    def _predict(self, request, segments):
+        image = self._image(self._segment(request["shm"], segments), request)
+        batcher = get_batcher(request["model"], request.get("category"))
+        detections = batcher.predict_image(image)
+        return {"ok": True, **self._result(request["model"], detections)}
+
+    def _predict_batch(self, request, segments):
+        shm = self._segment(request["shm"], segments)
+        images = [self._image(shm, spec) for spec in request["images"]]
+        batcher = get_batcher(request["model"], request.get("category"))
+        results = batcher.predict_batch(images)
+        return {"ok": True, "results": [self._result(request["model"], detections) for detections in results]}
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+# -----------------------
+# Client
+# -----------------------
+class InferenceClient:
+    """
+    Connection to an InferenceServer. Not thread-safe: use `get_client()` for
+    one client per thread.
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, timeout: float = 300):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock = None
+        self._shm = None
+
+    def _connect(self) -> socket.socket:
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._sock = sock
+        return self._sock
+
+    def _call(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        sock = self._connect()
+        try:
+            _send(sock, request)
+            response = _recv(sock)
+        except (ConnectionError, OSError):
+            # e.g. a timeout: the server may still be working on this request, so
+            # neither the connection nor the segment it may still read are reused
+            self.close_connection()
+            if "shm" in request:
+                self._release_buffer()
+            raise
+        if not response.get("ok"):
+            raise RuntimeError(f"Inference server error: {response.get('error')}")
+        return response
+
+    def _buffer(self, nbytes: int) -> shared_memory.SharedMemory:
+        if self._shm is None or self._shm.size < nbytes:
+            self._release_buffer()
+            self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            _own_segments.add(self._shm.name)
+        return self._shm
+
+    def predict_image(self, image, model_name: str, model_category: str = None) -> Detections:
+        """
+        Runs `model_name` on an image path or BGR array on the server.
+        Paths are decoded here, so decoding is spread over the clients.
+        """
+        from .ops import load_image
+
+        image = np.ascontiguousarray(load_image(image))
+        shm = self._buffer(image.nbytes)
+        np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[...] = image
+
+        response = self._call({
+            "op": "predict", "model": model_name, "category": model_category,
+            "shm": shm.name, "shape": list(image.shape), "dtype": image.dtype.str,
+        })
+        return self._detections(response)
+
+    def predict_batch(self, images: list, model_name: str, model_category: str = None) -> list:
+        """
+        `predict_image` for several images in one request: they are queued on the
+        server together, so they share forward passes. Fails as a whole.
+        """
+        from .ops import load_image
+
+        images = [np.ascontiguousarray(load_image(image)) for image in images]
+        if not images:
+            return []
+        shm = self._buffer(sum(image.nbytes for image in images))
+        specs, offset = [], 0
+        for image in images:
+            np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf, offset=offset)[...] = image
+            specs.append({"offset": offset, "shape": list(image.shape), "dtype": image.dtype.str})
+            offset += image.nbytes
+
+        response = self._call({
+            "op": "predict_batch", "model": model_name, "category": model_category,
+            "shm": shm.name, "images": specs,
+        })
+        return [self._detections(result) for result in response["results"]]
+
+    @staticmethod
+    def _detections(result: Dict[str, Any]) -> Detections:
+        names = result.get("names")
+        if names is None or None in names:
+            names = None
+        else:
+            names = dict(zip(result["class_ids"], names))
+        return Detections(result["class_ids"], result["confidences"], result["boxes"], names=names)
+
+    def ping(self) -> Dict[str, Any]:
+        return self._call({"op": "ping"})
+
+    def stats(self) -> Dict[str, Any]:
+        return self._call({"op": "stats"})["residency"]
+
+    def close_connection(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _release_buffer(self):
+        if self._shm is not None:
+            _own_segments.discard(self._shm.name)
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def close(self):
+        self.close_connection()
+        self._release_buffer()
+
+
+_local = threading.local()
+_all_clients = []
+_all_clients_lock = threading.Lock()
+
+
+@atexit.register
+def _close_clients():
+    # unlink every thread's shared memory segment
+    with _all_clients_lock:
+        for client in _all_clients:
+            client.close()
+        _all_clients.clear()
+
+
+def get_client(socket_path: str = DEFAULT_SOCKET_PATH) -> InferenceClient:
+    """
+    Returns this thread's client for `socket_path`.
+    """
+    clients = getattr(_local, "clients", None)
+    if clients is None:
+        clients = _local.clients = {}
+    if socket_path not in clients:
+        clients[socket_path] = InferenceClient(socket_path)
+        with _all_clients_lock:
+            _all_clients.append(clients[socket_path])
+    return clients[socket_path]
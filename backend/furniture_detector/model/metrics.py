@@ -0,0 +1,115 @@
+"""
+Prometheus metrics of the upload -> inference -> results pipeline.
+
+    fengshui_stage_seconds{stage}                  histogram, one series per stage:
+        upload_write    upload written (and downscaled) to MEDIA_ROOT
+        queue_wait      upload -> Celery task start
+        model_acquire   task start -> model leased (includes model_load on a cold start)
+        model_load      ModelManager loading a model
+        inference       forward pass (including micro-batching wait)
+        postprocess     detections mapped to original coordinates and serialized
+        db_save         Picture / Furniture rows written
+        ws_publish      one progress event sent to the channel layer
+    fengshui_model_loads_total{model}              counter
+    fengshui_model_unloads_total{model, reason}    counter, reason: evict, unload, deferred_unload
+    fengshui_cache_lookups_total{cache, result}    counter, result: hit or miss
+    fengshui_resident_models                       gauge
+    fengshui_model_memory_bytes{model, device}     gauge, measured at load
+
+With PROMETHEUS_MULTIPROC_DIR set (required with gunicorn / uvicorn workers and
+Celery prefork), every process writes its values to files in that directory
+and `render` aggregates all of them, so one scrape of the web tier's /metrics
+(or of a worker's METRICS_WORKER_PORT) covers every process of the host.
+The directory must exist and should be emptied when the host's services restart.
+Without it, metrics are per process.
+
+Recording a value is a lock + float update (an mmap write in multiprocess mode),
+cheap enough to leave on.
+"""
+from contextlib import contextmanager
+from typing import Tuple
+from dotenv import load_dotenv
+import os
+import time
+
+# prometheus_client reads PROMETHEUS_MULTIPROC_DIR when metrics are created
+load_dotenv()
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    "fengshui_stage_seconds", "Wall time of one pipeline stage", ["stage"], buckets=STAGE_BUCKETS,
+)
+MODEL_LOADS = Counter("fengshui_model_loads_total", "Models loaded", ["model"])
+MODEL_UNLOADS = Counter("fengshui_model_unloads_total", "Models unloaded, by reason", ["model", "reason"])
+CACHE_LOOKUPS = Counter("fengshui_cache_lookups_total", "Cache lookups", ["cache", "result"])
+RESIDENT_MODELS = Gauge("fengshui_resident_models", "Models currently loaded", multiprocess_mode="livesum")
+MODEL_MEMORY = Gauge(
+    "fengshui_model_memory_bytes", "Measured memory of loaded models", ["model", "device"],
+    multiprocess_mode="livesum",
+)
+
+
+def observe(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    """ Records the wall time of the block as `stage`, also when it raises. """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def cache_lookup(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def model_loaded(model_name: str, device: str, memory_gb: float):
+    MODEL_LOADS.labels(model_name).inc()
+    RESIDENT_MODELS.inc()
+    MODEL_MEMORY.labels(model_name, device).set(memory_gb * 1024 ** 3)
+
+
+def model_unloaded(model_name: str, device: str, reason: str):
+    MODEL_UNLOADS.labels(model_name, reason).inc()
+    RESIDENT_MODELS.dec()
+    MODEL_MEMORY.labels(model_name, device).set(0)
+
+
+def multiprocess_enabled() -> bool:
+    return bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def registry():
+    """ Registry to expose: every process of the host in multiprocess mode, else this process. """
+    if not multiprocess_enabled():
+        return REGISTRY
+    aggregated = CollectorRegistry()
+    multiprocess.MultiProcessCollector(aggregated)
+    return aggregated
+
+
+def render() -> Tuple[bytes, str]:
+    """ (body, content type) of a scrape in the Prometheus text format. """
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+
+def start_server(port: int, addr: str = "0.0.0.0"):
+    """ Serves `render()` on http://addr:port/metrics from a daemon thread. """
+    from prometheus_client import start_http_server
+
+    start_http_server(port, addr=addr, registry=registry())
+
+
+def mark_process_dead(pid: int = None):
+    """ Drops the live gauges of an exited process (multiprocess mode). """
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(pid or os.getpid())
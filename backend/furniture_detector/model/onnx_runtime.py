@@ -0,0 +1,266 @@
+from contextlib import contextmanager
+import ast
+import os
+import shutil
+import tempfile
+import uuid
+import numpy as np
+from .base_model_for_registry import BaseModel
+from .detections import Detections
+from .prefetch import DEFAULT_DEPTH, DEFAULT_WORKERS, Prefetcher
+from . import ops
+
+PRECISIONS = ("fp32", "fp16", "int8")
+
+
+@contextmanager
+def _replaced_atomically(path: str):
+    """
+    Yields a temporary path next to `path` and moves it into place once the block
+    succeeds, so concurrent loaders never read a partly written graph.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex}.tmp.onnx")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ONNXModel(BaseModel):
+    """
+    YOLOv8 detector running an exported ONNX graph on ONNX Runtime (CPU by default).
+    Compatible with ModelManager and returns the same `Detections` as YOLOModel.
+
+    The graph is exported once from the `.pt` weights at `model_path` and cached
+    next to them (`<weights>.onnx`); it is re-exported when the weights are newer.
+    Reduced-precision variants are derived from that export and cached the same
+    way (`<weights>.int8.onnx`, `<weights>.fp16.onnx`).
+    """
+
+    def __init__(self, model_path: str = "runs/detect/train/weights/best.pt", onnx_path: str = None,
+                 device: str = "cpu", conf: float = 0.25, iou: float = 0.7, max_det: int = 300,
+                 intra_op_threads: int = 0, providers: list = None):
+        self.model_path = model_path
+        self.onnx_path = onnx_path or os.path.splitext(model_path)[0] + ".onnx"
+        self.device = device
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+        self.intra_op_threads = intra_op_threads
+        self.providers = providers or ["CPUExecutionProvider"]
+
+        self.precision = "fp32"
+        self.session_path = self.onnx_path
+        self.session = None
+        self.input_name = None
+        self.names = {}
+        self.batch_size = 1
+        self.imgsz = 640
+        self.prefetch_depth = DEFAULT_DEPTH
+        self.prefetch_workers = DEFAULT_WORKERS
+        self._prefetcher = None
+
+    def export(self, imgsz: int = 640) -> str:
+        """
+        Exports `model_path` to ONNX unless an up-to-date export is cached. Returns its path.
+        Workers loading the model concurrently may each export it; every export is
+        written to a temporary file and atomically moved into place.
+        """
+        if os.path.exists(self.onnx_path) and (
+            not os.path.exists(self.model_path)
+            or os.path.getmtime(self.onnx_path) >= os.path.getmtime(self.model_path)
+        ):
+            return self.onnx_path
+
+        # export requirements come from requirements.txt; never let ultralytics pip-install them
+        os.environ.setdefault("YOLO_AUTOINSTALL", "False")
+        import onnx  # noqa: F401
+        import onnxslim  # noqa: F401
+        from ultralytics import YOLO
+
+        # ultralytics writes the export next to the weights it loaded: load them from a
+        # private directory (on the same filesystem, for the final os.replace)
+        workdir = tempfile.mkdtemp(prefix=".onnx-export-", dir=os.path.dirname(os.path.abspath(self.onnx_path)))
+        try:
+            weights = os.path.join(workdir, os.path.basename(self.model_path))
+            try:
+                os.symlink(os.path.abspath(self.model_path), weights)
+            except OSError:
+                shutil.copyfile(self.model_path, weights)
+            exported = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True, device="cpu")
+            os.replace(exported, self.onnx_path)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(f"[ONNXModel] Exported {self.model_path} to {self.onnx_path}")
+        return self.onnx_path
+
+    def quantize(self, precision: str) -> str:
+        """
+        Returns the path of the `precision` variant of the exported graph, creating it if needed:
+            int8 - dynamically quantized weights (ONNX Runtime quantize_dynamic), for CPU
+            fp16 - half-precision weights with fp32 inputs/outputs, for GPU providers
+        """
+        if precision == "fp32":
+            return self.onnx_path
+
+        variant_path = os.path.splitext(self.onnx_path)[0] + f".{precision}.onnx"
+        if os.path.exists(variant_path) and os.path.getmtime(variant_path) >= os.path.getmtime(self.onnx_path):
+            return variant_path
+
+        with _replaced_atomically(variant_path) as tmp_path:
+            if precision == "int8":
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+
+                quantize_dynamic(self.onnx_path, tmp_path, weight_type=QuantType.QUInt8)
+            else:
+                import onnx
+                from onnxruntime.transformers.float16 import convert_float_to_float16
+
+                onnx.save(convert_float_to_float16(onnx.load(self.onnx_path), keep_io_types=True), tmp_path)
+        print(f"[ONNXModel] Created {precision} variant {variant_path}")
+        return variant_path
+
+    def load_model(self, batch_size: int = 1, imgsz: int = 640, precision: str = "fp32",
+                   prefetch_depth: int = DEFAULT_DEPTH, prefetch_workers: int = DEFAULT_WORKERS, **kwargs):
+        """
+        Export (if needed) and open an ONNX Runtime session on the `precision` variant.
+        `prefetch_depth` / `prefetch_workers`: batches decoded and letterboxed ahead
+        by how many threads, see model.prefetch; depth 0 disables it.
+        """
+        import onnxruntime as ort
+
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision for ONNXModel: {precision}. Expected one of {PRECISIONS}")
+
+        self.batch_size = batch_size
+        self.imgsz = imgsz
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_workers = prefetch_workers
+        self._close_prefetcher()
+        self.export(imgsz=imgsz)
+        self.precision = precision
+        self.session_path = self.quantize(precision)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_threads:
+            options.intra_op_num_threads = self.intra_op_threads
+
+        self.session = ort.InferenceSession(self.session_path, sess_options=options, providers=self.providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        if "names" in metadata:
+            self.names = ast.literal_eval(metadata["names"])
+        print(f"[ONNXModel] Loaded {self.session_path} with {self.session.get_providers()}")
+
+    def unload_model(self):
+        self._close_prefetcher()
+        if self.session is not None:
+            self.session = None
+            print(f"[ONNXModel] Unloaded model from {self.session_path}")
+
+    def memory_footprint(self):
+        """
+        Bytes of the exported graph (weights dominate its size).
+        """
+        if self.session is None or not os.path.exists(self.session_path):
+            return None
+        return os.path.getsize(self.session_path)
+
+    def class_names(self) -> dict:
+        return dict(self.names)
+
+    def warmup(self, iterations: int = 2, **kwargs):
+        dummy = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+        for _ in range(iterations):
+            self.predict_batch([dummy] * self.batch_size)
+
+    def predict_image(self, image_path, save_path: str = None) -> Detections:
+        """
+        Run inference on a single image (path or BGR array).
+        `save_path` is accepted for API compatibility; annotated output isn't supported.
+        """
+        return self.predict_batch([image_path])[0]
+
+    def predict_batch(self, image_paths: list, save_path: str = None) -> list:
+        """
+        Run inference on several images (paths or BGR arrays), `batch_size` at a time.
+        Returns one `Detections` per image, in input order.
+        """
+        if self.session is None:
+            raise RuntimeError("Model is not loaded. Call load_model() first.")
+
+        return [detections for _, detections in self._predict_prefetched(image_paths)]
+
+    def _predict_prefetched(self, sources: list, batch_size: int = None):
+        """
+        Yields (source, Detections) in input order; the next batches are decoded
+        and letterboxed into the instance's reused buffers while the current one runs
+        (a single batch, e.g. from the micro-batcher, is letterboxed inline).
+        """
+        for batch in self.prefetcher.batches(sources, batch_size):
+            yield from zip(batch.sources, self._run(batch))
+
+    @property
+    def prefetcher(self) -> Prefetcher:
+        """ This instance's Prefetcher, created on first use; its buffers are reused by every call. """
+        if self._prefetcher is None:
+            self._prefetcher = Prefetcher(self.imgsz, self.batch_size, depth=self.prefetch_depth,
+                                          workers=self.prefetch_workers)
+        return self._prefetcher
+
+    def _close_prefetcher(self):
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
+
+    def stream_folder(self, folder_path: str, save_path: str = None, batch_size: int = None,
+                      progress_callback=None):
+        """
+        Lazily run inference on all images in a folder, yielding (image_path, Detections).
+        """
+        if self.session is None:
+            raise RuntimeError("Model is not loaded. Call load_model() first.")
+
+        paths = ops.list_images(folder_path)
+        for processed, (path, detections) in enumerate(self._predict_prefetched(paths, batch_size), start=1):
+            if progress_callback:
+                progress_callback(processed, path)
+            yield path, detections
+
+    def predict_folder(self, folder_path: str, save_path: str = None):
+        return dict(self.stream_folder(folder_path))
+
+    @staticmethod
+    def count_images(folder_path: str) -> int:
+        return len(ops.list_images(folder_path))
+
+    def _run(self, batch) -> list:
+        output = self.session.run(None, {self.input_name: ops.to_input_tensor(batch.images)})[0]
+        # (batch, 4 + num_classes, anchors) -> (batch, anchors, 4 + num_classes)
+        output = output.transpose(0, 2, 1)
+
+        return [
+            self._postprocess(pred, ratio, pad, shape)
+            for pred, ratio, pad, shape in zip(output, batch.ratios, batch.pads, batch.shapes)
+        ]
+
+    def _postprocess(self, pred: np.ndarray, ratio: float, pad, shape) -> Detections:
+        scores = pred[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+
+        mask = confidences > self.conf
+        if not mask.any():
+            return Detections.empty()
+
+        boxes = ops.xywh_to_xyxy(pred[mask, :4])
+        class_ids, confidences = class_ids[mask], confidences[mask]
+
+        keep = ops.nms(boxes, confidences, self.iou, class_ids=class_ids, max_det=self.max_det)
+        boxes = ops.unletterbox(boxes[keep], ratio, pad, shape)
+        return Detections(class_ids[keep], confidences[keep], boxes)
@@ -0,0 +1,193 @@
+"""
+Numpy image / box operations shared by model backends that don't go through
+ultralytics' own pre- and post-processing.
+"""
+from typing import List, Tuple
+import numpy as np
+import os
+
+
+def load_image(source) -> np.ndarray:
+    """
+    Returns a BGR uint8 HxWx3 image from a path or an already decoded array.
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    import cv2
+
+    image = cv2.imread(str(source), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Couldn't read image: {source}")
+    return image
+
+
+def list_images(folder_path: str) -> list:
+    """
+    Sorted paths of the files in `folder_path` with an image extension ultralytics reads.
+    """
+    from ultralytics.data.utils import IMG_FORMATS
+
+    return sorted(
+        entry.path for entry in os.scandir(folder_path)
+        if entry.is_file() and entry.name.rsplit(".", 1)[-1].lower() in IMG_FORMATS
+    )
+
+
+def letterbox(image: np.ndarray, size: int, color: int = 114, out: np.ndarray = None
+              ) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+    """
+    Resizes `image` to fit a `size` x `size` square keeping aspect ratio and pads the rest.
+    Writes into `out` (size x size x 3 uint8) if given.
+    Returns (square image, ratio, (pad_x, pad_y)); original = (letterboxed - pad) / ratio.
+    """
+    import cv2
+
+    h, w = image.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    left, top = int(round(pad_x - 0.1)), int(round(pad_y - 0.1))
+
+    if out is None:
+        out = np.empty((size, size, 3), dtype=np.uint8)
+    out.fill(color)
+    if (new_w, new_h) != (w, h):
+        resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    else:
+        resized = image
+    out[top:top + new_h, left:left + new_w] = resized
+    return out, ratio, (left, top)
+
+
+def fit(image: np.ndarray, size: int, out: np.ndarray = None) -> Tuple[np.ndarray, float]:
+    """
+    Resizes `image` so its longer side is `size`, keeping aspect ratio, without padding.
+    Writes into the top-left corner of `out` (at least size x size x 3 uint8) if given.
+    Returns (resized image, ratio); original = resized / ratio.
+    """
+    import cv2
+
+    h, w = image.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    if out is None:
+        return image, ratio
+    out[:new_h, :new_w] = image
+    return out[:new_h, :new_w], ratio
+
+
+def to_input_tensor(images, dtype=np.float32) -> np.ndarray:
+    """
+    Stacks BGR HxWx3 uint8 images into a normalized RGB NCHW batch.
+    """
+    batch = np.stack(images)[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(batch, dtype=dtype) / dtype(255.0)
+
+
+def xywh_to_xyxy(boxes: np.ndarray) -> np.ndarray:
+    out = np.empty_like(boxes)
+    half_w, half_h = boxes[:, 2] / 2, boxes[:, 3] / 2
+    out[:, 0] = boxes[:, 0] - half_w
+    out[:, 1] = boxes[:, 1] - half_h
+    out[:, 2] = boxes[:, 0] + half_w
+    out[:, 3] = boxes[:, 1] + half_h
+    return out
+
+
+def unletterbox(boxes: np.ndarray, ratio: float, pad: Tuple[float, float], shape: Tuple[int, int]) -> np.ndarray:
+    """
+    Maps xyxy boxes from letterboxed to original image coordinates, clipped to `shape` (h, w).
+    """
+    boxes = boxes.copy()
+    boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad[0]) / ratio
+    boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad[1]) / ratio
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, shape[1])
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, shape[0])
+    return boxes
+
+
+def box_area(boxes: np.ndarray) -> np.ndarray:
+    return (boxes[:, 2] - boxes[:, 0]).clip(0) * (boxes[:, 3] - boxes[:, 1]).clip(0)
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Pairwise IoU of xyxy boxes, (N, 4) x (M, 4) -> (N, M).
+    """
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = (bottom_right - top_left).clip(0).prod(axis=2)
+    union = box_area(a)[:, None] + box_area(b)[None, :] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+# rows of the overlap matrix computed at once, bounds the (rows, N, 2) temporaries
+NMS_CHUNK_ROWS = 1024
+
+
+def box_overlap(a: np.ndarray, b: np.ndarray, metric: str = "iou") -> np.ndarray:
+    """
+    Pairwise overlap of xyxy boxes, (N, 4) x (M, 4) -> (N, M): "iou", or "ios"
+    (intersection over the smaller box).
+    """
+    if metric != "ios":
+        return box_iou(a, b)
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = (bottom_right - top_left).clip(0).prod(axis=2)
+    return inter / np.maximum(np.minimum(box_area(a)[:, None], box_area(b)[None, :]), 1e-9)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float, class_ids: np.ndarray = None,
+        max_det: int = 300, metric: str = "iou") -> np.ndarray:
+    """
+    Greedy non-maximum suppression. Returns kept indices sorted by score.
+    With `class_ids`, boxes only suppress boxes of the same class.
+    `metric` "ios" (intersection over the smaller box) instead of "iou" also
+    suppresses partial boxes cut at a tile border that lie inside a fuller one.
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    order = np.argsort(-scores, kind="stable")
+    boxes = boxes[order].astype(np.float64)
+
+    # which box suppresses which, computed once (in row chunks); a box only
+    # suppresses lower scored ones, and with class_ids only those of its class
+    suppresses = np.empty((len(boxes), len(boxes)), dtype=bool)
+    for start in range(0, len(boxes), NMS_CHUNK_ROWS):
+        rows = slice(start, start + NMS_CHUNK_ROWS)
+        suppresses[rows] = box_overlap(boxes[rows], boxes, metric) > iou_threshold
+    if class_ids is not None:
+        classes = class_ids[order]
+        suppresses &= classes[:, None] == classes[None, :]
+
+    # one step per kept box: drop every remaining box it suppresses
+    keep = []
+    remaining = np.arange(len(boxes))
+    while remaining.size and len(keep) < max_det:
+        i = remaining[0]
+        keep.append(i)
+        remaining = remaining[1:][~suppresses[i, remaining[1:]]]
+
+    return order[np.asarray(keep, dtype=np.int64)]
+
+
+def tile_origins(width: int, height: int, tile: int, overlap: float) -> List[Tuple[int, int]]:
+    """
+    Top-left corners of `tile` x `tile` windows covering a `width` x `height`
+    image with at least `overlap` (fraction of `tile`) between neighbours.
+    The last row / column is aligned to the image border, so every window lies
+    inside the image unless the image is smaller than a tile.
+    """
+    def axis(length: int) -> List[int]:
+        if length <= tile:
+            return [0]
+        stride = max(1, int(tile * (1 - overlap)))
+        starts = list(range(0, length - tile, stride))
+        starts.append(length - tile)
+        return starts
+
+    return [(x, y) for y in axis(height) for x in axis(width)]
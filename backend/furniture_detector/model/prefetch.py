@@ -0,0 +1,161 @@
+"""
+Decode / preprocess prefetching for batched inference.
+
+    worker threads: read + decode + resize image i+1 .. i+k  ->  ring of preallocated buffers
+    caller thread:  forward pass on batch i
+
+`Prefetcher.batches(sources)` yields `PrefetchedBatch`es of BGR images
+resized to `imgsz` while the next `depth` batches are decoded in a
+bounded thread pool (cv2 releases the GIL while decoding and resizing, so
+this overlaps with the forward pass). Images are resized straight into a
+ring of `(depth + 1) * batch_size` buffers, allocated once per model instance
+and reused by every call, so memory is bounded by the prefetch depth, whatever
+the number of images.
+
+With `pad=True` (static-shape backends such as ONNXModel) images are
+letterboxed to the full square; with `pad=False` they are only resized to fit
+and handed out as top-left views of the buffers, leaving stride padding to the
+consumer (ultralytics pads same-shape batches to the smallest rectangle).
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Iterator, List, Tuple
+import threading
+import numpy as np
+from . import ops
+
+# default `prefetch_depth` / `prefetch_workers` loader kwargs of models using a Prefetcher
+DEFAULT_DEPTH = 2
+DEFAULT_WORKERS = 2
+
+
+class PrefetchedBatch:
+    """
+    Letterboxed / resized images of one batch with what is needed to map boxes back:
+    original = (preprocessed - pad) / ratio, clipped to shape (h, w).
+    `images` are views into the prefetcher's buffers, only valid until the
+    next batch is requested.
+    """
+    __slots__ = ("sources", "images", "ratios", "pads", "shapes")
+
+    def __init__(self, sources: list, images: List[np.ndarray], ratios: List[float],
+                 pads: List[Tuple[float, float]], shapes: List[Tuple[int, int]]):
+        self.sources = sources
+        self.images = images
+        self.ratios = ratios
+        self.pads = pads
+        self.shapes = shapes
+
+    def __len__(self):
+        return len(self.sources)
+
+    def unletterbox(self, index: int, boxes: np.ndarray) -> np.ndarray:
+        return ops.unletterbox(boxes, self.ratios[index], self.pads[index], self.shapes[index])
+
+
+class Prefetcher:
+    """
+    Yields batches of `batch_size` preprocessed images, keeping up to `depth`
+    batches being decoded ahead by `workers` threads.
+
+    One Prefetcher belongs to one model instance and is reused across calls: its
+    buffer ring and thread pool are created on first use and kept until `close`.
+    Sources that fit in one batch, and `depth=0`, are decoded on the caller's
+    thread into the same ring, as there is nothing to overlap them with.
+    The ring serves one `batches` call at a time; a concurrent call decodes
+    serially into buffers of its own.
+    """
+
+    def __init__(self, imgsz: int, batch_size: int, depth: int = DEFAULT_DEPTH, workers: int = DEFAULT_WORKERS,
+                 pad: bool = True):
+        self.imgsz = imgsz
+        self.pad = pad
+        self.batch_size = max(1, batch_size)
+        self.depth = max(0, depth)
+        self.workers = max(1, workers)
+        self._buffers = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def batches(self, sources: list, batch_size: int = None) -> Iterator[PrefetchedBatch]:
+        """
+        `sources` are image paths or BGR arrays. Decoding errors are raised when
+        the batch containing the failing image is reached.
+        """
+        batch_size = max(1, batch_size or self.batch_size)
+        owner = self._lock.acquire(blocking=False)
+        try:
+            if not owner:
+                yield from self._serial(sources, batch_size, self._allocate(batch_size))
+            elif not self.depth or len(sources) <= batch_size:
+                yield from self._serial(sources, batch_size, self._ring(batch_size))
+            else:
+                yield from self._prefetched(sources, batch_size)
+        finally:
+            if owner:
+                self._lock.release()
+
+    def close(self):
+        """ Stops the decoding threads and frees the ring; it is recreated if used again. """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+            self._buffers = None
+
+    def _allocate(self, slots: int) -> np.ndarray:
+        return np.empty((slots, self.imgsz, self.imgsz, 3), dtype=np.uint8)
+
+    def _ring(self, slots: int) -> np.ndarray:
+        # grown, never shrunk, when a call asks for a larger batch
+        if self._buffers is None or len(self._buffers) < slots:
+            self._buffers = self._allocate(slots)
+        return self._buffers
+
+    def _serial(self, sources: list, batch_size: int, buffers: np.ndarray) -> Iterator[PrefetchedBatch]:
+        for start in range(0, len(sources), batch_size):
+            chunk = sources[start:start + batch_size]
+            items = [self._prepare(source, buffers[i]) for i, source in enumerate(chunk)]
+            yield self._batch(chunk, items)
+
+    def _prefetched(self, sources: list, batch_size: int) -> Iterator[PrefetchedBatch]:
+        # one batch being consumed + `depth` in flight; a slot is only refilled
+        # once the batch using it was handed back (the generator resumed)
+        slots = (self.depth + 1) * batch_size
+        buffers = self._ring(slots)
+        free = deque(range(slots))
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prefetch")
+
+        pending = deque()
+        submitted = 0
+        try:
+            while submitted < len(sources) or pending:
+                while free and submitted < len(sources):
+                    slot = free.popleft()
+                    pending.append((slot, self._executor.submit(self._prepare, sources[submitted], buffers[slot])))
+                    submitted += 1
+
+                take = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+                chunk = sources[submitted - len(pending) - len(take):submitted - len(pending)]
+                items = [future.result() for _, future in take]
+                yield self._batch(chunk, items)
+                free.extend(slot for slot, _ in take)
+        finally:
+            # on early exit, let running decodes finish before the ring is reused
+            for _, future in pending:
+                future.cancel()
+            wait([future for _, future in pending])
+
+    def _prepare(self, source, out: np.ndarray):
+        image = ops.load_image(source)
+        if self.pad:
+            boxed, ratio, pad = ops.letterbox(image, self.imgsz, out=out)
+            return boxed, ratio, pad, image.shape[:2]
+        resized, ratio = ops.fit(image, self.imgsz, out=out)
+        return resized, ratio, (0, 0), image.shape[:2]
+
+    @staticmethod
+    def _batch(chunk: list, items: list) -> PrefetchedBatch:
+        images, ratios, pads, shapes = (list(column) for column in zip(*items))
+        return PrefetchedBatch(chunk, images, ratios, pads, shapes)
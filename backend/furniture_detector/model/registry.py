@@ -1,15 +1,22 @@
+from concurrent.futures import Future
+from contextlib import contextmanager
 from typing import Any, Dict, List
 from dotenv import load_dotenv
 from .base_model_for_registry import BaseModel
+from .replicas import ReplicaPool
+from .residency import ResidencyManager
 from warnings import warn
+import importlib
 import os
+import threading
+import time
 import yaml
-import torch
 import logging
 
 load_dotenv()
 
 # yaml class names mapped to actual model classes
+# (or to "package.module.Class" import paths, resolved on first load)
 CLASS_MAP = {}
 
 logger = logging.getLogger(__name__)
@@ -20,13 +27,57 @@ class ModelManager:
     _models_map: Dict[str, Dict[str, Any]] = {} 
     _flat_models_map: Dict[str, Dict[str, Any]] = {}  
     _model_types: List[str] = []
+    _preload: List[str] = []
+    _config_path: str = None
+    _config_loaded: bool = False
+    _residency = ResidencyManager()
+    default_vram: float = 8
+
+    # guards _instances, _loading, _leases and residency bookkeeping
+    _lock = threading.RLock()
+    # serializes loads so memory measurement of one load isn't mixed with another
+    _load_lock = threading.Lock()
+    # model name -> Future of its in-flight load, shared by concurrent callers
+    _loading: Dict[str, Future] = {}
+    # model name -> number of callers currently running inference on it
+    _leases: Dict[str, int] = {}
+    # leased models asked to unload; unloaded when their last lease is released
+    _pending_unload: set = set()
+    # model name -> {class_id: name} reported by the model when it was loaded in this process
+    _class_names: Dict[str, Dict[int, str]] = {}
+
+    @classmethod
+    def configure(cls, config_path: str = None, class_map: Dict[str, Any] = None, default_vram=8):
+        """
+        Registers model classes and remembers the config path without reading it.
+        The config is loaded on first use (see `ensure_config`), so processes that
+        never touch a model (web tier, manage.py commands) don't pay for it.
+        """
+        cls._config_path = config_path
+        cls.default_vram = default_vram
+        for name, klass in (class_map or {}).items():
+            cls.register_class(name=name, klass=klass)
+
+    @classmethod
+    def ensure_config(cls):
+        """
+        Loads the configured (or MODELS_YAML_PATH) config once.
+        No-op when no config is set, e.g. when models are registered in code.
+        """
+        if cls._config_loaded:
+            return
+        with cls._lock:
+            if cls._config_loaded:
+                return
+            if cls._config_path or os.getenv('MODELS_YAML_PATH'):
+                cls.load_config(cls._config_path, default_vram=cls.default_vram)
 
     @classmethod
     def load_config(cls, config_path: str = None, class_map: Dict[str, Any] = None, default_vram=8):
         if not config_path:
             config_path = os.getenv('MODELS_YAML_PATH')
 
-        if not os.path.exists(config_path):
+        if not config_path or not os.path.exists(config_path):
             raise FileNotFoundError(f"Config file {config_path} not found")
 
         with open(config_path, "r") as f:
@@ -35,15 +86,66 @@ class ModelManager:
         models = config.get("models", {})
 
         for category, models_dict in models.items():
-            cls._model_types.append(category)
-            cls._models_map[category] = models_dict
             for model_name, data in models_dict.items():
-                cls._flat_models_map[model_name] = data
+                cls.add_model(model_name, data, model_category=category)
 
-        for name, klass in class_map.items():
+        for model_name in config.get("preload", None) or []:
+            if model_name not in cls._preload:
+                cls._preload.append(model_name)
+
+        for name, klass in (class_map or {}).items():
             cls.register_class(name=name, klass=klass)
 
         cls.default_vram = default_vram
+        cls._config_loaded = True
+
+    @classmethod
+    def add_model(cls, model_name: str, model_info: Dict[str, Any], model_category: str):
+        """
+        Adds one model entry, as if it was read from the config file.
+        """
+        if model_category not in cls._model_types:
+            cls._model_types.append(model_category)
+            cls._models_map[model_category] = {}
+        cls._models_map[model_category][model_name] = model_info
+        cls._flat_models_map[model_name] = model_info
+        if model_info.get("pinned"):
+            cls._residency.pin(model_name)
+        if model_info.get("preload") and model_name not in cls._preload:
+            cls._preload.append(model_name)
+
+    @classmethod
+    def preload_list(cls) -> List[str]:
+        """
+        Models a worker should load at startup: PRELOAD_MODELS (comma separated) if set,
+        else the top-level `preload` list and models marked `preload: true` in the config.
+        """
+        cls.ensure_config()
+        env = os.getenv('PRELOAD_MODELS')
+        if env is not None:
+            return [name.strip() for name in env.split(",") if name.strip()]
+        return list(cls._preload)
+
+    @classmethod
+    def preload(cls, model_names: List[str] = None, warmup: bool = True) -> Dict[str, Dict[str, float]]:
+        """
+        Loads (and warms up) models ahead of the first request.
+        Returns per-model stage timings in seconds.
+        """
+        if model_names is None:
+            model_names = cls.preload_list()
+
+        timings = {}
+        for model_name in model_names:
+            start = time.perf_counter()
+            with cls.lease(model_name) as model:
+                loaded = time.perf_counter()
+                if warmup and hasattr(model, "warmup"):
+                    model.warmup()
+                warmed = time.perf_counter()
+            timings[model_name] = {"load": loaded - start, "warmup": warmed - loaded}
+            logger.info(f"Preloaded {model_name}: load {loaded - start:.2f}s, warmup {warmed - loaded:.2f}s")
+        return timings
 
     @classmethod
     def list_models(cls, model_category: str = None):
@@ -51,6 +153,7 @@ class ModelManager:
         Returns models per category if given,
         else return all models and the category they belong to
         """
+        cls.ensure_config()
         if not model_category:
             models: Dict[str, List[str]] = {}
             for category, v in cls._models_map.items():
@@ -61,61 +164,228 @@ class ModelManager:
 
         return list(cls._models_map[model_category].keys())
 
-    @staticmethod
-    def _get_free_vram_gb() -> float:
-        """ Returns free VRAM in GB."""
-        if not torch.cuda.is_available():
-            return 0.0
-        free, total = torch.cuda.mem_get_info()
-        return free / (1024**3) 
+    @classmethod
+    def get_model_info(cls, model_name: str, model_category: str = None) -> Dict[str, Any]:
+        """
+        Returns the config entry of a model, validated against its category if given.
+        """
+        cls.ensure_config()
+        model_info = None
+        if model_category:
+            if model_category not in cls._model_types:
+                raise ValueError(f"Unknown category: {model_category}")
+            elif model_name not in cls._models_map[model_category]:
+                raise ValueError(f"Model: {model_name} not found for category: {model_category}")
+            else:
+                model_info = cls._models_map[model_category][model_name]
+        else:
+            model_info = cls._flat_models_map.get(model_name, None)
+
+        if not model_info:
+            raise ValueError(f"Couldn't read model info. Make sure name {model_name} and category {model_category} are correct")
+
+        return model_info
+
+    @classmethod
+    def get_model_version(cls, model_name: str):
+        """
+        Returns a version tag that changes whenever the model's weights file changes
+        (size + mtime of `constructor_kwargs.model_path`).
+        None if the model is unknown or its weights can't be found.
+        """
+        cls.ensure_config()
+        model_info = cls._flat_models_map.get(model_name)
+        if not model_info:
+            return None
+        model_path = model_info.get("constructor_kwargs", {}).get("model_path")
+        if not model_path:
+            return None
+        try:
+            st = os.stat(model_path)
+        except OSError:
+            return None
+        return f"{st.st_size:x}-{st.st_mtime_ns:x}"
+
+    @classmethod
+    def get_class_names(cls, model_name: str) -> Dict[int, str]:
+        """
+        {class_id: name} of a model: as reported by the model when it was loaded in
+        this process (it may have been evicted since), else from the `class_names`
+        list of its config entry. Empty if unknown.
+        """
+        cls.ensure_config()
+        if cls._class_names.get(model_name):
+            return dict(cls._class_names[model_name])
+        configured = cls._flat_models_map.get(model_name, {}).get("class_names") or {}
+        if isinstance(configured, list):
+            return dict(enumerate(configured))
+        return {int(k): v for k, v in configured.items()}
 
     @classmethod
     def get_model(cls, model_name: str, model_category: str = None):
-        model_info = None
-        if model_name not in cls._instances:
-            if model_category:
-                if model_category not in cls._model_types:
-                    raise ValueError(f"Unknown category: {model_category}")
-                elif model_name not in cls._models_map[model_category]:
-                    raise ValueError(f"Model: {model_name} not found for category: {model_category}")
-                else:
-                    model_info = cls._models_map[model_category][model_name]
+        """
+        Returns the loaded instance of `model_name`, loading it if needed.
+        Concurrent callers asking for a model that isn't loaded share one load.
+        Use `lease` instead when the model must not be unloaded while in use.
+        """
+        return cls._acquire(model_name, model_category, lease=False)
+
+    @classmethod
+    @contextmanager
+    def lease(cls, model_name: str, model_category: str = None):
+        """
+        Context manager yielding a loaded model that won't be unloaded or evicted
+        until the block exits.
+
+            with ModelManager.lease("yolov8s", "detection") as model:
+                model.predict_image(path)
+        """
+        instance = cls._acquire(model_name, model_category, lease=True)
+        try:
+            yield instance
+        finally:
+            cls.release(model_name)
+
+    @classmethod
+    def release(cls, model_name: str):
+        """ Releases a lease taken by `lease`, running a deferred unload if it was the last one. """
+        with cls._lock:
+            count = cls._leases.get(model_name, 0) - 1
+            if count > 0:
+                cls._leases[model_name] = count
+                return
+            cls._leases.pop(model_name, None)
+            deferred = model_name in cls._pending_unload
+            cls._pending_unload.discard(model_name)
+        if deferred:
+            cls.unload_model(model_name, reason="deferred_unload")
+
+    @classmethod
+    def _acquire(cls, model_name: str, model_category: str, lease: bool):
+        while True:
+            with cls._lock:
+                instance = cls._instances.get(model_name)
+                if instance is not None:
+                    cls._residency.touch(model_name)
+                    if lease:
+                        cls._leases[model_name] = cls._leases.get(model_name, 0) + 1
+                    return instance
+
+                future = cls._loading.get(model_name)
+                owner = future is None
+                if owner:
+                    future = Future()
+                    cls._loading[model_name] = future
+
+            if not owner:
+                # wait for the in-flight load, then re-check: it may have been unloaded since
+                future.result()
+                continue
+
+            try:
+                instance = cls._load(model_name, model_category)
+            except BaseException as e:
+                with cls._lock:
+                    cls._loading.pop(model_name, None)
+                future.set_exception(e)
+                raise
+
+            with cls._lock:
+                cls._instances[model_name] = instance
+                cls._loading.pop(model_name, None)
+            future.set_result(instance)
+
+    @classmethod
+    def _load(cls, model_name: str, model_category: str = None):
+        model_info = cls.get_model_info(model_name, model_category)
+
+        model_class = cls._resolve_class(model_info["class"])
+
+        constructor_kwargs = model_info.get('constructor_kwargs', {})
+        device = cls._residency.device_kind(constructor_kwargs.get("device"))
+
+        with cls._load_lock:
+            with cls._lock:
+                required_gb = cls._residency.estimate_gb(
+                    model_name, model_info.get("required_vram", cls.default_vram)
+                )
+                victims = cls._residency.plan_eviction(
+                    model_name, device, required_gb, exclude=cls._leases.keys()
+                )
+
+            for m in victims:
+                cls.unload_model(m, reason="evict")
+
+            snapshot = cls._residency.memory_snapshot(device)
+            start = time.perf_counter()
+
+            loader_kwargs = dict(model_info.get('loader_kwargs') or {})
+            if model_info.get("precision"):
+                loader_kwargs["precision"] = model_info["precision"]
+            if model_info.get("tiling"):
+                loader_kwargs["tiling"] = model_info["tiling"]
+
+            replicas = int(model_info.get("replicas", 1))
+            if replicas > 1 or model_info.get("threads_per_replica"):
+                instance = ReplicaPool(model_class, constructor_kwargs, replicas=replicas,
+                                       threads_per_replica=model_info.get("threads_per_replica"),
+                                       name=model_name)
             else:
-                model_info = cls._flat_models_map.get(model_name, None)
-        
-            if not model_info:
-                raise ValueError(f"Couldn't read model info. Make sure name {model_name} and category {model_category} are correct")
+                instance = model_class(**constructor_kwargs)
+            instance.load_model(**loader_kwargs)
+            if hasattr(instance, "class_names"):
+                cls._class_names[model_name] = dict(instance.class_names() or {})
 
-            required_vram = model_info.get("required_vram", cls.default_vram)
-            model_class_name = model_info["class"]
+            load_seconds = time.perf_counter() - start
+            memory_gb = cls._residency.measure(device, snapshot, instance=instance, estimate_gb=required_gb)
 
-            free_gb = cls._get_free_vram_gb()
-            if free_gb < float(required_vram):
-                models = cls._find_models_to_unload(required_vram - free_gb)
-                if models:
-                    for m in models:
-                        cls.unload_model(m)
-                    free_gb = cls._get_free_vram_gb()
+            with cls._lock:
+                cls._residency.add(model_name, device, memory_gb=memory_gb, load_seconds=load_seconds)
+                cls._residency.touch(model_name)
 
-            if model_class_name not in CLASS_MAP:
-                raise ValueError(f"Unknown class: {model_class_name}")
-            model_class = CLASS_MAP[model_class_name]
-            instance = model_class(**model_info['constructor_kwargs'])
+        return instance
+
+    @classmethod
+    def unload_model(cls, model_name: str, reason: str = "unload"):
+        """
+        Unloads a model. If it is leased, the unload is deferred until the last lease is released.
+        """
+        with cls._lock:
+            if model_name not in cls._instances:
+                return
+            if cls._leases.get(model_name):
+                cls._pending_unload.add(model_name)
+                logger.info(f"Deferred unload of {model_name}: in use")
+                return
+            instance = cls._instances.pop(model_name)
+            cls._residency.remove(model_name, reason=reason)
 
-            instance.load_model(**model_info['loader_kwargs'])
+        if hasattr(instance, "unload_model"):
+            instance.unload_model()
+        logger.info(f"Unloaded model {model_name}")
 
-            cls._instances[model_name] = instance
+    @classmethod
+    def pin(cls, model_name: str):
+        """ Never evict `model_name` to make room for other models. """
+        with cls._lock:
+            cls._residency.pin(model_name)
 
-        return cls._instances[model_name]
-    
+    @classmethod
+    def unpin(cls, model_name: str):
+        with cls._lock:
+            cls._residency.unpin(model_name)
 
     @classmethod
-    def unload_model(cls, model_name: str):
-        if model_name in cls._instances:
-            if hasattr(cls._instances[model_name], "unload_model"):
-                cls._instances[model_name].unload_model()
-            del cls._instances[model_name]
-            logger.info(f"Unloaded model {model_name}")
+    def residency_report(cls) -> Dict[str, Any]:
+        """ Resident models, their measured memory, budgets and recent load/evict decisions. """
+        with cls._lock:
+            report = cls._residency.report()
+            report["leases"] = dict(cls._leases)
+            report["replicas"] = {
+                name: instance.stats() for name, instance in cls._instances.items()
+                if isinstance(instance, ReplicaPool)
+            }
+            return report
 
     @classmethod
     def switch_model(cls, old_model: str, new_model: str):
@@ -125,36 +395,30 @@ class ModelManager:
         return cls.get_model(new_model)
     
     @classmethod
-    def _find_models_to_unload(cls, required_vram: float) -> list:
-        """Finds models to unload to free up the required VRAM."""
-
-        sorted_models = sorted(
-            cls._instances.items(),
-            key=lambda item: cls._flat_models_map.get(item[0], {}).get("required_vram", cls.default_vram),
-            reverse=True
-        )
-
-        to_unload = []
-        freed_vram = 0.0
-
-        for model_name, instance in sorted_models:
-            model_info = cls._flat_models_map.get(model_name, {})
-            model_vram = model_info.get("required_vram", 10)
-            to_unload.append(model_name)
-            freed_vram += model_vram
-            if freed_vram >= required_vram:
-                break
-
-        return to_unload
-
-    @classmethod
-    def register_class(cls, name: str, klass: type):
+    def register_class(cls, name: str, klass):
         """
         Register a model class in CLASS_MAP.
+        `klass` may be a "package.module.Class" import path, imported only when
+        the model is first loaded.
         Warns the user if klass does not inherit from BaseModel.
         """  
 
+        if isinstance(klass, str):
+            CLASS_MAP[name] = klass
+            return
+
         if not issubclass(klass, BaseModel):
             warn(f"Class '{klass.__name__}' does not inherit from BaseModel. "
                  "This may cause errors when calling load_model or unload_model!", UserWarning)
         CLASS_MAP[name] = klass
+
+    @classmethod
+    def _resolve_class(cls, name: str) -> type:
+        if name not in CLASS_MAP:
+            raise ValueError(f"Unknown class: {name}")
+        klass = CLASS_MAP[name]
+        if isinstance(klass, str):
+            module_path, _, attr = klass.rpartition(".")
+            klass = getattr(importlib.import_module(module_path), attr)
+            cls.register_class(name=name, klass=klass)
+        return klass
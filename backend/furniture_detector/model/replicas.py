@@ -0,0 +1,268 @@
+"""
+Per-core model replicas.
+
+On many-core CPU hosts a single model instance running one forward pass at a
+time with the default intra-op thread count scales poorly: every core fights
+over the same pass. A `ReplicaPool` instead holds N instances of the model,
+each owned by its own thread that is pinned to a disjoint slice of cores and
+limited to that many intra-op threads. Calls are routed to the least-loaded
+replica, and batches are split across idle replicas.
+
+ModelManager builds a pool instead of a bare instance when a model's config has
+`replicas` (and optionally `threads_per_replica`); the pool exposes the same
+`predict_image` / `predict_batch` / `stream_folder` methods, so callers don't change.
+"""
+from concurrent.futures import Future
+from queue import Queue
+from typing import Any, Dict, List, Optional
+import inspect
+import logging
+import math
+import os
+import threading
+from . import ops
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def available_cpus() -> List[int]:
+    """ CPUs this process may run on. """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def partition_cpus(replicas: int, threads_per_replica: int = None, cpus: List[int] = None) -> List[List[int]]:
+    """
+    Splits `cpus` into `replicas` disjoint slices of `threads_per_replica` CPUs
+    (default: an even share). Slices wrap around when the host has fewer CPUs
+    than replicas * threads_per_replica.
+    """
+    cpus = cpus or available_cpus()
+    threads = threads_per_replica or max(1, len(cpus) // replicas)
+    return [[cpus[(i * threads + j) % len(cpus)] for j in range(threads)] for i in range(replicas)]
+
+
+def _limit_current_thread(cpus: List[int], threads: int):
+    """
+    Pins the calling thread to `cpus` and caps torch's intra-op threads for
+    parallel regions it starts. Thread pools created afterwards inherit both.
+    """
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            # on Linux, pid 0 is the calling thread
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            logger.warning(f"Couldn't pin replica thread to CPUs {cpus}: {e}")
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+
+
+class Replica:
+    """ One model instance and the thread that runs every call on it. """
+
+    def __init__(self, index: int, instance, cpus: List[int]):
+        self.index = index
+        self.instance = instance
+        self.cpus = cpus
+        self.pending = 0
+        self.served = 0
+        self._queue: Queue = Queue()
+        self._thread = None
+
+    def start(self, name: str):
+        self._thread = threading.Thread(target=self._run, name=f"replica-{name}-{self.index}", daemon=True)
+        self._thread.start()
+
+    def submit(self, method: str, *args, **kwargs) -> Future:
+        future = Future()
+        self._queue.put((method, args, kwargs, future))
+        return future
+
+    def stop(self):
+        self._queue.put(_STOP)
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        _limit_current_thread(self.cpus, len(self.cpus))
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            method, args, kwargs, future = item
+            try:
+                future.set_result(getattr(self.instance, method)(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"index": self.index, "cpus": self.cpus, "pending": self.pending, "served": self.served}
+
+
+class ReplicaPool:
+    """
+    `replicas` instances of `model_class`, each on its own core slice.
+
+    Construction and `load_model` run on the replica's own thread, so weights
+    are first touched by a thread on the cores that will use them. Model
+    classes accepting an `intra_op_threads` argument (ONNXModel) get the slice size.
+    """
+
+    def __init__(self, model_class, constructor_kwargs: Dict[str, Any] = None, replicas: int = 2,
+                 threads_per_replica: int = None, name: str = None):
+        self.model_class = model_class
+        self.constructor_kwargs = dict(constructor_kwargs or {})
+        self.name = name or model_class.__name__
+        self.cpu_slices = partition_cpus(max(1, int(replicas)), threads_per_replica)
+        self.replicas: List[Replica] = []
+        self.batch_size = 1
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.replicas)
+
+    def __getattr__(self, item):
+        # model attributes (names, imgsz, precision, ...) are read from the first replica
+        replicas = self.__dict__.get("replicas")
+        if not replicas:
+            raise AttributeError(item)
+        return getattr(replicas[0].instance, item)
+
+    # ---- lifecycle ----
+
+    def _constructor_kwargs(self, cpus: List[int]) -> Dict[str, Any]:
+        kwargs = dict(self.constructor_kwargs)
+        params = inspect.signature(self.model_class.__init__).parameters
+        if "intra_op_threads" in params and not kwargs.get("intra_op_threads"):
+            kwargs["intra_op_threads"] = len(cpus)
+        return kwargs
+
+    def load_model(self, **loader_kwargs):
+        """
+        Creates and loads every replica in parallel, each on its own thread.
+        """
+        self.batch_size = loader_kwargs.get("batch_size", 1)
+        # the first call on each replica thread builds its instance, then the loader is swapped out
+        replicas = [Replica(index, _Loader(self.model_class, self._constructor_kwargs(cpus), loader_kwargs), cpus)
+                    for index, cpus in enumerate(self.cpu_slices)]
+        for replica in replicas:
+            replica.start(self.name)
+        loads = [replica.submit("load") for replica in replicas]
+        try:
+            for replica, future in zip(replicas, loads):
+                replica.instance = future.result()
+        except BaseException:
+            for replica in replicas:
+                replica.stop()
+            raise
+
+        self.replicas = replicas
+        logger.info(f"Loaded {len(replicas)} replicas of {self.name} on CPUs {self.cpu_slices}")
+
+    def unload_model(self):
+        for replica in self.replicas:
+            if hasattr(replica.instance, "unload_model"):
+                replica.submit("unload_model").result()
+            replica.stop()
+        self.replicas = []
+
+    def warmup(self, **kwargs):
+        futures = [r.submit("warmup", **kwargs) for r in self.replicas if hasattr(r.instance, "warmup")]
+        for future in futures:
+            future.result()
+
+    def memory_footprint(self) -> Optional[int]:
+        sizes = [r.instance.memory_footprint() for r in self.replicas if hasattr(r.instance, "memory_footprint")]
+        sizes = [s for s in sizes if s]
+        return sum(sizes) if sizes else None
+
+    # ---- routing ----
+
+    def _pick(self) -> Replica:
+        if not self.replicas:
+            raise RuntimeError("Model is not loaded. Call load_model() first.")
+        with self._lock:
+            # idle first, then fewest pending calls; ties go to the one that served least
+            replica = min(self.replicas, key=lambda r: (r.pending, r.served))
+            replica.pending += 1
+        return replica
+
+    def _call(self, method: str, *args, **kwargs) -> Future:
+        replica = self._pick()
+        future = replica.submit(method, *args, **kwargs)
+        future.add_done_callback(lambda _: self._done(replica))
+        return future
+
+    def _done(self, replica: Replica):
+        with self._lock:
+            replica.pending -= 1
+            replica.served += 1
+
+    # ---- model API ----
+
+    def predict_image(self, image_path, save_path: str = None):
+        return self._call("predict_image", image_path, save_path=save_path).result()
+
+    def predict_batch(self, image_paths: list, save_path: str = None) -> list:
+        """
+        Splits the batch into one chunk per replica and runs the chunks in parallel.
+        Returns one result per image, in input order.
+        """
+        if not image_paths:
+            return []
+        step = max(1, math.ceil(len(image_paths) / max(1, len(self.replicas))))
+        futures = [
+            self._call("predict_batch", image_paths[start:start + step], save_path=save_path)
+            for start in range(0, len(image_paths), step)
+        ]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def stream_folder(self, folder_path: str, save_path: str = None, batch_size: int = None,
+                      progress_callback=None):
+        """
+        Yields (image_path, detections) for every image in a folder, keeping
+        every replica busy with a batch at a time.
+        """
+        paths = ops.list_images(folder_path)
+        step = (batch_size or self.batch_size) * max(1, len(self.replicas))
+        processed = 0
+        for start in range(0, len(paths), step):
+            chunk = paths[start:start + step]
+            for path, detections in zip(chunk, self.predict_batch(chunk, save_path=save_path)):
+                processed += 1
+                if progress_callback:
+                    progress_callback(processed, path)
+                yield path, detections
+
+    def predict_folder(self, folder_path: str, save_path: str = None):
+        return dict(self.stream_folder(folder_path, save_path=save_path))
+
+    def count_images(self, folder_path: str) -> int:
+        return len(ops.list_images(folder_path))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [r.as_dict() for r in self.replicas]
+
+
+class _Loader:
+    """ Builds and loads a model instance on the replica thread that will own it. """
+
+    def __init__(self, model_class, constructor_kwargs: Dict[str, Any], loader_kwargs: Dict[str, Any]):
+        self.model_class = model_class
+        self.constructor_kwargs = constructor_kwargs
+        self.loader_kwargs = loader_kwargs
+
+    def load(self):
+        instance = self.model_class(**self.constructor_kwargs)
+        instance.load_model(**self.loader_kwargs)
+        return instance
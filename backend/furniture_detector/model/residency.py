@@ -0,0 +1,268 @@
+from collections import deque
+from typing import Any, Dict, Iterable, List
+from dotenv import load_dotenv
+from . import metrics
+import logging
+import os
+import time
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+
+def _torch():
+    import torch
+    return torch
+
+
+def _cuda_available() -> bool:
+    try:
+        return _torch().cuda.is_available()
+    except ImportError:
+        return False
+
+
+def get_host_rss_gb() -> float:
+    """ Resident set size of this process in GB. """
+    try:
+        with open("/proc/self/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        return rss_pages * os.sysconf("SC_PAGE_SIZE") / GB
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss is in KB on Linux; it is a peak, not current, value
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2)
+
+
+def get_host_total_gb() -> float:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / GB
+    except (OSError, ValueError):
+        return 0.0
+
+
+def get_free_vram_gb() -> float:
+    """ Returns free VRAM in GB."""
+    if not _cuda_available():
+        return 0.0
+    free, total = _torch().cuda.mem_get_info()
+    return free / GB
+
+
+def get_total_vram_gb() -> float:
+    if not _cuda_available():
+        return 0.0
+    free, total = _torch().cuda.mem_get_info()
+    return total / GB
+
+
+class ModelRecord:
+    """ Bookkeeping for one resident model. """
+
+    __slots__ = ("name", "device", "memory_gb", "load_seconds", "loaded_at", "last_used", "uses", "pinned")
+
+    def __init__(self, name: str, device: str, memory_gb: float, load_seconds: float, pinned: bool = False):
+        self.name = name
+        self.device = device
+        self.memory_gb = memory_gb
+        self.load_seconds = load_seconds
+        self.loaded_at = time.monotonic()
+        self.last_used = self.loaded_at
+        self.uses = 0
+        self.pinned = pinned
+
+    def keep_score(self, now: float) -> float:
+        """
+        Higher means more worth keeping: expensive to reload and recently used.
+        With equal reload costs this orders models by plain LRU.
+        """
+        idle = max(now - self.last_used, 1e-3)
+        return (self.load_seconds + 1e-3) / idle
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "device": self.device,
+            "memory_gb": round(self.memory_gb, 3),
+            "load_seconds": round(self.load_seconds, 3),
+            "idle_seconds": round(time.monotonic() - self.last_used, 3),
+            "uses": self.uses,
+            "pinned": self.pinned,
+        }
+
+
+class ResidencyManager:
+    """
+    Memory-budgeted residency of loaded models.
+
+    Memory is accounted per device kind ("cuda" or "cpu") from what each model
+    actually took when it was loaded: allocated CUDA memory for GPU models,
+    process RSS growth for CPU models. When a load would exceed the budget,
+    unpinned models on the same device are evicted, least valuable first
+    (see `ModelRecord.keep_score`). Every decision is logged and kept in `decisions`.
+
+    Budgets default to MODEL_VRAM_BUDGET_GB / MODEL_HOST_BUDGET_GB, else to a
+    fraction of total device / host memory.
+    """
+
+    def __init__(self, vram_budget_gb: float = None, host_budget_gb: float = None,
+                 budget_fraction: float = 0.9, max_decisions: int = 200):
+        env_vram = os.getenv("MODEL_VRAM_BUDGET_GB")
+        env_host = os.getenv("MODEL_HOST_BUDGET_GB")
+        self._vram_budget_gb = vram_budget_gb if vram_budget_gb is not None else (float(env_vram) if env_vram else None)
+        self._host_budget_gb = host_budget_gb if host_budget_gb is not None else (float(env_host) if env_host else None)
+        self.budget_fraction = budget_fraction
+
+        self.records: Dict[str, ModelRecord] = {}
+        # last measured size of every model ever loaded, used as the estimate for reloads
+        self.known_sizes: Dict[str, float] = {}
+        self.pinned: set = set()
+        self.decisions: deque = deque(maxlen=max_decisions)
+
+    # ---- devices / budget ----
+
+    @staticmethod
+    def device_kind(device) -> str:
+        if device is None:
+            return "cuda" if _cuda_available() else "cpu"
+        if str(device).lower() in ("cpu", "mps"):
+            return "cpu"
+        return "cuda" if _cuda_available() else "cpu"
+
+    def budget_gb(self, device_kind: str) -> float:
+        if device_kind == "cuda":
+            if self._vram_budget_gb is not None:
+                return self._vram_budget_gb
+            return get_total_vram_gb() * self.budget_fraction
+        if self._host_budget_gb is not None:
+            return self._host_budget_gb
+        return get_host_total_gb() * self.budget_fraction
+
+    def used_gb(self, device_kind: str) -> float:
+        return sum(r.memory_gb for r in self.records.values() if r.device == device_kind)
+
+    def free_gb(self, device_kind: str) -> float:
+        free = self.budget_gb(device_kind) - self.used_gb(device_kind)
+        if device_kind == "cuda":
+            # other processes may share the GPU
+            free = min(free, get_free_vram_gb())
+        return free
+
+    # ---- measurement ----
+
+    def memory_snapshot(self, device_kind: str) -> float:
+        if device_kind == "cuda":
+            torch = _torch()
+            torch.cuda.synchronize()
+            return torch.cuda.memory_allocated() / GB
+        return get_host_rss_gb()
+
+    def measure(self, device_kind: str, snapshot: float, instance=None, estimate_gb: float = 0.0) -> float:
+        """
+        Memory taken by a model loaded since `snapshot`. The model's own
+        `memory_footprint()` (e.g. weights at their loaded precision) is a lower
+        bound, since allocator reuse can swallow part of the measured delta.
+        Falls back to the configured estimate when neither is available.
+        """
+        measured = max(self.memory_snapshot(device_kind) - snapshot, 0.0)
+        footprint = getattr(instance, "memory_footprint", None)
+        if callable(footprint):
+            footprint_bytes = footprint()
+            if footprint_bytes:
+                measured = max(measured, footprint_bytes / GB)
+        return measured if measured > 0 else float(estimate_gb)
+
+    def estimate_gb(self, model_name: str, configured_gb: float) -> float:
+        """ Measured size from an earlier load if known, else the configured estimate. """
+        return self.known_sizes.get(model_name, float(configured_gb))
+
+    # ---- bookkeeping ----
+
+    def add(self, model_name: str, device_kind: str, memory_gb: float, load_seconds: float):
+        record = ModelRecord(model_name, device_kind, memory_gb, load_seconds, pinned=model_name in self.pinned)
+        self.records[model_name] = record
+        self.known_sizes[model_name] = memory_gb
+        self._decide("load", model_name, device=device_kind, memory_gb=round(memory_gb, 3),
+                     load_seconds=round(load_seconds, 3))
+        metrics.observe("model_load", load_seconds)
+        metrics.model_loaded(model_name, device_kind, memory_gb)
+
+    def touch(self, model_name: str):
+        record = self.records.get(model_name)
+        if record:
+            record.last_used = time.monotonic()
+            record.uses += 1
+
+    def remove(self, model_name: str, reason: str = "unload"):
+        record = self.records.pop(model_name, None)
+        if record:
+            self._decide(reason, model_name, device=record.device, memory_gb=round(record.memory_gb, 3))
+            metrics.model_unloaded(model_name, record.device, reason)
+
+    def pin(self, model_name: str):
+        self.pinned.add(model_name)
+        if model_name in self.records:
+            self.records[model_name].pinned = True
+        self._decide("pin", model_name)
+
+    def unpin(self, model_name: str):
+        self.pinned.discard(model_name)
+        if model_name in self.records:
+            self.records[model_name].pinned = False
+        self._decide("unpin", model_name)
+
+    # ---- eviction ----
+
+    def plan_eviction(self, model_name: str, device_kind: str, required_gb: float,
+                      exclude: Iterable[str] = ()) -> List[str]:
+        """
+        Returns the models to unload so that `required_gb` fits on `device_kind`.
+        Only unpinned models on the same device are considered.
+        """
+        free = self.free_gb(device_kind)
+        if free >= required_gb:
+            return []
+
+        now = time.monotonic()
+        exclude = set(exclude)
+        candidates = sorted(
+            (r for r in self.records.values()
+             if r.device == device_kind and not r.pinned and r.name not in exclude),
+            key=lambda r: r.keep_score(now),
+        )
+
+        victims = []
+        for record in candidates:
+            if free >= required_gb:
+                break
+            victims.append(record.name)
+            free += record.memory_gb
+
+        if free < required_gb:
+            self._decide("over_budget", model_name, device=device_kind, required_gb=round(required_gb, 3),
+                         free_gb=round(free, 3), level=logging.WARNING)
+        for victim in victims:
+            self._decide("evict_planned", victim, device=device_kind, for_model=model_name,
+                         required_gb=round(required_gb, 3))
+        return victims
+
+    # ---- reporting ----
+
+    def _decide(self, action: str, model_name: str, level: int = logging.INFO, **details):
+        decision = {"time": time.time(), "action": action, "model": model_name, **details}
+        self.decisions.append(decision)
+        logger.log(level, f"[residency] {action} {model_name} {details}")
+
+    def report(self) -> Dict[str, Any]:
+        devices = {r.device for r in self.records.values()} | {"cpu"}
+        return {
+            "models": [r.as_dict() for r in self.records.values()],
+            "devices": {
+                d: {"budget_gb": round(self.budget_gb(d), 3), "used_gb": round(self.used_gb(d), 3)}
+                for d in sorted(devices)
+            },
+            "decisions": list(self.decisions),
+        }
@@ -0,0 +1,250 @@
+"""
+Headless frame-stream inference with backpressure.
+
+    decode thread  ->  LatestFrameQueue (bounded, drops oldest)  ->  inference thread  ->  on_result
+
+Frames come from a video file / camera (`run_video`, decoded by cv2.VideoCapture
+on the decode thread) or are pushed encoded, e.g. JPEG frames received over a
+WebSocket (`push_encoded`, decoded on the decode thread). The inference thread
+takes the freshest frame at most `target_fps` times per second, so when
+inference is slower than the source, stale frames are dropped instead of
+queueing up latency.
+
+`predict` is any callable taking a BGR array and returning `Detections`
+(a model's `predict_image`, a MicroBatcher's `predict_image`, an InferenceClient, ...).
+"""
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+import logging
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class Frame:
+    __slots__ = ("index", "image", "captured_at")
+
+    def __init__(self, index: int, image, captured_at: float):
+        self.index = index
+        self.image = image
+        # time.perf_counter() when the frame was read / received, for end-to-end latency
+        self.captured_at = captured_at
+
+
+class LatestFrameQueue:
+    """
+    Bounded queue that drops its oldest item when full, so consumers always
+    get recent frames. `close()` wakes up and ends blocked consumers.
+    """
+
+    def __init__(self, maxsize: int = 2):
+        self._items = deque(maxlen=max(1, maxsize))
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get_latest(self, timeout: float = None):
+        """
+        Returns the newest item, dropping older ones, or None when closed / timed out.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout=timeout):
+                return None
+            if not self._items:
+                return None
+            item = self._items.pop()
+            self.dropped += len(self._items)
+            self._items.clear()
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+
+class StreamPipeline:
+    """
+    One stream: a decode thread, a LatestFrameQueue and an inference thread.
+    `on_result(frame_index, detections, latency_seconds)` is called on the
+    inference thread for every inferred frame.
+    """
+
+    def __init__(self, predict: Callable, on_result: Callable = None, target_fps: float = 10.0,
+                 queue_size: int = 2, name: str = "stream"):
+        self.predict = predict
+        self.on_result = on_result
+        self.target_fps = target_fps
+        self.name = name
+
+        self.frames = LatestFrameQueue(queue_size)
+        self._encoded = LatestFrameQueue(queue_size)
+        self._stop = threading.Event()
+        self._decoder = None
+        self._worker = None
+
+        self.received = 0
+        self.decoded = 0
+        self.inferred = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=10000)
+        self.started_at = None
+        self.finished_at = None
+
+    # ---- sources ----
+
+    def run_video(self, source, realtime: bool = True, max_frames: int = None) -> Dict[str, Any]:
+        """
+        Runs a video file (or camera index) to the end and returns `stats()`.
+        With `realtime`, the file is read at its own frame rate, as a camera would
+        deliver it; otherwise as fast as it decodes.
+        """
+        self._start(lambda: self._decode_video(source, realtime, max_frames))
+        self.wait()
+        return self.stats()
+
+    def start_push(self):
+        """ Starts a pipeline fed by `push_encoded`. """
+        self._start(self._decode_pushed)
+
+    def push_encoded(self, data: bytes):
+        """
+        Queues one encoded (JPEG / PNG) frame; decoded on the decode thread.
+        Never blocks: if decoding falls behind, the oldest undecoded frame is dropped.
+        """
+        self.received += 1
+        self._encoded.put((self.received - 1, data, time.perf_counter()))
+
+    # ---- lifecycle ----
+
+    def _start(self, decode_target: Callable):
+        self.started_at = time.perf_counter()
+        self._decoder = threading.Thread(target=self._run_decoder, args=(decode_target,),
+                                         name=f"{self.name}-decode", daemon=True)
+        self._worker = threading.Thread(target=self._run_inference, name=f"{self.name}-infer", daemon=True)
+        self._decoder.start()
+        self._worker.start()
+
+    def stop(self):
+        """ Stops both threads; frames still queued are dropped. """
+        self._stop.set()
+        self._encoded.close()
+        self.frames.close()
+        self.wait()
+
+    def wait(self, timeout: float = None):
+        for thread in (self._decoder, self._worker):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(timeout)
+
+    # ---- decode thread ----
+
+    def _run_decoder(self, target: Callable):
+        try:
+            target()
+        except Exception:
+            logger.exception(f"[{self.name}] decoding failed")
+        finally:
+            # no more frames: the inference thread finishes what is queued and exits
+            self.frames.close()
+
+    def _decode_video(self, source, realtime: bool, max_frames: Optional[int]):
+        import cv2
+
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise ValueError(f"Couldn't open video source: {source}")
+        interval = 1.0 / (capture.get(cv2.CAP_PROP_FPS) or 30.0) if realtime else 0.0
+        next_at = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                if max_frames is not None and self.received >= max_frames:
+                    break
+                ok, image = capture.read()
+                if not ok:
+                    break
+                now = time.perf_counter()
+                self.received += 1
+                self.decoded += 1
+                self.frames.put(Frame(self.received - 1, image, now))
+                if interval:
+                    next_at += interval
+                    time.sleep(max(0.0, next_at - time.perf_counter()))
+        finally:
+            capture.release()
+
+    def _decode_pushed(self):
+        import cv2
+
+        while not self._stop.is_set():
+            item = self._encoded.get_latest()
+            if item is None:
+                return
+            index, data, received_at = item
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                self.errors += 1
+                continue
+            self.decoded += 1
+            self.frames.put(Frame(index, image, received_at))
+
+    # ---- inference thread ----
+
+    def _run_inference(self):
+        interval = 1.0 / self.target_fps if self.target_fps else 0.0
+        next_at = time.perf_counter()
+        while not self._stop.is_set():
+            if interval:
+                time.sleep(max(0.0, next_at - time.perf_counter()))
+                next_at = max(next_at + interval, time.perf_counter())
+
+            frame = self.frames.get_latest()
+            if frame is None:
+                break
+            try:
+                detections = self.predict(frame.image)
+            except Exception:
+                self.errors += 1
+                logger.exception(f"[{self.name}] inference failed on frame {frame.index}")
+                continue
+
+            latency = time.perf_counter() - frame.captured_at
+            self.inferred += 1
+            self.latencies.append(latency)
+            if self.on_result:
+                try:
+                    self.on_result(frame.index, detections, latency)
+                except Exception:
+                    logger.exception(f"[{self.name}] on_result failed")
+        self.finished_at = time.perf_counter()
+
+    # ---- reporting ----
+
+    def stats(self) -> Dict[str, Any]:
+        end = self.finished_at or time.perf_counter()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        latencies = np.asarray(self.latencies) * 1000
+        return {
+            "received": self.received,
+            "decoded": self.decoded,
+            "inferred": self.inferred,
+            "dropped": self.frames.dropped + self._encoded.dropped,
+            "errors": self.errors,
+            "seconds": round(elapsed, 3),
+            "fps": round(self.inferred / elapsed, 2) if elapsed else 0.0,
+            "latency_p50_ms": round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+            "latency_p95_ms": round(float(np.percentile(latencies, 95)), 1) if len(latencies) else None,
+        }
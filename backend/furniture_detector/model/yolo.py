@@ -1,6 +1,23 @@
-import torch
-from ultralytics import YOLO
+import contextlib
+import numpy as np
+from warnings import warn
 from .base_model_for_registry import BaseModel
+from .detections import Detections
+from .prefetch import DEFAULT_DEPTH, DEFAULT_WORKERS, Prefetcher
+from . import ops
+
+PRECISIONS = ("fp32", "fp16", "bf16", "int8")
+
+# tiled inference settings (the `tiling` entry of a model's config), see YOLOModel.predict_tiled
+TILING_DEFAULTS = {
+    "tile_size": None,    # px, default: imgsz (tiles then run without resizing)
+    "overlap": 0.2,       # fraction of tile_size shared by neighbouring tiles
+    "batch_size": None,   # tiles per forward pass, default: batch_size; bounds peak memory
+    "min_side": None,     # only images with a longer side are tiled, default: 2 * tile_size
+    "iou": 0.5,           # cross-tile NMS threshold
+    "metric": "ios",      # "ios" also merges boxes cut at tile borders, or "iou"
+    "full_image": True,   # also run the downscaled whole image, for objects larger than a tile
+}
 
 
 class YOLOModel(BaseModel):
@@ -12,64 +29,325 @@ class YOLOModel(BaseModel):
         self.model_path = model_path
         self.device = device
         self.model = None
+        self.batch_size = 1
+        self.imgsz = 640
+        self.precision = "fp32"
+        self.tiling = None
+        self.prefetch_depth = DEFAULT_DEPTH
+        self.prefetch_workers = DEFAULT_WORKERS
+        self._prefetcher = None
 
-    def load_model(self, **kwargs):
+    def load_model(self, batch_size: int = 1, imgsz: int = 640, precision: str = "fp32", tiling: dict = None,
+                   prefetch_depth: int = DEFAULT_DEPTH, prefetch_workers: int = DEFAULT_WORKERS, **kwargs):
         """
         Load YOLOv8 model.
+        `batch_size` is the largest batch `predict_batch` will run in one forward pass.
+        `precision`:
+            fp32 - full precision
+            fp16 - half-precision weights and inference (CUDA only, falls back to fp32 on CPU)
+            bf16 - bfloat16 autocast inference, weights stay fp32 (CPU or CUDA with bf16 support)
+            int8 - not available for the PyTorch path, use ONNXModel with precision: int8
+        `tiling`: enables tiled inference of large images, keys as in TILING_DEFAULTS.
+        `prefetch_depth` / `prefetch_workers`: batches decoded ahead by how many threads
+        in `predict_batch` / `stream_folder`, see model.prefetch; depth 0 disables it.
         """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision}. Expected one of {PRECISIONS}")
+        if precision == "int8":
+            raise ValueError("YOLOModel has no int8 variant (PyTorch dynamic quantization doesn't cover "
+                             "convolutions), use class: ONNXModel with precision: int8")
+
+        self.batch_size = batch_size
+        self.imgsz = imgsz
+        self.tiling = self._tiling_config(tiling) if tiling else None
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_workers = prefetch_workers
+        self._close_prefetcher()
+
+        # heavy imports stay out of module import time
+        import torch
+        from ultralytics import YOLO
+
         self.model = YOLO(self.model_path)
         self.model.to(self.device)
-        print(f"[YOLOModel] Loaded model from {self.model_path} on device {self.device}")
+
+        on_cuda = next(self.model.model.parameters()).device.type == "cuda"
+        if precision == "fp16" and not on_cuda:
+            warn(f"[YOLOModel] fp16 needs CUDA, loading {self.model_path} in fp32")
+            precision = "fp32"
+        if precision == "bf16" and on_cuda and not torch.cuda.is_bf16_supported():
+            warn(f"[YOLOModel] bf16 isn't supported on this GPU, loading {self.model_path} in fp32")
+            precision = "fp32"
+        if precision == "fp16":
+            self.model.model.half()
+        self.precision = precision
+
+        print(f"[YOLOModel] Loaded model from {self.model_path} on device {self.device} ({self.precision})")
 
     def unload_model(self):
         """
         Free GPU memory used by YOLO.
         """
+        self._close_prefetcher()
         if self.model is not None:
+            import torch
+
             del self.model
             torch.cuda.empty_cache()
             self.model = None
             print(f"[YOLOModel] Unloaded model from {self.model_path}")
 
+    def warmup(self, iterations: int = 2, **kwargs):
+        """
+        Run dummy inferences at `imgsz` with the configured batch size.
+        """
+        if self.model is None:
+            raise RuntimeError("Model is not loaded. Call load_model() first.")
+
+        dummy = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+        for _ in range(iterations):
+            self._predict([dummy] * self.batch_size, batch=self.batch_size)
+
+    def _predict(self, source, **kwargs):
+        """
+        `model.predict` with this instance's device, input size and precision.
+        """
+        if self.precision == "fp16":
+            # only passed when needed: ultralytics 8.4 warns that `half` is deprecated on every call
+            kwargs["half"] = True
+        with self._precision_context():
+            return self.model.predict(source=source, device=self.device, imgsz=self.imgsz, verbose=False, **kwargs)
+
+    def _precision_context(self):
+        if self.precision != "bf16":
+            return contextlib.nullcontext()
+        import torch
+
+        device_type = next(self.model.model.parameters()).device.type
+        return torch.autocast(device_type=device_type, dtype=torch.bfloat16)
+
+    def memory_footprint(self):
+        """
+        Bytes held by the model's parameters and buffers.
+        """
+        if self.model is None:
+            return None
+        module = self.model.model
+        tensors = list(module.parameters()) + list(module.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+    def class_names(self) -> dict:
+        if self.model is None:
+            return {}
+        return dict(self.model.names)
+
     def predict_image(self, image_path: str, save_path: str = None):
         """
-        Run inference on a single image.
+        Run inference on a single image (tiled if tiling is configured and the image is large).
+        Returns columnar `Detections`; call `.to_dicts()` for JSON.
+        """
+        if self.model is None:
+            raise RuntimeError("Model is not loaded. Call load_model() first.")
+
+        if self.tiling:
+            image = ops.load_image(image_path)
+            if self._needs_tiling(image):
+                return self.predict_tiled(image)
+            image_path = image
+
+        results = self._predict(image_path, save=bool(save_path))
+
+        return Detections.concat([Detections.from_boxes(r.boxes) for r in results])
+
+    def predict_batch(self, image_paths: list, save_path: str = None):
+        """
+        Run inference on several images in batched forward passes.
+        Returns one `Detections` per image, in input order.
+        """
+        if self.model is None:
+            raise RuntimeError("Model is not loaded. Call load_model() first.")
+
+        if self.tiling:
+            return self._predict_batch_tiled(image_paths, save_path=save_path)
+
+        if self.prefetch_depth and not save_path and len(image_paths) > self.batch_size:
+            return [detections for _, detections in self._predict_prefetched(image_paths)]
+
+        batch = max(1, min(len(image_paths), self.batch_size))
+        results = self._predict(image_paths, save=bool(save_path), batch=batch)
+
+        return [Detections.from_boxes(r.boxes) for r in results]
+
+    def _predict_prefetched(self, sources: list, batch_size: int = None):
+        """
+        Yields (source, Detections) in input order. The next batches are read,
+        decoded and resized by a Prefetcher while the current one runs; ultralytics
+        then only pads them to the stride.
+        """
+        for batch in self.prefetcher.batches(sources, batch_size):
+            results = self._predict(batch.images, batch=len(batch))
+            for i, (source, r) in enumerate(zip(batch.sources, results)):
+                detections = Detections.from_boxes(r.boxes)
+                detections.boxes = batch.unletterbox(i, detections.boxes)
+                yield source, detections
+            # the batch's buffers are reused once the generator resumes
+            del results
+
+    @property
+    def prefetcher(self) -> Prefetcher:
+        """ This instance's Prefetcher, created on first use; its buffers are reused by every call. """
+        if self._prefetcher is None:
+            self._prefetcher = Prefetcher(self.imgsz, self.batch_size, depth=self.prefetch_depth,
+                                          workers=self.prefetch_workers, pad=False)
+        return self._prefetcher
+
+    def _close_prefetcher(self):
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
+
+    # ---- tiled inference ----
+
+    def _tiling_config(self, tiling: dict) -> dict:
+        unknown = set(tiling) - set(TILING_DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown tiling options: {sorted(unknown)}. Expected {sorted(TILING_DEFAULTS)}")
+        config = {**TILING_DEFAULTS, **tiling}
+        config["tile_size"] = config["tile_size"] or self.imgsz
+        config["batch_size"] = config["batch_size"] or self.batch_size
+        config["min_side"] = config["min_side"] or 2 * config["tile_size"]
+        return config
+
+    def _needs_tiling(self, image: np.ndarray) -> bool:
+        return max(image.shape[:2]) > self.tiling["min_side"]
+
+    def predict_tiled(self, image) -> Detections:
+        """
+        Run inference on overlapping `tile_size` tiles of an image (path or BGR array),
+        `batch_size` tiles per forward pass, and merge them with a class-aware
+        cross-tile NMS. Boxes are in full-image coordinates.
+        Peak inference memory depends on the tile batch, not the image size;
+        latency grows linearly with the number of tiles.
         """
         if self.model is None:
             raise RuntimeError("Model is not loaded. Call load_model() first.")
 
-        results = self.model.predict(source=image_path, device=self.device, save=bool(save_path))
+        config = self.tiling or self._tiling_config({})
+        image = ops.load_image(image)
+        height, width = image.shape[:2]
+        tile = config["tile_size"]
+        origins = ops.tile_origins(width, height, tile, config["overlap"])
+
+        parts = []
+        if config["full_image"]:
+            parts.extend(Detections.from_boxes(r.boxes) for r in self._predict(image))
 
-        detections = []
-        for r in results:
-            for box in r.boxes:
-                detections.append({
-                    "class_id": int(box.cls),
-                    "confidence": float(box.conf),
-                    "bbox": box.xyxy[0].tolist()  # [x1, y1, x2, y2]
-                })
+        step = max(1, config["batch_size"])
+        for start in range(0, len(origins), step):
+            chunk = origins[start:start + step]
+            tiles = [np.ascontiguousarray(image[y:y + tile, x:x + tile]) for x, y in chunk]
+            results = self._predict(tiles, batch=len(tiles))
+            parts.extend(Detections.from_boxes(r.boxes).shifted(x, y) for (x, y), r in zip(chunk, results))
+            del tiles, results
 
+        merged = Detections.concat(parts)
+        keep = ops.nms(merged.boxes, merged.confidences, config["iou"], class_ids=merged.class_ids,
+                       metric=config["metric"])
+        return merged.take(keep)
+
+    def _predict_batch_tiled(self, image_paths: list, save_path: str = None) -> list:
+        """
+        Large images are tiled one by one, the others still share batched forward passes.
+        """
+        images = [ops.load_image(p) for p in image_paths]
+        detections = [None] * len(images)
+        small = []
+        for i, image in enumerate(images):
+            if self._needs_tiling(image):
+                detections[i] = self.predict_tiled(image)
+            else:
+                small.append(i)
+        if small:
+            batch = max(1, min(len(small), self.batch_size))
+            results = self._predict([images[i] for i in small], save=bool(save_path), batch=batch)
+            for i, r in zip(small, results):
+                detections[i] = Detections.from_boxes(r.boxes)
         return detections
 
     def predict_folder(self, folder_path: str, save_path: str = "outputs"):
         """
         Run inference on all images in a folder.
+        Returns {image_path: Detections}. Prefer `stream_folder` for large folders.
+        """
+        return dict(self.stream_folder(folder_path, save_path=save_path))
+
+    def stream_folder(self, folder_path: str, save_path: str = None, batch_size: int = None,
+                      progress_callback=None):
+        """
+        Lazily run inference on all images in a folder.
+        Yields (image_path, Detections) as each image completes; only one batch
+        of decoded images and Results is held in memory at a time.
+        Annotated images are written under `save_path` only if it is given;
+        otherwise upcoming batches are prefetched (see `_predict_prefetched`).
+        `progress_callback(processed, image_path)` is called after every image.
         """
         if self.model is None:
             raise RuntimeError("Model is not loaded. Call load_model() first.")
 
-        results = self.model.predict(source=folder_path, device=self.device, save=True, project=save_path)
-        
-        detections = []
-        for r in results:
-            for box in r.boxes:
-                detections.append({
-                    "class_id": int(box.cls),
-                    "confidence": float(box.conf),
-                    "bbox": box.xyxy[0].tolist()  # [x1, y1, x2, y2]
-                })
-                
-        return detections
+        if self.tiling:
+            yield from self._stream_folder_tiled(folder_path, batch_size, progress_callback)
+            return
+
+        if self.prefetch_depth and not save_path:
+            paths = ops.list_images(folder_path)
+            for processed, (image_path, detections) in enumerate(
+                    self._predict_prefetched(paths, batch_size), start=1):
+                if progress_callback:
+                    progress_callback(processed, image_path)
+                yield image_path, detections
+            return
+
+        results = self._predict(folder_path, save=bool(save_path), project=save_path,
+                                batch=batch_size or self.batch_size, stream=True)
+
+        for processed, r in enumerate(self._iter_with_precision(results), start=1):
+            detections = Detections.from_boxes(r.boxes)
+            image_path = r.path
+            del r
+            if progress_callback:
+                progress_callback(processed, image_path)
+            yield image_path, detections
+
+    def _iter_with_precision(self, results):
+        """
+        Streamed results run lazily, so the precision context must wrap each step.
+        """
+        iterator = iter(results)
+        while True:
+            with self._precision_context():
+                r = next(iterator, None)
+            if r is None:
+                return
+            yield r
+
+    def _stream_folder_tiled(self, folder_path: str, batch_size: int = None, progress_callback=None):
+        paths = ops.list_images(folder_path)
+        step = batch_size or self.batch_size
+        processed = 0
+        for start in range(0, len(paths), step):
+            chunk = paths[start:start + step]
+            for image_path, detections in zip(chunk, self._predict_batch_tiled(chunk)):
+                processed += 1
+                if progress_callback:
+                    progress_callback(processed, image_path)
+                yield image_path, detections
+
+    @staticmethod
+    def count_images(folder_path: str) -> int:
+        """
+        Number of files in `folder_path` that `stream_folder` will process.
+        """
+        return len(ops.list_images(folder_path))
 
 
     # camera feature
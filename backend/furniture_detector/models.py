@@ -7,13 +7,32 @@ class Picture(models.Model):
 
     detected_data = models.JSONField(blank=True, null=True)
 
+    # sha256 of the uploaded bytes + the model that produced detected_data,
+    # used to serve repeat uploads from the detection cache
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    model_name = models.CharField(max_length=100, blank=True, null=True)
+    model_version = models.CharField(max_length=64, blank=True, null=True)
+
+    # when uploads are downscaled, image_path is the model-ready copy and
+    # detected_data is mapped back to original coordinates with scale_factor
+    # (stored width / original width) and scale_factor_y (heights)
+    original_path = models.CharField(max_length=255, blank=True, null=True)
+    original_width = models.PositiveIntegerField(blank=True, null=True)
+    original_height = models.PositiveIntegerField(blank=True, null=True)
+    scale_factor = models.FloatField(default=1.0)
+    scale_factor_y = models.FloatField(default=1.0)
+
+    task = models.ForeignKey("Task", on_delete=models.CASCADE, related_name="pictures", blank=True, null=True)
+
     def __str__(self):
         return f"Picture {self.id}"
 
 
 class Task(models.Model):
     id = models.CharField(max_length=100, primary_key=True)
-    session_id = models.CharField(max_length=100)
+    session_id = models.CharField(max_length=100, db_index=True)
+    # last progress event of the task (queued, decoding, decoding_finished, failed)
+    status = models.CharField(max_length=32, default="queued")
 
     def __str__(self):
         return f"Task {self.id} (session {self.session_id})"
@@ -25,8 +44,25 @@ class Furniture(models.Model):
     y = models.FloatField(blank=True, null=True)
     z = models.FloatField(blank=True, null=True)
 
+    # one detection: class, confidence and box (x1, y1, x2, y2) in original-image px
+    class_id = models.IntegerField(blank=True, null=True)
+    confidence = models.FloatField(blank=True, null=True)
+    x1 = models.FloatField(blank=True, null=True)
+    y1 = models.FloatField(blank=True, null=True)
+    x2 = models.FloatField(blank=True, null=True)
+    y2 = models.FloatField(blank=True, null=True)
+
     picture = models.ForeignKey(Picture, on_delete=models.CASCADE, related_name="furnitures")
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name="furnitures")
 
+    class Meta:
+        indexes = [
+            # "all sofas of task / session X", optionally above a confidence
+            models.Index(fields=["task", "name", "confidence"], name="furniture_task_name_conf"),
+            # "everything above a confidence for task Y"
+            models.Index(fields=["task", "confidence"], name="furniture_task_conf"),
+            models.Index(fields=["picture", "confidence"], name="furniture_picture_conf"),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.id})"
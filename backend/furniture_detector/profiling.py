@@ -0,0 +1,235 @@
+"""
+Opt-in profiling of single `process_image` runs.
+
+A profiled run (the `profile` upload field, or a PROFILE_SAMPLE_RATE fraction
+of uploads) is captured with:
+- StackSampler: a stdlib sampling profiler reading `sys._current_frames()`
+  every PROFILE_INTERVAL_MS for the task thread and the inference helper
+  threads (prefetch, replicas)
+- torch.profiler operator profiling (PROFILE_TORCH) of the forward pass, which
+  then runs on the task thread (the torch profiler only records the thread
+  that started it) instead of going through the micro-batcher
+
+Artifacts are written next to the picture (`<picture_id>.jpg`):
+    <picture_id>.profile.json   summary: wall time per stage, top functions / operators
+    <picture_id>.stacks.txt     collapsed stacks (flamegraph.pl, speedscope)
+    <picture_id>.torch.json     torch operator trace (chrome://tracing, Perfetto)
+
+Unprofiled runs don't touch this module beyond one `if`.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from django.conf import settings
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# helper threads whose stacks are sampled along with the task thread
+SAMPLED_THREAD_PREFIXES = ("prefetch", "replica-")
+TOP_N = 25
+
+
+def requested(value) -> bool:
+    """ Truthy `profile` form / JSON field. """
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def sampled() -> bool:
+    """ True for a PROFILE_SAMPLE_RATE fraction of calls. """
+    rate = settings.PROFILE_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+def artifact_paths(image_path: str) -> Dict[str, str]:
+    base = os.path.splitext(image_path)[0]
+    return {
+        "summary": f"{base}.profile.json",
+        "stacks": f"{base}.stacks.txt",
+        "torch_trace": f"{base}.torch.json",
+    }
+
+
+def load_summary(image_path: str) -> Optional[Dict[str, Any]]:
+    """ The stored summary of a picture's profiled run, or None. """
+    path = artifact_paths(image_path)["summary"]
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of the threads it watches every `interval` seconds
+    from a background thread. Stacks are kept as collapsed
+    "thread;outer;...;inner" -> count, functions as "name (dir/file.py:line)".
+    """
+
+    def __init__(self, interval: float = 0.005, thread_ids: List[int] = None,
+                 thread_prefixes=SAMPLED_THREAD_PREFIXES):
+        self.interval = interval
+        self.thread_ids = set(thread_ids or [threading.get_ident()])
+        self.thread_prefixes = tuple(thread_prefixes)
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _watched(self) -> Dict[int, str]:
+        return {
+            t.ident: t.name for t in threading.enumerate()
+            if t.ident in self.thread_ids or t.name.startswith(self.thread_prefixes)
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            watched = self._watched()
+            for ident, frame in sys._current_frames().items():
+                if ident not in watched:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(watched[ident])
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    @staticmethod
+    def _label(code) -> str:
+        path = code.co_filename.replace(os.sep, "/").rsplit("/", 2)
+        return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+    def top_functions(self, n: int = TOP_N) -> List[Dict[str, Any]]:
+        """ Functions by samples on top of the stack (self) and anywhere in it (total). """
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for function in set(frames):
+                total[function] += count
+        samples = sum(self.stacks.values()) or 1
+        return [
+            {
+                "function": function,
+                "self_samples": own[function],
+                "total_samples": count,
+                "self_pct": round(100.0 * own[function] / samples, 1),
+                "total_pct": round(100.0 * count / samples, 1),
+            }
+            for function, count in sorted(total.items(), key=lambda item: (-own[item[0]], -item[1]))[:n]
+        ]
+
+    def write_collapsed(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _torch_profiler():
+    import torch
+    from torch.profiler import ProfilerActivity, profile
+
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+    return profile(activities=activities, record_shapes=True)
+
+
+def _top_operators(profiler, n: int = TOP_N) -> List[Dict[str, Any]]:
+    events = sorted(profiler.key_averages(), key=lambda e: e.self_cpu_time_total, reverse=True)
+    return [
+        {
+            "operator": e.key,
+            "calls": e.count,
+            "self_cpu_ms": round(e.self_cpu_time_total / 1000, 3),
+            "cpu_total_ms": round(e.cpu_time_total / 1000, 3),
+            "device_total_ms": round(getattr(e, "device_time_total", 0) / 1000, 3),
+        }
+        for e in events[:n]
+    ]
+
+
+@contextmanager
+def capture(picture, timer, torch_ops: bool = True):
+    """
+    Profiles the block and writes the picture's artifacts, also when it raises.
+    `timer` is the run's StageTimer; profiler start-up is marked as its
+    "profiler_setup" stage and its stages are read once the block exits.
+    """
+    paths = artifact_paths(picture.image_path)
+    start = time.perf_counter()
+    sampler = StackSampler(interval=settings.PROFILE_INTERVAL_MS / 1000.0)
+    torch_profiler = None
+    if torch_ops and settings.PROFILE_TORCH:
+        try:
+            torch_profiler = _torch_profiler()
+            torch_profiler.__enter__()
+        except Exception as e:
+            logger.warning(f"torch profiler unavailable: {e}")
+            torch_profiler = None
+
+    # starting the torch profiler can take seconds, keep it out of the next stage
+    timer.mark("profiler_setup")
+    error = None
+    sampler.start()
+    try:
+        yield
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        wall = time.perf_counter() - start
+        sampler.stop()
+        if torch_profiler is not None:
+            torch_profiler.__exit__(None, None, None)
+        try:
+            _write_artifacts(picture, timer, sampler, torch_profiler, paths, wall, error)
+        except Exception:
+            logger.exception(f"Couldn't write the profile of picture {picture.id}")
+
+
+def _write_artifacts(picture, timer, sampler, torch_profiler, paths, wall, error):
+    sampler.write_collapsed(paths["stacks"])
+    artifacts = {"stacks": os.path.basename(paths["stacks"])}
+    operators = None
+    if torch_profiler is not None:
+        torch_profiler.export_chrome_trace(paths["torch_trace"])
+        artifacts["torch_trace"] = os.path.basename(paths["torch_trace"])
+        operators = _top_operators(torch_profiler)
+
+    summary = {
+        "picture_id": picture.id,
+        "task_id": picture.task_id,
+        "profiled_at": time.time(),
+        "wall_seconds": round(wall, 4),
+        "stages": timer.as_dict(),
+        "error": error,
+        "sampler": {"interval_ms": round(sampler.interval * 1000, 3), "samples": sampler.samples},
+        "top_functions": sampler.top_functions(),
+        "top_operators": operators,
+        "artifacts": artifacts,
+    }
+    with open(paths["summary"], "w") as f:
+        json.dump(summary, f, indent=2)
+    logger.info(f"Profiled picture {picture.id} in {wall:.3f}s: {paths['summary']}")
@@ -0,0 +1,198 @@
+"""
+Progress events for the WebSocket clients (see consumers.TaskProgressConsumer).
+
+Events are handed to a `ProgressEmitter` that sends them from a background
+event loop, so a task never waits on the channel layer (Redis) while it
+holds a model. The emitter:
+- keeps one event loop, hence one channel layer connection pool, per process
+- throttles each session to one send every PROGRESS_MIN_INTERVAL_MS, sending
+  every event pending for it at that point, in order
+- coalesces events with the same (event, task_id, picture_id, chunk) still
+  pending for a session, keeping the latest at the place of the first
+  (e.g. bursts of folder_progress)
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .model import metrics
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressEmitter:
+    def __init__(self, min_interval: float = 0.1):
+        self.min_interval = min_interval
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread = None
+        self._reset()
+
+    def _reset(self):
+        # loop-thread state, only touched from the loop
+        self._layer = None
+        self._pending: Dict[str, "OrderedDict[tuple, dict]"] = {}
+        self._scheduled: set = set()
+        self._next_send: Dict[str, float] = {}
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+        self._tasks: set = set()
+
+        self.emitted = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    # ---- caller side (any thread) ----
+
+    def emit(self, session_id, event_type: str, **payload):
+        """
+        Queues an event for `progress_<session_id>` and returns immediately.
+        """
+        loop = self._ensure_loop()
+        event = {"type": "task.progress", "event": event_type, **payload}
+        loop.call_soon_threadsafe(self._enqueue, str(session_id), event)
+
+    def flush(self, timeout: float = 5.0):
+        """
+        Sends everything pending now, ignoring the throttle, and waits for it.
+        """
+        if self._loop is None or self._pid != os.getpid():
+            return
+        future = asyncio.run_coroutine_threadsafe(self._drain(), self._loop)
+        try:
+            future.result(timeout=timeout)
+        except Exception as e:
+            logger.error(f"Failed to flush progress events: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "emitted": self.emitted,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "pending": sum(len(p) for p in list(self._pending.values())),
+        }
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # a forked child (prefork pool) inherits the object but not the thread
+            if self._loop is not None and self._pid == os.getpid():
+                return self._loop
+            self._reset()
+            self._pid = os.getpid()
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="progress-emitter", daemon=True)
+            self._thread.start()
+            return self._loop
+
+    # ---- loop side ----
+
+    def _enqueue(self, session_id: str, event: dict):
+        self.emitted += 1
+        pending = self._pending.setdefault(session_id, OrderedDict())
+        key = (event["event"], event.get("task_id"), event.get("picture_id"), event.get("chunk"))
+        if key in pending:
+            # replaced in place: events keep the order in which their kind first became pending
+            self.coalesced += 1
+        pending[key] = event
+
+        if session_id in self._scheduled:
+            return
+        self._scheduled.add(session_id)
+        delay = max(0.0, self._next_send.get(session_id, 0.0) - self._loop.time())
+        self._loop.call_later(delay, self._start_send, session_id)
+
+    def _start_send(self, session_id: str):
+        task = self._loop.create_task(self._send_session(session_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send_session(self, session_id: str):
+        self._scheduled.discard(session_id)
+        lock = self._session_locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            pending = self._pending.pop(session_id, None)
+            if not pending:
+                return
+            self._next_send[session_id] = self._loop.time() + self.min_interval
+
+            layer = self._channel_layer()
+            for event in pending.values():
+                try:
+                    with metrics.timed("ws_publish"):
+                        await layer.group_send(f"progress_{session_id}", event)
+                    self.sent += 1
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Failed to send progress update: {str(e)}")
+
+        self._loop.call_later(self.min_interval, self._forget, session_id)
+
+    def _forget(self, session_id: str):
+        # drop throttle state of sessions that went quiet
+        if session_id in self._pending or session_id in self._scheduled:
+            return
+        if self._next_send.get(session_id, 0.0) <= self._loop.time():
+            self._next_send.pop(session_id, None)
+            lock = self._session_locks.get(session_id)
+            if lock is not None and not lock.locked():
+                del self._session_locks[session_id]
+
+    def _channel_layer(self):
+        if self._layer is None:
+            self._layer = get_channel_layer()
+        return self._layer
+
+    async def _drain(self):
+        for session_id in list(self._pending):
+            await self._send_session(session_id)
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+class StageTimer:
+    """
+    Per-stage wall time of one job, in seconds:
+        queued       upload -> task start (from `queued_at`, a time.time() set by the web tier)
+        model_ready  model loaded / leased
+        inference    forward pass
+        saved        results persisted
+    Stages in METRIC_STAGES are also recorded in the fengshui_stage_seconds histogram.
+    """
+
+    # "saved" is recorded finer-grained by save_detections (postprocess, db_save)
+    METRIC_STAGES = {"queued": "queue_wait", "model_ready": "model_acquire", "inference": "inference"}
+
+    def __init__(self, queued_at: float = None):
+        self.started_at = time.time()
+        self._last = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        if queued_at:
+            self._record("queued", max(self.started_at - queued_at, 0.0))
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        self._record(stage, now - self._last)
+        self._last = now
+
+    def _record(self, stage: str, seconds: float):
+        self.stages[stage] = round(seconds, 4)
+        if stage in self.METRIC_STAGES:
+            metrics.observe(self.METRIC_STAGES[stage], seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        return dict(self.stages)
+
+
+progress_emitter = ProgressEmitter(
+    min_interval=getattr(settings, "PROGRESS_MIN_INTERVAL_MS", 100) / 1000.0,
+)
+atexit.register(progress_emitter.flush)
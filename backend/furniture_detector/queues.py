@@ -0,0 +1,156 @@
+"""
+Model-affinity routing of inference tasks to Celery queues.
+
+Queues are derived from the models YAML, by MODEL_QUEUES:
+    model      (default) one queue per model, "model.<model name>"
+    category   one queue per model category, "category.<category>"
+    off        every task on the default queue
+A model's `queue:` entry overrides its queue, e.g. to group small models.
+
+Only the models of the preload list (`preload` in the YAML, or PRELOAD_MODELS,
+as the web tier sees it) get a queue: those are the models workers keep
+resident and subscribe to by default. Tasks of every other model go to the
+default queue, which all workers consume and load models for on demand, so
+no task is ever routed to a queue nobody listens to.
+
+`route_task` (CELERY_TASK_ROUTES) sends every task taking a `model_name`
+(process_image, process_batch, process_folder, process_video) to the queue of
+that model; the others (e.g. the finish_batch chord callback) stay on the
+default queue.
+
+Workers consume the default queue plus the queues of their models
+(`worker_queues`): WORKER_MODELS if set, else the models they preload and
+keep resident. A worker with neither serves every model queue. See them with
+`celery -A core inspect active_queues`.
+"""
+from typing import Dict, List, Optional
+from django.conf import settings
+import inspect
+import logging
+from .model.registry import ModelManager
+
+logger = logging.getLogger(__name__)
+
+MODES = ("model", "category", "off")
+
+# task name -> signature of its run(), for finding its model_name argument
+_signatures: Dict[str, Optional[inspect.Signature]] = {}
+
+
+def _mode() -> str:
+    mode = (settings.MODEL_QUEUES or "off").lower()
+    if mode not in MODES:
+        raise ValueError(f"Unknown MODEL_QUEUES: {settings.MODEL_QUEUES}. Expected one of {MODES}")
+    return mode
+
+
+def _category(model_name: str) -> Optional[str]:
+    for category, names in ModelManager.list_models().items():
+        if model_name in names:
+            return category
+    return None
+
+
+def routed_models() -> List[str]:
+    """ Models with a queue of their own: the preload list, which workers subscribe to by default. """
+    return ModelManager.preload_list()
+
+
+def queue_for(model_name: str) -> Optional[str]:
+    """
+    Queue of a model's tasks, None for the default queue (routing off, unknown
+    model, or a model outside the preload list).
+    """
+    mode = _mode()
+    if mode == "off" or not model_name or model_name not in routed_models():
+        return None
+    try:
+        model_info = ModelManager.get_model_info(model_name)
+    except ValueError:
+        return None
+    if model_info.get("queue"):
+        return model_info["queue"]
+    if mode == "category":
+        category = _category(model_name)
+        return f"category.{category}" if category else None
+    return f"model.{model_name}"
+
+
+def model_queues(model_names: List[str] = None) -> List[str]:
+    """ Distinct queues of `model_names` (default: every configured model), in config order. """
+    if model_names is None:
+        model_names = [name for names in ModelManager.list_models().values() for name in names]
+    queues = []
+    for model_name in model_names:
+        queue = queue_for(model_name)
+        if queue and queue not in queues:
+            queues.append(queue)
+    return queues
+
+
+def worker_models() -> List[str]:
+    """ Models this worker serves: WORKER_MODELS (comma separated) if set, else its preload list. """
+    if settings.WORKER_MODELS is not None:
+        return [name.strip() for name in settings.WORKER_MODELS.split(",") if name.strip()]
+    return ModelManager.preload_list()
+
+
+def worker_queues() -> List[str]:
+    """ Model queues this worker consumes besides the default queue: its models', else all of them. """
+    return model_queues(worker_models() or None)
+
+
+def _signature(task) -> Optional[inspect.Signature]:
+    if task.name not in _signatures:
+        try:
+            _signatures[task.name] = inspect.signature(task.run)
+        except (TypeError, ValueError):
+            _signatures[task.name] = None
+    return _signatures[task.name]
+
+
+def _model_name_argument(task, args, kwargs) -> Optional[str]:
+    if task is None:
+        return kwargs.get("model_name")
+    signature = _signature(task)
+    if signature is None or "model_name" not in signature.parameters:
+        return None
+    try:
+        bound = signature.bind_partial(*(args or ()), **(kwargs or {}))
+    except TypeError:
+        return None
+    if "model_name" in bound.arguments:
+        return bound.arguments["model_name"]
+    default = signature.parameters["model_name"].default
+    return None if default is inspect.Parameter.empty else default
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """ Celery router: tasks with a `model_name` argument go to that model's queue. """
+    queue = queue_for(_model_name_argument(task, args, kwargs or {}))
+    return {"queue": queue} if queue else None
+
+
+def subscribe_worker(worker):
+    """
+    Makes a worker started without -Q consume the default queue and its model
+    queues (an explicit -Q is left as is). Called on `worker_init`, before the
+    worker connects.
+    """
+    queues = worker.app.amqp.queues
+    if _mode() == "off":
+        return
+    # without -Q, consume_from is the queue set itself
+    if queues.consume_from is not queues:
+        logger.info(f"Model queues not subscribed: worker started with -Q {sorted(queues.consume_from)}")
+        return
+
+    unrouted = [name for name in worker_models() if name not in routed_models()]
+    if unrouted:
+        logger.warning(f"{unrouted} are not in the preload list: they have no queue of their own, "
+                       f"their tasks come from the default queue")
+
+    names = [worker.app.conf.task_default_queue] + worker_queues()
+    # missing queues are declared as the router declares them
+    queues.select(names)
+    logger.info(f"Worker consuming from {names} (models: {worker_models() or 'all'})")
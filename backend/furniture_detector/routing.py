@@ -4,4 +4,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r"ws/progress/(?P<session_id>[^/]+)/", consumers.TaskProgressConsumer.as_asgi()),
+    re_path(r"ws/frames/(?P<session_id>[^/]+)/", consumers.FrameStreamConsumer.as_asgi()),
 ]
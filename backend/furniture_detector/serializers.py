@@ -1,4 +1,54 @@
+from django.conf import settings
 from rest_framework import serializers
+from .models import Furniture
+import os
 
 class UploadSerializer(serializers.Serializer):
-    file = serializers.ImageField()
\ No newline at end of file
+    file = serializers.ImageField()
+
+# container signatures: (offset, bytes)
+VIDEO_SIGNATURES = [
+    (4, b"ftyp"),               # mp4 / mov / m4v
+    (4, b"moov"),               # older QuickTime
+    (0, b"\x1a\x45\xdf\xa3"),   # mkv / webm (EBML)
+    (8, b"AVI "),               # avi (RIFF)
+]
+
+
+class VideoUploadSerializer(serializers.Serializer):
+    file = serializers.FileField()
+
+    def validate_file(self, video):
+        extension = os.path.splitext(video.name or '')[1].lower()
+        if extension not in settings.UPLOAD_VIDEO_EXTENSIONS:
+            raise serializers.ValidationError(
+                f"Unsupported video type {extension or '(none)'}, expected one of {settings.UPLOAD_VIDEO_EXTENSIONS}")
+        if video.content_type and not video.content_type.startswith("video/") \
+                and video.content_type != "application/octet-stream":
+            raise serializers.ValidationError(f"Not a video: {video.content_type}")
+        if video.size > settings.UPLOAD_VIDEO_MAX_BYTES:
+            raise serializers.ValidationError(f"Video larger than {settings.UPLOAD_VIDEO_MAX_BYTES} bytes")
+
+        video.seek(0)
+        head = video.read(12)
+        video.seek(0)
+        if not any(head[offset:offset + len(magic)] == magic for offset, magic in VIDEO_SIGNATURES):
+            raise serializers.ValidationError("Not a video file")
+        return video
+
+
+class BatchUploadSerializer(serializers.Serializer):
+    files = serializers.ListField(
+        child=serializers.ImageField(), allow_empty=False, max_length=settings.UPLOAD_BATCH_MAX_FILES
+    )
+
+
+class FurnitureSerializer(serializers.ModelSerializer):
+    bbox = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Furniture
+        fields = ["id", "name", "class_id", "confidence", "bbox", "x", "y", "z", "picture_id", "task_id"]
+
+    def get_bbox(self, obj):
+        return [obj.x1, obj.y1, obj.x2, obj.y2]
@@ -0,0 +1,42 @@
+"""
+Wiring of model.streaming.StreamPipeline into the app: frames are run through
+the same inference path as uploads (shared inference server or in-process
+micro-batcher) and per-frame detections are pushed to progress_<session_id>.
+
+Frame events share one coalescing key per session in the progress emitter,
+so a client that can't keep up gets the latest frame's detections, not a backlog.
+"""
+from django.conf import settings
+from .model.batching import get_batcher
+from .model.inference_server import get_client
+from .model.registry import ModelManager
+from .model.streaming import StreamPipeline
+from .tasks import send_progress
+
+
+def frame_predictor(model_name: str, model_category: str = 'detection'):
+    """Callable running one BGR frame through the configured inference path."""
+    if settings.INFERENCE_SERVER_SOCKET:
+        socket_path = settings.INFERENCE_SERVER_SOCKET
+        return lambda image: get_client(socket_path).predict_image(
+            image, model_name=model_name, model_category=model_category
+        )
+    # load before frames start flowing, so the first seconds of a stream aren't dropped
+    ModelManager.get_model(model_name=model_name, model_category=model_category)
+    return get_batcher(model_name=model_name, model_category=model_category).predict_image
+
+
+def frame_pipeline(session_id, model_name: str = None, target_fps: float = None) -> StreamPipeline:
+    """A pipeline pushing `frame_detections` events to the session's progress group."""
+    model_name = model_name or settings.DETECTION_MODEL_NAME
+
+    def on_result(frame_index, detections, latency):
+        send_progress(session_id, "frame_detections", frame=frame_index,
+                      latency_ms=round(latency * 1000, 1), detections=detections.to_dicts())
+
+    return StreamPipeline(
+        frame_predictor(model_name), on_result,
+        target_fps=target_fps or settings.STREAM_TARGET_FPS,
+        queue_size=settings.STREAM_QUEUE_SIZE,
+        name=f"stream-{session_id}",
+    )
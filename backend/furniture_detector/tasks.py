@@ -1,26 +1,28 @@
-from celery import shared_task
+from celery import chord, shared_task
+import contextlib
+import json
+import os
 import time
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import transaction
 import logging
+from .cache import detection_cache
+from .model.batching import get_batcher, use_batcher
+from .model.inference_server import get_client
+from .model import metrics
 from .model.registry import ModelManager
-from .models import Task, Picture
+from .models import Furniture, Task, Picture
+from .progress import StageTimer, progress_emitter
+from . import profiling
+from . import worker  # noqa: F401  registers worker startup hooks (model preloading)
 
 logger = logging.getLogger(__name__)
 
 
 def send_progress(session_id, event_type, **kwargs):
-    """Send real-time progress update via WebSocket."""
+    """Queue a real-time progress update for the WebSocket; never blocks on the channel layer."""
     try:
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"progress_{session_id}",
-            {
-                "type": "task.progress",
-                "event": event_type,
-                **kwargs
-            }
-        )
+        progress_emitter.emit(session_id, event_type, **kwargs)
     except Exception as e:
         logger.error(f"Failed to send progress update: {str(e)}")
 
@@ -28,14 +30,93 @@ def send_progress(session_id, event_type, **kwargs):
 def update_job_status(task, status, session_id=None, **kwargs):
     """Update task status, and broadcast progress."""
     task.status = status
-    
+    task.save(update_fields=["status"])
+
     if session_id:
         send_progress(session_id, status, task_id=task.id, **kwargs)
 
 
+def furniture_rows(picture, task_id, results):
+    """Unsaved Furniture rows for `results` (named detection dicts, see `save_detections`) of a picture."""
+    return [
+        Furniture(
+            picture_id=picture.id, task_id=task_id, name=d["name"],
+            class_id=d["class_id"], confidence=d["confidence"],
+            x1=d["bbox"][0], y1=d["bbox"][1], x2=d["bbox"][2], y2=d["bbox"][3],
+        )
+        for d in results
+    ]
 
-@shared_task(bind=True)
-def process_image(self, task_id, picture_id, session_id, path, model_name='furniture_yolo'):
+
+def store_furniture(pictures):
+    """
+    Writes the detections of already processed pictures (e.g. detection cache hits)
+    as Furniture rows with one bulk_create.
+    """
+    rows = []
+    for picture in pictures:
+        if picture.task_id and picture.detected_data:
+            rows.extend(furniture_rows(picture, picture.task_id, picture.detected_data))
+    with metrics.timed("db_save"):
+        Furniture.objects.bulk_create(rows)
+
+
+def named_detections(model_name, detections):
+    """
+    `detections` labelled with their class names: the ones they carry (inference
+    server responses), else the model's (see ModelManager.get_class_names).
+    Names are stored with every detection, so all later readers (Furniture rows,
+    cache hits in the web tier) agree without loading the model.
+    """
+    if detections.names is not None:
+        return detections
+    try:
+        return detections.with_names(ModelManager.get_class_names(model_name))
+    except ValueError as e:
+        raise ValueError(f"{e} of model {model_name}: add `class_names` to its config entry") from e
+
+
+def save_detections(picture, model_name, detections, task=None):
+    """
+    Store named detections on the picture (in original-image coordinates), as
+    its Furniture rows and in the detection cache.
+    """
+    with metrics.timed("postprocess"):
+        detections = named_detections(model_name, detections)
+        scale_x, scale_y = picture.scale_factor or 1.0, picture.scale_factor_y or 1.0
+        if (scale_x, scale_y) != (1.0, 1.0):
+            # the model ran on a downscaled copy, report original-image coordinates
+            detections = detections.scaled(1.0 / scale_x, 1.0 / scale_y)
+        results = detections.to_dicts()
+
+    picture.detected_data = results
+    picture.model_name = model_name
+    picture.model_version = ModelManager.get_model_version(model_name)
+    if task is not None and picture.task_id is None:
+        picture.task_id = task.id
+
+    with metrics.timed("db_save"), transaction.atomic():
+        picture.save()
+        if picture.task_id:
+            # reprocessing replaces the picture's previous detections
+            Furniture.objects.filter(picture_id=picture.id).delete()
+            Furniture.objects.bulk_create(furniture_rows(picture, picture.task_id, results))
+
+    if picture.content_hash and picture.model_version:
+        detection_cache.put(picture.content_hash, model_name, picture.model_version, results)
+    return results
+
+
+# acknowledged once it ran, so it is redelivered if its worker dies: running it again
+# only replaces the picture's detections
+@shared_task(bind=True, acks_late=True)
+def process_image(self, task_id, picture_id, session_id, path, model_name='furniture_yolo', queued_at=None,
+                  profile=False):
+    """
+    Runs one uploaded picture through the model and stores its detections.
+    With `profile`, the run is captured by `profiling.capture` (artifacts next to the picture).
+    """
+    timer = StageTimer(queued_at)
     task = Task.objects.get(id=task_id)
     picture = Picture.objects.get(id=picture_id)
 
@@ -45,15 +126,197 @@ def process_image(self, task_id, picture_id, session_id, path, model_name='furni
     if not picture:
         raise ValueError(f"No picture labeled with id: {picture_id}")
 
-    update_job_status(task, "decoding", session_id=session_id)
+    update_job_status(task, "decoding", session_id=session_id, picture_id=picture.id, stages=timer.as_dict())
 
-    model = ModelManager.get_model(model_name=model_name, model_category='detection')    
+    # operators can only be profiled when the forward pass runs in this process
+    profiler = (profiling.capture(picture, timer, torch_ops=not settings.INFERENCE_SERVER_SOCKET)
+                if profile else contextlib.nullcontext())
+    try:
+        with profiler:
+            if settings.INFERENCE_SERVER_SOCKET:
+                # the node's inference server owns the models; pixels go through shared memory
+                client = get_client(settings.INFERENCE_SERVER_SOCKET)
+                timer.mark("model_ready")
+                detections = client.predict_image(path, model_name=model_name, model_category='detection')
+            elif profile or not use_batcher():
+                # on this thread, unbatched: the torch profiler only records the thread that started it,
+                # and a prefork / solo worker runs one task per process, so a batch would hold one image
+                with ModelManager.lease(model_name=model_name, model_category='detection') as model:
+                    timer.mark("model_ready")
+                    detections = model.predict_image(path)
+            else:
+                # load outside the timed forward pass; a no-op once the model is resident
+                ModelManager.get_model(model_name=model_name, model_category='detection')
+                timer.mark("model_ready")
+                # images from concurrently running tasks (threads/gevent pool) share one forward pass
+                batcher = get_batcher(model_name=model_name, model_category='detection')
+                detections = batcher.predict_image(path)
+            timer.mark("inference")
 
-    results = model.predict_image(path)
+            results = save_detections(picture, model_name, detections, task=task)
+            timer.mark("saved")
+    except Exception as e:
+        update_job_status(task, "failed", session_id=session_id, picture_id=picture.id,
+                          error=str(e), stages=timer.as_dict())
+        raise
 
-    picture.detected_data = results
-    picture.save()
+    update_job_status(task, "decoding_finished", session_id=session_id, picture_id=picture.id,
+                      stages=timer.as_dict())
+
+    return {"status": "done", "results": results, "stages": timer.as_dict()}
+
+
+# acknowledged once it ran, as process_image
+@shared_task(bind=True, acks_late=True)
+def process_batch(self, task_id, session_id, picture_ids, model_name='furniture_yolo', queued_at=None, chunk=0):
+    """
+    One chunk of a batch upload: all its pictures go through one `predict_batch`
+    call. Failures are reported per picture instead of failing the chunk, so the
+    batch's `finish_batch` callback always runs.
+    """
+    timer = StageTimer(queued_at)
+    task = Task.objects.get(id=task_id)
+    pictures = list(Picture.objects.filter(id__in=picture_ids))
+
+    paths = [picture.image_path for picture in pictures]
+    try:
+        if settings.INFERENCE_SERVER_SOCKET:
+            client = get_client(settings.INFERENCE_SERVER_SOCKET)
+            timer.mark("model_ready")
+            detections = _predict_chunk(
+                lambda: client.predict_batch(paths, model_name=model_name, model_category='detection'),
+                lambda path: client.predict_image(path, model_name=model_name, model_category='detection'),
+                pictures)
+        else:
+            with ModelManager.lease(model_name=model_name, model_category='detection') as model:
+                timer.mark("model_ready")
+                detections = _predict_chunk(lambda: model.predict_batch(paths), model.predict_image, pictures)
+    except Exception as e:
+        # e.g. the model failed to load: every picture of the chunk failed
+        logger.error(f"Inference failed for chunk {chunk} of task {task_id}: {e}")
+        detections = [e] * len(pictures)
+    timer.mark("inference")
+
+    failed = []
+    for picture, picture_detections in zip(pictures, detections):
+        try:
+            if isinstance(picture_detections, Exception):
+                raise picture_detections
+            save_detections(picture, model_name, picture_detections, task=task)
+        except Exception as e:
+            logger.error(f"Failed to process picture {picture.id}: {e}")
+            failed.append(picture.id)
+            send_progress(session_id, "picture_failed", task_id=task.id, chunk=chunk, picture_id=picture.id,
+                          error=str(e))
+    timer.mark("saved")
+
+    processed = len(pictures) - len(failed)
+    send_progress(session_id, "batch_progress", task_id=task.id, chunk=chunk, processed=processed,
+                  failed=len(failed), stages=timer.as_dict())
+
+    return {"processed": processed, "failed": failed, "stages": timer.as_dict()}
+
+
+def _predict_chunk(predict_batch, predict_image, pictures) -> list:
+    """
+    Detections of every picture of a chunk, from one batch; if the batch fails,
+    one by one. A picture that fails on its own gets its exception instead.
+    """
+    try:
+        detections = list(predict_batch())
+        if len(detections) != len(pictures):
+            raise RuntimeError(f"{len(detections)} results for a batch of {len(pictures)}")
+        return detections
+    except Exception as e:
+        logger.error(f"Batch inference failed, retrying pictures one by one: {e}")
+
+    detections = []
+    for picture in pictures:
+        try:
+            detections.append(predict_image(picture.image_path))
+        except Exception as e:
+            logger.error(f"Inference failed for picture {picture.id}: {e}")
+            detections.append(e)
+    return detections
+
+
+@shared_task(bind=True)
+def finish_batch(self, chunk_results, task_id, session_id, total, cached=0):
+    """Chord callback of a batch upload: reports its completion once."""
+    task = Task.objects.get(id=task_id)
+    failed = [picture_id for result in chunk_results for picture_id in result["failed"]]
+    processed = sum(result["processed"] for result in chunk_results)
+
+    update_job_status(task, "batch_finished", session_id=session_id, total=total,
+                      processed=processed + cached, cached=cached, failed=failed)
+
+    return {"status": "done", "processed": processed, "cached": cached, "failed": failed}
+
+
+def submit_batch(task_id, session_id, picture_ids, model_name, total, cached=0, chunk_size=8):
+    """
+    Submits a batch upload as one Celery chord: a `process_batch` task per
+    `chunk_size` pictures, then `finish_batch` once they are all done.
+    """
+    queued_at = time.time()
+    chunks = [picture_ids[i:i + chunk_size] for i in range(0, len(picture_ids), chunk_size)]
+    job = chord(
+        (process_batch.s(task_id, session_id, chunk, model_name, queued_at=queued_at, chunk=index)
+         for index, chunk in enumerate(chunks)),
+        finish_batch.s(task_id, session_id, total, cached=cached),
+    )
+    return job.apply_async()
+
+
+@shared_task(bind=True)
+def process_video(self, session_id, video_path, model_name='furniture_yolo', target_fps=None,
+                  realtime=True, max_frames=None):
+    """
+    Headless inference on a video file: decoded on its own thread, at most
+    `target_fps` frames inferred per second (stale frames dropped), detections
+    pushed per frame as `frame_detections`, stats reported as `video_finished`.
+    """
+    from .streams import frame_pipeline
+
+    if not os.path.exists(video_path):
+        raise ValueError(f"No video at path: {video_path}")
+
+    pipeline = frame_pipeline(session_id, model_name=model_name, target_fps=target_fps)
+    send_progress(session_id, "video_started", video=video_path)
+    stats = pipeline.run_video(video_path, realtime=realtime, max_frames=max_frames)
+    send_progress(session_id, "video_finished", **stats)
+
+    return {"status": "done", **stats}
+
+
+@shared_task(bind=True)
+def process_folder(self, session_id, folder_path, model_name='furniture_yolo', save_path=None,
+                   output_path=None, progress_every=25):
+    """
+    Bulk re-processing of a folder of images.
+    Detections are streamed image by image; each one is appended to `output_path`
+    as a JSON line (if given) and progress is broadcast every `progress_every` images.
+    """
+    if not os.path.isdir(folder_path):
+        raise ValueError(f"No folder at path: {folder_path}")
+
+    processed = 0
+    with ModelManager.lease(model_name=model_name, model_category='detection') as model:
+        total = model.count_images(folder_path)
+
+        send_progress(session_id, "folder_started", folder=folder_path, total=total)
+
+        def report(processed, image_path):
+            if processed % progress_every == 0 or processed == total:
+                send_progress(session_id, "folder_progress", processed=processed, total=total, image=image_path)
+
+        with open(output_path, "w") if output_path else contextlib.nullcontext() as out:
+            for image_path, detections in model.stream_folder(folder_path, save_path=save_path,
+                                                               progress_callback=report):
+                processed += 1
+                if out:
+                    out.write(json.dumps({"image": image_path, "detections": detections.to_dicts()}) + "\n")
 
-    update_job_status(task, "decoding_finished", session_id=session_id)
+    send_progress(session_id, "folder_finished", processed=processed, total=total)
 
-    return {"status": "done", "results": results}
+    return {"status": "done", "processed": processed, "output": output_path}
@@ -1,3 +1,1731 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from concurrent.futures import TimeoutError
+from PIL import Image
+from unittest import mock
+import hashlib
+import io
+import json
+import numpy as np
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from .cache import DetectionCache, DimensionCache, detection_cache, dimension_cache
+from .consumers import CLOSE_TOO_MANY, CLOSE_UNAVAILABLE, FrameStreamConsumer
+from .model.base_model_for_registry import BaseModel
+from .model.batching import MicroBatcher, set_concurrent_tasks
+from .model.detections import Detections
+from .model.evaluation import average_precision, mean_matched_iou
+from .model.inference_server import InferenceClient, InferenceServer
+from .model.onnx_runtime import ONNXModel, _replaced_atomically
+from .model import ops
+from .model.prefetch import Prefetcher
+from .model.yolo import YOLOModel
+from .model.registry import ModelManager
+from .model.replicas import ReplicaPool
+from .model.residency import ResidencyManager
+from .models import Furniture, Picture, Task
+from . import profiling
+from .progress import ProgressEmitter, StageTimer
+from .queues import route_task, worker_queues
+from .tasks import (
+    finish_batch, process_batch, process_folder, process_image, save_detections, store_furniture,
+)
+from core.celery import app as celery_app
+from .uploads import store_upload
+from .worker import _runs_tasks_concurrently
 
-# Create your tests here.
+TEST_CATEGORY = "test"
+
+
+class FakeDetector(BaseModel):
+    """ Registry model without weights: fixed detections, names from `names`. """
+
+    def __init__(self, names=None, memory_gb: float = 1.0, **kwargs):
+        self.names = names if names is not None else {0: "chair", 3: "sofa"}
+        self.memory_gb = memory_gb
+        self.loaded = False
+
+    def load_model(self, **kwargs):
+        self.loaded = True
+
+    def unload_model(self):
+        self.loaded = False
+
+    def memory_footprint(self):
+        return int(self.memory_gb * 1024 ** 3)
+
+    def class_names(self) -> dict:
+        return dict(self.names)
+
+    def predict_image(self, image_path, save_path: str = None) -> Detections:
+        return Detections([3], [0.9], [[0, 0, 10, 10]])
+
+    def predict_batch(self, image_paths: list, save_path: str = None) -> list:
+        return [self.predict_image(path) for path in image_paths]
+
+
+class ShortBatchDetector(FakeDetector):
+    """ Returns one result less than it was given images. """
+
+    def predict_batch(self, image_paths: list, save_path: str = None) -> list:
+        return super().predict_batch(image_paths)[1:]
+
+
+class BlockingDetector(FakeDetector):
+    """ predict_batch waits until `release` is set. """
+    release = threading.Event()
+
+    def predict_batch(self, image_paths: list, save_path: str = None) -> list:
+        self.release.wait(5)
+        return super().predict_batch(image_paths)
+
+
+class SlowLoadDetector(FakeDetector):
+    """ Takes a while to load and counts its loads. """
+    loads = 0
+
+    def load_model(self, **kwargs):
+        time.sleep(0.2)
+        type(self).loads += 1
+        super().load_model(**kwargs)
+
+
+class RecordingDetector(FakeDetector):
+    """ Keeps every image and batch size it is given; predict_batch waits for `release` when it is cleared. """
+    images = []
+    batches = []
+    release = threading.Event()
+
+    def predict_batch(self, image_paths: list, save_path: str = None) -> list:
+        self.images.extend(image_paths)
+        self.batches.append(len(image_paths))
+        self.release.wait(5)
+        return super().predict_batch(image_paths)
+
+
+def register_fake(model_name: str, klass=FakeDetector, category: str = TEST_CATEGORY, **model_info):
+    ModelManager.register_class(klass.__name__, klass)
+    ModelManager.add_model(model_name, {
+        "class": klass.__name__,
+        "required_vram": 1.0,
+        "constructor_kwargs": {"device": "cpu"},
+        **model_info,
+    }, model_category=category)
+
+
+def forget_model(model_name: str):
+    ModelManager.unload_model(model_name)
+    ModelManager._class_names.pop(model_name, None)
+
+
+# -----------------------
+# Class names of stored detections
+# -----------------------
+class DetectionNamesTests(TestCase):
+    def setUp(self):
+        detection_cache.clear()
+        self.task = Task.objects.create(id="task-names", session_id="session-names")
+
+    def picture(self, picture_id):
+        return Picture.objects.create(id=picture_id, image_path="", task=self.task)
+
+    def test_names_of_the_loaded_model_are_stored_with_detections(self):
+        register_fake("names_loaded")
+        self.addCleanup(forget_model, "names_loaded")
+        ModelManager.get_model("names_loaded")
+
+        results = save_detections(self.picture("p1"), "names_loaded", Detections([3], [0.9], [[0, 0, 10, 10]]))
+
+        self.assertEqual(results[0]["name"], "sofa")
+        self.assertEqual(list(Furniture.objects.values_list("name", flat=True)), ["sofa"])
+
+    def test_names_survive_eviction(self):
+        register_fake("names_evicted")
+        self.addCleanup(forget_model, "names_evicted")
+        ModelManager.get_model("names_evicted")
+        ModelManager.unload_model("names_evicted")
+
+        results = save_detections(self.picture("p1"), "names_evicted", Detections([0], [0.9], [[0, 0, 10, 10]]))
+
+        self.assertEqual(results[0]["name"], "chair")
+
+    def test_configured_names_when_the_model_reports_none(self):
+        register_fake("names_configured", class_names=["bed", "chair"],
+                      constructor_kwargs={"device": "cpu", "names": {}})
+        self.addCleanup(forget_model, "names_configured")
+        ModelManager.get_model("names_configured")
+
+        results = save_detections(self.picture("p1"), "names_configured", Detections([1], [0.9], [[0, 0, 1, 1]]))
+
+        self.assertEqual(results[0]["name"], "chair")
+
+    def test_unnamed_class_is_an_error_not_a_number(self):
+        register_fake("names_missing", constructor_kwargs={"device": "cpu", "names": {}})
+        self.addCleanup(forget_model, "names_missing")
+
+        with self.assertRaises(ValueError):
+            save_detections(self.picture("p1"), "names_missing", Detections([7], [0.9], [[0, 0, 1, 1]]))
+        self.assertFalse(Furniture.objects.exists())
+
+    def test_names_carried_by_detections_win(self):
+        detections = Detections([3], [0.9], [[0, 0, 1, 1]], names={3: "couch"})
+
+        results = save_detections(self.picture("p1"), "not_configured", detections)
+
+        self.assertEqual(results[0]["name"], "couch")
+
+    def test_cache_hits_store_the_same_names_without_the_model(self):
+        # a cache hit in the web tier copies the stored detections of an earlier picture
+        register_fake("names_cached")
+        self.addCleanup(forget_model, "names_cached")
+        ModelManager.get_model("names_cached")
+        results = save_detections(self.picture("p1"), "names_cached", Detections([3], [0.9], [[0, 0, 1, 1]]))
+        forget_model("names_cached")
+
+        hit = self.picture("p2")
+        hit.detected_data = results
+        store_furniture([hit])
+
+        self.assertEqual(list(Furniture.objects.filter(picture_id="p2").values_list("name", flat=True)), ["sofa"])
+        self.assertEqual(Furniture.objects.filter(name="sofa").count(), 2)
+
+    def test_detections_without_names_are_not_served_from_pictures(self):
+        Picture.objects.create(id="legacy", image_path="", content_hash="h", model_name="m", model_version="v",
+                               detected_data=[{"class_id": 3, "confidence": 0.9, "bbox": [0, 0, 1, 1]}])
+
+        self.assertIsNone(detection_cache.lookup("h", "m", "v"))
+
+    def test_dimensions_use_the_stored_names(self):
+        dimension_cache.clear()
+        rows = Detections([3, 0], [0.9, 0.8], [[0, 0, 100, 50], [0, 0, 50, 50]], names={0: "chair", 3: "sofa"})
+        Picture.objects.create(id="p1", image_path="", model_name="not_configured", detected_data=rows.to_dicts())
+
+        response = self.client.post(reverse("picture_dimensions"), {
+            "picture_id": "p1", "reference_class": "chair", "reference_length": 45,
+        }, content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([d["name"] for d in response.json()["detections"]], ["sofa", "chair"])
+
+    def test_dimensions_of_unnamed_detections_are_an_error_not_numbers(self):
+        dimension_cache.clear()
+        Picture.objects.create(id="p1", image_path="", model_name="not_configured",
+                               detected_data=[{"class_id": 3, "confidence": 0.9, "bbox": [0, 0, 10, 10]}])
+
+        response = self.client.post(reverse("picture_dimensions"), {
+            "picture_id": "p1", "reference_index": 0, "reference_length": 45,
+        }, content_type="application/json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("class_names", response.json()["error"])
+
+    def test_names_follow_scaling_and_dicts(self):
+        detections = Detections([3, 0], [0.9, 0.5], np.ones((2, 4)), names={0: "chair", 3: "sofa"})
+
+        rows = detections.scaled(2.0).to_dicts()
+
+        self.assertEqual([row["name"] for row in rows], ["sofa", "chair"])
+        self.assertEqual(Detections.from_dicts(rows).names, {0: "chair", 3: "sofa"})
+
+
+# -----------------------
+# Live frame streams
+# -----------------------
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class FrameStreamTests(SimpleTestCase):
+    @async_to_sync
+    async def connect(self):
+        communicator = WebsocketCommunicator(FrameStreamConsumer.as_asgi(), "/ws/frames/s1/")
+        communicator.scope["url_route"] = {"kwargs": {"session_id": "s1"}}
+        connected, _ = await communicator.connect()
+        event = await communicator.receive_json_from()
+        closed = await communicator.receive_output()
+        await communicator.wait()
+        return connected, event, closed
+
+    @override_settings(INFERENCE_SERVER_SOCKET=None)
+    def test_refused_without_inference_server(self):
+        with mock.patch.object(ModelManager, "get_model") as get_model:
+            connected, event, closed = self.connect()
+
+        get_model.assert_not_called()
+        self.assertEqual(event["type"], "stream_error")
+        self.assertEqual(closed, {"type": "websocket.close", "code": CLOSE_UNAVAILABLE})
+
+    @override_settings(INFERENCE_SERVER_SOCKET="/tmp/unused.sock", STREAM_MAX_CONNECTIONS=0)
+    def test_refused_over_the_connection_limit(self):
+        connected, event, closed = self.connect()
+
+        self.assertEqual(closed["code"], CLOSE_TOO_MANY)
+        self.assertEqual(FrameStreamConsumer.active, 0)
+
+
+# -----------------------
+# Decode / preprocess prefetching
+# -----------------------
+class PrefetcherTests(SimpleTestCase):
+    def images(self, n):
+        return [np.full((48, 64, 3), i, dtype=np.uint8) for i in range(n)]
+
+    def test_batches_in_order_and_letterboxed(self):
+        prefetcher = Prefetcher(32, batch_size=2, depth=2, workers=2)
+        self.addCleanup(prefetcher.close)
+
+        batches = [(list(b.sources), [img.copy() for img in b.images]) for b in prefetcher.batches(self.images(5))]
+
+        self.assertEqual([len(sources) for sources, _ in batches], [2, 2, 1])
+        values = [int(img[16, 16, 0]) for _, images in batches for img in images]
+        self.assertEqual(values, [0, 1, 2, 3, 4])
+        self.assertEqual(batches[0][1][0].shape, (32, 32, 3))
+
+    def test_ring_and_threads_are_reused_across_calls(self):
+        prefetcher = Prefetcher(32, batch_size=2, depth=1, workers=1)
+        self.addCleanup(prefetcher.close)
+
+        list(prefetcher.batches(self.images(6)))
+        ring, executor = prefetcher._buffers, prefetcher._executor
+        list(prefetcher.batches(self.images(6)))
+
+        self.assertIs(prefetcher._buffers, ring)
+        self.assertIs(prefetcher._executor, executor)
+
+    def test_single_batch_is_prepared_inline(self):
+        prefetcher = Prefetcher(32, batch_size=4, depth=2)
+        self.addCleanup(prefetcher.close)
+
+        batches = list(prefetcher.batches(self.images(3)))
+
+        self.assertEqual(len(batches), 1)
+        self.assertIsNone(prefetcher._executor)
+        self.assertEqual(len(prefetcher._buffers), 4)
+
+    def test_concurrent_call_does_not_share_the_ring(self):
+        prefetcher = Prefetcher(32, batch_size=1, depth=1, workers=1)
+        self.addCleanup(prefetcher.close)
+
+        outer = prefetcher.batches(self.images(3))
+        first = next(outer)
+        inner = next(prefetcher.batches(self.images(1)))
+
+        self.assertFalse(any(np.shares_memory(inner.images[0], buffer) for buffer in prefetcher._buffers))
+        self.assertEqual(int(first.images[0][16, 16, 0]), 0)
+        outer.close()
+
+    def test_early_exit_releases_the_ring(self):
+        prefetcher = Prefetcher(32, batch_size=1, depth=2, workers=2)
+        self.addCleanup(prefetcher.close)
+
+        batches = prefetcher.batches(self.images(10))
+        next(batches)
+        batches.close()
+
+        self.assertEqual(len(list(prefetcher.batches(self.images(4)))), 4)
+        self.assertIs(prefetcher._buffers, prefetcher._ring(3))
+
+
+# -----------------------
+# Model-affinity routing
+# -----------------------
+@override_settings(MODEL_QUEUES="model", WORKER_MODELS=None)
+class RoutingTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        register_fake("route_a")
+        register_fake("route_b")
+        register_fake("route_small", queue="small")
+        register_fake("route_unserved")
+
+    def setUp(self):
+        # the preload list decides which models get a queue
+        patcher = mock.patch.dict(os.environ, {"PRELOAD_MODELS": "route_a,route_b,route_small"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def route(self, task, args=(), kwargs=None):
+        route = route_task(task.name, args, kwargs or {}, {}, task=task)
+        return route["queue"] if route else None
+
+    def test_model_name_from_kwargs_or_args(self):
+        self.assertEqual(self.route(process_image, kwargs={"model_name": "route_a"}), "model.route_a")
+        self.assertEqual(self.route(process_image, args=("t", "p", "s", "/x.jpg", "route_b")), "model.route_b")
+        self.assertEqual(self.route(process_batch, args=("t", "s", ["p"]), kwargs={"model_name": "route_b"}),
+                         "model.route_b")
+
+    def test_configured_queue_wins(self):
+        self.assertEqual(self.route(process_image, kwargs={"model_name": "route_small"}), "small")
+
+    def test_models_without_a_worker_stay_on_the_default_queue(self):
+        self.assertIsNone(self.route(process_image, kwargs={"model_name": "route_unserved"}))
+        self.assertIsNone(self.route(process_image, kwargs={"model_name": "not_configured"}))
+
+    def test_tasks_without_a_model_stay_on_the_default_queue(self):
+        self.assertIsNone(self.route(finish_batch, args=([], "t", "s", 1)))
+
+    @override_settings(MODEL_QUEUES="category")
+    def test_category_queues(self):
+        self.assertEqual(self.route(process_image, kwargs={"model_name": "route_a"}), f"category.{TEST_CATEGORY}")
+
+    @override_settings(MODEL_QUEUES="off")
+    def test_routing_off(self):
+        self.assertIsNone(self.route(process_image, kwargs={"model_name": "route_a"}))
+
+    @override_settings(WORKER_MODELS="route_b, route_small")
+    def test_worker_queues_of_worker_models(self):
+        self.assertEqual(worker_queues(), ["model.route_b", "small"])
+
+    def test_worker_queues_of_the_preload_list(self):
+        with mock.patch.dict(os.environ, {"PRELOAD_MODELS": "route_a"}):
+            self.assertEqual(worker_queues(), ["model.route_a"])
+
+    def test_every_routed_queue_has_a_default_consumer(self):
+        # a worker with neither WORKER_MODELS nor preloaded models consumes every model queue
+        with mock.patch.object(ModelManager, "preload_list", return_value=[]):
+            self.assertEqual(worker_queues(), [])
+        queues = set(worker_queues())
+        for model_name in ("route_a", "route_b", "route_small", "route_unserved"):
+            queue = self.route(process_image, kwargs={"model_name": model_name})
+            self.assertTrue(queue is None or queue in queues, model_name)
+
+
+# -----------------------
+# ONNX export files
+# -----------------------
+class AtomicExportTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "model.int8.onnx")
+
+    def test_written_file_replaces_the_target(self):
+        with _replaced_atomically(self.path) as tmp_path:
+            self.assertNotEqual(tmp_path, self.path)
+            with open(tmp_path, "w") as f:
+                f.write("graph")
+
+        with open(self.path) as f:
+            self.assertEqual(f.read(), "graph")
+        self.assertEqual(os.listdir(self.directory.name), ["model.int8.onnx"])
+
+    def test_failed_write_leaves_the_target_untouched(self):
+        with open(self.path, "w") as f:
+            f.write("previous")
+
+        with self.assertRaises(RuntimeError):
+            with _replaced_atomically(self.path) as tmp_path:
+                with open(tmp_path, "w") as f:
+                    f.write("partial")
+                raise RuntimeError("export failed")
+
+        with open(self.path) as f:
+            self.assertEqual(f.read(), "previous")
+        self.assertEqual(os.listdir(self.directory.name), ["model.int8.onnx"])
+
+
+# -----------------------
+# ONNX Runtime backend
+# -----------------------
+# raw head output, (1, 4 + classes, anchors): xywh in letterboxed pixels, then class scores
+ONNX_OUTPUT = np.float32([[
+    [32, 33, 33, 10],
+    [32, 32, 32, 40],
+    [20, 20, 20, 4],
+    [10, 10, 10, 4],
+    [0.125, 0.125, 0.75, 0.25],
+    [0.875, 0.75, 0.125, 0.125],
+]])
+
+
+def write_onnx_graph(path, output, names="{0: 'chair', 1: 'sofa'}"):
+    """
+    A graph with a YOLO-shaped output: `output` plus a MatMul of the image mean
+    with zero weights, so the int8 / fp16 conversions have weights to convert.
+    """
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    flat = int(np.prod(output.shape))
+    graph = helper.make_graph(
+        [
+            helper.make_node("ReduceMean", ["images"], ["mean"], keepdims=0),
+            helper.make_node("Reshape", ["mean", "one_by_one"], ["features"]),
+            helper.make_node("MatMul", ["features", "weights"], ["flat"]),
+            helper.make_node("Reshape", ["flat", "shape"], ["head"]),
+            helper.make_node("Add", ["head", "output"], ["output0"]),
+        ],
+        "head",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, ["batch", 3, "height", "width"])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, list(output.shape))],
+        [
+            numpy_helper.from_array(np.int64([1, 1]), "one_by_one"),
+            numpy_helper.from_array(np.zeros((1, flat), np.float32), "weights"),
+            numpy_helper.from_array(np.int64(output.shape), "shape"),
+            numpy_helper.from_array(output, "output"),
+        ],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8)
+    helper.set_model_props(model, {"names": names})
+    onnx.save(model, path)
+
+
+class ONNXModelTests(SimpleTestCase):
+    # 64 x 32 image letterboxed to 64 x 64: ratio 1, padded 16 px at the top
+    image = np.zeros((32, 64, 3), dtype=np.uint8)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.onnx_path = os.path.join(directory.name, "model.onnx")
+        write_onnx_graph(self.onnx_path, ONNX_OUTPUT)
+        patcher = mock.patch("builtins.print")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def model(self, precision="fp32"):
+        # no weights next to the export: it is used as is
+        model = ONNXModel(model_path=os.path.join(os.path.dirname(self.onnx_path), "model.pt"),
+                          onnx_path=self.onnx_path)
+        model.load_model(imgsz=64, precision=precision, prefetch_depth=0)
+        self.addCleanup(model.unload_model)
+        return model
+
+    def test_postprocess_keeps_one_box_per_object_and_class(self):
+        model = ONNXModel(conf=0.25, iou=0.7)
+
+        detections = model._postprocess(ONNX_OUTPUT[0].T, 1.0, (0, 16), (32, 64))
+
+        # anchor 1 overlaps the better sofa of anchor 0; anchor 2 is the same box as a chair;
+        # anchor 3 is under the confidence threshold
+        self.assertEqual(detections.class_ids.tolist(), [1, 0])
+        self.assertEqual(detections.boxes.tolist(), [[22, 11, 42, 21], [23, 11, 43, 21]])
+        np.testing.assert_allclose(detections.confidences, [0.875, 0.75])
+
+    def test_postprocess_maps_boxes_back_through_the_letterbox(self):
+        model = ONNXModel(conf=0.25, iou=0.7)
+
+        detections = model._postprocess(ONNX_OUTPUT[0].T, 0.5, (0, 16), (64, 128))
+
+        self.assertEqual(detections.boxes.tolist(), [[44, 22, 84, 42], [46, 22, 86, 42]])
+
+    def test_nothing_above_the_threshold(self):
+        detections = ONNXModel(conf=0.9)._postprocess(ONNX_OUTPUT[0].T, 1.0, (0, 16), (32, 64))
+
+        self.assertEqual(len(detections), 0)
+
+    def test_every_precision_runs_the_graph(self):
+        for precision in ("fp32", "int8", "fp16"):
+            with self.subTest(precision=precision):
+                model = self.model(precision)
+                detections = model.predict_image(self.image)
+
+                self.assertTrue(model.session_path.endswith("model.onnx" if precision == "fp32"
+                                                             else f"model.{precision}.onnx"))
+                self.assertEqual(detections.class_ids.tolist(), [1, 0])
+                self.assertEqual(detections.boxes.tolist(), [[22, 11, 42, 21], [23, 11, 43, 21]])
+                np.testing.assert_allclose(detections.confidences, [0.875, 0.75], atol=1e-3)
+
+    def test_class_names_come_from_the_graph_metadata(self):
+        self.assertEqual(self.model().class_names(), {0: "chair", 1: "sofa"})
+
+
+# -----------------------
+# Non-maximum suppression
+# -----------------------
+class NMSTests(SimpleTestCase):
+    def test_same_class_overlaps_are_suppressed(self):
+        boxes = np.float32([[0, 0, 10, 10], [1, 1, 11, 11], [50, 50, 60, 60]])
+        keep = ops.nms(boxes, np.float32([0.9, 0.8, 0.7]), 0.5, class_ids=np.int32([0, 0, 0]))
+
+        self.assertEqual(keep.tolist(), [0, 2])
+
+    def test_classes_never_suppress_each_other_with_negative_coordinates(self):
+        # tile boxes shifted to full-image coordinates can be negative before clipping;
+        # an offset of (max + 1) per class is 0 here and would put class 1 onto class 0
+        boxes = np.float32([[-100, -100, -1, -1], [-100, -100, -1, -1], [-98, -98, -2, -2]])
+        keep = ops.nms(boxes, np.float32([0.9, 0.8, 0.7]), 0.5, class_ids=np.int32([0, 1, 0]))
+
+        self.assertEqual(keep.tolist(), [0, 1])
+
+    def test_classes_separated_on_images_larger_than_the_offset(self):
+        boxes = np.float32([[0, 0, 20000, 9000], [0, 0, 20000, 9000]])
+        keep = ops.nms(boxes, np.float32([0.9, 0.8]), 0.5, class_ids=np.int32([0, 2]))
+
+        self.assertEqual(keep.tolist(), [0, 1])
+
+    def test_matches_one_box_at_a_time_greedy_suppression(self):
+        rng = np.random.default_rng(0)
+        top_left = rng.uniform(0, 200, (300, 2))
+        boxes = np.hstack([top_left, top_left + rng.uniform(5, 60, (300, 2))]).astype(np.float32)
+        scores = rng.uniform(0, 1, 300).astype(np.float32)
+        class_ids = rng.integers(0, 3, 300)
+
+        for metric in ("iou", "ios"):
+            expected = []
+            for i in np.argsort(-scores, kind="stable"):
+                overlaps = [ops.box_overlap(boxes[[i]], boxes[[j]], metric)[0, 0] > 0.5
+                            for j in expected if class_ids[j] == class_ids[i]]
+                if not any(overlaps):
+                    expected.append(i)
+
+            keep = ops.nms(boxes, scores, 0.5, class_ids=class_ids, max_det=1000, metric=metric)
+            self.assertEqual(keep.tolist(), expected)
+            self.assertEqual(ops.nms(boxes, scores, 0.5, class_ids=class_ids, max_det=5, metric=metric).tolist(),
+                             expected[:5])
+
+
+# -----------------------
+# Tiled inference
+# -----------------------
+class TileBoxes:
+    """ Stand-in for ultralytics `Boxes`: rows of [x1, y1, x2, y2, conf, cls] in tile coordinates. """
+
+    def __init__(self, rows):
+        import torch
+
+        self.data = torch.tensor(rows, dtype=torch.float32).reshape(-1, 6)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class TilingTests(SimpleTestCase):
+    def detector(self, **tiling):
+        detector = YOLOModel(device="cpu")
+        detector.model = object()
+        detector.tiling = detector._tiling_config({"tile_size": 100, "batch_size": 1, "full_image": False, **tiling})
+        return detector
+
+    def predict_tiled(self, detector, image, tile_rows):
+        results = [mock.Mock(boxes=TileBoxes(rows)) for rows in tile_rows]
+        with mock.patch.object(detector, "_predict", side_effect=[[r] for r in results]):
+            return detector.predict_tiled(image)
+
+    def test_tiles_cover_the_image_with_the_overlap(self):
+        origins = ops.tile_origins(250, 100, 100, 0.2)
+
+        self.assertEqual(origins, [(0, 0), (80, 0), (150, 0)])
+        xs = [x for x, _ in origins]
+        # the last tile ends at the border, neighbours share at least 20 px
+        self.assertEqual(xs[-1] + 100, 250)
+        self.assertTrue(all(b - a <= 80 for a, b in zip(xs, xs[1:])))
+
+    def test_grid_of_rows_and_columns(self):
+        origins = ops.tile_origins(180, 180, 100, 0.2)
+
+        self.assertEqual(origins, [(0, 0), (80, 0), (0, 80), (80, 80)])
+
+    def test_image_smaller_than_a_tile_is_one_tile(self):
+        self.assertEqual(ops.tile_origins(60, 40, 100, 0.5), [(0, 0)])
+        self.assertEqual(ops.tile_origins(100, 100, 100, 0.5), [(0, 0)])
+
+    def test_object_across_a_seam_is_merged_into_one_box(self):
+        # tiles at x 0 and 80 of a 180 x 100 image; a chair at x 70-130 is cut by the first tile
+        detections = self.predict_tiled(
+            self.detector(), np.zeros((100, 180, 3), np.uint8),
+            [[[70, 10, 100, 50, 0.6, 0]], [[0, 10, 50, 50, 0.9, 0]]],
+        )
+
+        self.assertEqual(len(detections), 1)
+        self.assertEqual(detections.boxes.tolist(), [[80, 10, 130, 50]])
+        self.assertAlmostEqual(float(detections.confidences[0]), 0.9, places=5)
+
+    def test_seam_merge_is_class_aware(self):
+        detections = self.predict_tiled(
+            self.detector(), np.zeros((100, 180, 3), np.uint8),
+            [[[70, 10, 100, 50, 0.6, 0]], [[0, 10, 50, 50, 0.9, 1]]],
+        )
+
+        self.assertEqual(sorted(detections.class_ids.tolist()), [0, 1])
+
+    def test_objects_in_the_overlap_of_two_tiles_stay_separate(self):
+        detections = self.predict_tiled(
+            self.detector(), np.zeros((100, 180, 3), np.uint8),
+            [[[82, 10, 88, 20, 0.9, 0], [92, 10, 98, 20, 0.8, 0]],
+             [[2, 10, 8, 20, 0.85, 0], [12, 10, 18, 20, 0.75, 0]]],
+        )
+
+        self.assertEqual(sorted(detections.boxes[:, 0].tolist()), [82, 92])
+
+
+# -----------------------
+# Folder inference
+# -----------------------
+def write_folder(folder, count):
+    """ `count` square PNGs whose pixels are all 10 * their index, plus a file that isn't an image. """
+    for i in range(count):
+        Image.new("RGB", (16, 16), (10 * i,) * 3).save(os.path.join(folder, f"{i:02d}.png"))
+    with open(os.path.join(folder, "notes.txt"), "w") as f:
+        f.write("not an image")
+    return [os.path.join(folder, f"{i:02d}.png") for i in range(count)]
+
+
+def boxes_of_pixel_value(images, **kwargs):
+    """ `_predict` stand-in: one box per image, its class the image's pixel value / 10. """
+    return [mock.Mock(boxes=TileBoxes([[1, 2, 3, 4, 0.9, image[0, 0, 0] // 10]])) for image in images]
+
+
+class FolderDetector(FakeDetector):
+    """ Streams the folder's images in order, each with one box of class `index`. """
+
+    def stream_folder(self, folder_path: str, save_path: str = None, batch_size: int = None,
+                      progress_callback=None):
+        for processed, path in enumerate(ops.list_images(folder_path), start=1):
+            if progress_callback:
+                progress_callback(processed, path)
+            yield path, Detections([processed - 1], [0.9], [[1, 2, 3, 4]])
+
+    @staticmethod
+    def count_images(folder_path: str) -> int:
+        return len(ops.list_images(folder_path))
+
+
+class FolderInferenceTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.folder = directory.name
+        self.paths = write_folder(self.folder, 5)
+
+    def detector(self, prefetch_depth):
+        detector = YOLOModel(device="cpu")
+        detector.model = object()
+        detector.imgsz, detector.batch_size, detector.prefetch_depth = 16, 2, prefetch_depth
+        self.addCleanup(detector._close_prefetcher)
+        return detector
+
+    def test_prefetched_stream_keeps_folder_order_and_per_file_results(self):
+        detector = self.detector(prefetch_depth=2)
+        progress = []
+
+        with mock.patch.object(detector, "_predict", side_effect=boxes_of_pixel_value) as predict:
+            streamed = list(detector.stream_folder(self.folder,
+                                                   progress_callback=lambda *args: progress.append(args)))
+
+        self.assertEqual([path for path, _ in streamed], self.paths)
+        self.assertEqual([d.class_ids.tolist() for _, d in streamed], [[0], [1], [2], [3], [4]])
+        self.assertEqual([len(call.args[0]) for call in predict.call_args_list], [2, 2, 1])
+        self.assertEqual(progress, list(enumerate(self.paths, start=1)))
+        self.assertEqual(detector.count_images(self.folder), 5)
+
+    def test_predict_folder_returns_a_dict_by_path(self):
+        detector = self.detector(prefetch_depth=0)
+        results = [mock.Mock(path=path, boxes=TileBoxes([[1, 2, 3, 4, 0.9, i]]))
+                   for i, path in enumerate(self.paths)]
+
+        with mock.patch.object(detector, "_predict", return_value=iter(results)):
+            detections = detector.predict_folder(self.folder, save_path=None)
+
+        self.assertIsInstance(detections, dict)
+        self.assertEqual(list(detections), self.paths)
+        self.assertEqual([d.class_ids.tolist() for d in detections.values()], [[0], [1], [2], [3], [4]])
+
+    def test_process_folder_writes_one_line_per_image_in_order(self):
+        register_fake("folder_model", klass=FolderDetector, category="detection")
+        self.addCleanup(forget_model, "folder_model")
+        output_path = os.path.join(self.folder, "detections.jsonl")
+        events = []
+
+        with mock.patch("furniture_detector.tasks.send_progress",
+                        side_effect=lambda session_id, event, **kwargs: events.append((event, kwargs))):
+            result = process_folder("s1", self.folder, "folder_model", output_path=output_path, progress_every=2)
+
+        self.assertEqual(result, {"status": "done", "processed": 5, "output": output_path})
+        with open(output_path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line["image"] for line in lines], self.paths)
+        self.assertEqual([line["detections"][0]["class_id"] for line in lines], [0, 1, 2, 3, 4])
+        self.assertEqual([(e, kwargs.get("processed")) for e, kwargs in events], [
+            ("folder_started", None), ("folder_progress", 2), ("folder_progress", 4), ("folder_progress", 5),
+            ("folder_finished", 5),
+        ])
+
+    def test_process_folder_needs_a_folder(self):
+        with self.assertRaises(ValueError):
+            process_folder("s1", os.path.join(self.folder, "missing"), "folder_model")
+
+
+# -----------------------
+# Micro-batching
+# -----------------------
+class MicroBatcherTests(SimpleTestCase):
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    def test_each_caller_gets_its_detections(self):
+        register_fake("batch_ok")
+        self.addCleanup(forget_model, "batch_ok")
+
+        detections = MicroBatcher("batch_ok", TEST_CATEGORY).predict_image(self.image, timeout=5)
+
+        self.assertEqual(detections.class_ids.tolist(), [3])
+
+    def test_missing_results_fail_every_caller(self):
+        register_fake("batch_short", klass=ShortBatchDetector)
+        self.addCleanup(forget_model, "batch_short")
+        batcher = MicroBatcher("batch_short", TEST_CATEGORY, max_batch_size=2, max_wait_ms=200)
+
+        futures = [batcher.submit(self.image), batcher.submit(self.image)]
+
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+
+    def test_timeout_drops_the_queued_image(self):
+        register_fake("batch_slow", klass=BlockingDetector)
+        self.addCleanup(forget_model, "batch_slow")
+        self.addCleanup(BlockingDetector.release.set)
+        BlockingDetector.release.clear()
+        batcher = MicroBatcher("batch_slow", TEST_CATEGORY, max_batch_size=1, max_wait_ms=0)
+        running = batcher.submit(self.image)
+
+        with self.assertRaises(TimeoutError):
+            batcher.predict_image(self.image, timeout=0.1)
+        BlockingDetector.release.set()
+
+        self.assertEqual(len(running.result(timeout=5)), 1)
+        # the batcher thread is still serving
+        self.assertEqual(len(batcher.predict_image(self.image, timeout=5)), 1)
+
+    def test_only_pools_with_concurrent_tasks_batch(self):
+        def worker(pool, concurrency):
+            return mock.Mock(pool_cls=pool, concurrency=concurrency)
+
+        self.assertFalse(_runs_tasks_concurrently(worker("prefork", 8)))
+        self.assertFalse(_runs_tasks_concurrently(worker("solo", 1)))
+        self.assertFalse(_runs_tasks_concurrently(worker("threads", 1)))
+        self.assertTrue(_runs_tasks_concurrently(worker("threads", 8)))
+        self.assertTrue(_runs_tasks_concurrently(worker("gevent", 100)))
+
+
+# -----------------------
+# Detection / dimension caches
+# -----------------------
+class CacheTests(TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = DetectionCache(max_entries=2)
+        cache.put("a", "m", "v", [1])
+        cache.put("b", "m", "v", [2])
+        cache.get("a", "m", "v")
+        cache.put("c", "m", "v", [3])
+
+        self.assertEqual(cache.get("a", "m", "v"), [1])
+        self.assertIsNone(cache.get("b", "m", "v"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_expired_entries_are_not_served(self):
+        cache = DetectionCache(ttl=10)
+        with mock.patch("furniture_detector.cache.time.monotonic", return_value=100.0):
+            cache.put("a", "m", "v", [1])
+        with mock.patch("furniture_detector.cache.time.monotonic", return_value=111.0):
+            self.assertIsNone(cache.get("a", "m", "v"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_new_model_version_drops_the_old_one(self):
+        cache = DetectionCache()
+        cache.put("a", "m", "v1", [1])
+        cache.put("a", "other", "v1", [2])
+
+        self.assertIsNone(cache.get("a", "m", "v2"))
+        self.assertIsNone(cache.get("a", "m", "v1"))
+        self.assertEqual(cache.get("a", "other", "v1"), [2])
+
+    def test_sync_and_async_lookups_fall_back_to_pictures(self):
+        detections = [{"class_id": 3, "name": "sofa", "confidence": 0.9, "bbox": [0, 0, 1, 1]}]
+        Picture.objects.create(id="stored", image_path="", content_hash="h", model_name="m", model_version="v",
+                               detected_data=detections)
+
+        for lookup in (DetectionCache().lookup, async_to_sync(DetectionCache().alookup)):
+            self.assertEqual(lookup("h", "m", "v"), detections)
+            self.assertIsNone(lookup("missing", "m", "v"))
+
+    def test_lookups_are_counted(self):
+        cache = DetectionCache()
+        cache.put("h", "m", "v", [])
+        cache.lookup("h", "m", "v")
+        async_to_sync(cache.alookup)("missing", "m", "v")
+
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (1, 1))
+
+    def test_lookups_without_a_model_version_warn_once(self):
+        cache = DetectionCache()
+
+        with self.assertLogs("furniture_detector.cache", "WARNING") as logs:
+            self.assertIsNone(cache.lookup("h", "m", None))
+            self.assertIsNone(async_to_sync(cache.alookup)("h", "m", None))
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_dimensions_are_computed_once_per_key(self):
+        cache = DimensionCache(max_entries=1)
+        compute = mock.Mock(side_effect=[{"n": 1}, {"n": 2}, {"n": 3}])
+
+        self.assertEqual(cache.get_or_compute(("p1",), compute), {"n": 1})
+        self.assertEqual(cache.get_or_compute(("p1",), compute), {"n": 1})
+        self.assertEqual(cache.get_or_compute(("p2",), compute), {"n": 2})
+        self.assertEqual(cache.get_or_compute(("p1",), compute), {"n": 3})
+        self.assertEqual(cache.stats()["hits"], 1)
+
+
+# -----------------------
+# Detections
+# -----------------------
+class DetectionsTests(SimpleTestCase):
+    def test_columns_from_lists(self):
+        detections = Detections([3, 0], [0.9, 0.5], [[0, 0, 10, 10], [5, 5, 20, 40]])
+
+        self.assertEqual(len(detections), 2)
+        self.assertEqual(detections.boxes.shape, (2, 4))
+        self.assertEqual(detections.class_ids.tolist(), [3, 0])
+
+    def test_scaled_maps_boxes_back_to_the_original(self):
+        detections = Detections([3], [0.9], [[10, 20, 30, 40]]).scaled(2.5)
+
+        self.assertEqual(detections.boxes.tolist(), [[25, 50, 75, 100]])
+        self.assertEqual(detections.class_ids.tolist(), [3])
+
+    def test_scaled_per_axis(self):
+        detections = Detections([3], [0.9], [[10, 20, 30, 40]]).scaled(2, 0.5)
+
+        self.assertEqual(detections.boxes.tolist(), [[20, 10, 60, 20]])
+
+    def test_to_dicts_round_trip(self):
+        rows = Detections([3], [0.5], [[1, 2, 3, 4]]).to_dicts()
+
+        self.assertEqual(rows, [{"class_id": 3, "confidence": 0.5, "bbox": [1, 2, 3, 4]}])
+        self.assertEqual(Detections.from_dicts(rows).to_dicts(), rows)
+
+    def test_empty(self):
+        self.assertEqual(Detections.empty().to_dicts(), [])
+        self.assertEqual(len(Detections.from_dicts([])), 0)
+        self.assertEqual(len(Detections.concat([])), 0)
+
+
+# -----------------------
+# Evaluation metrics
+# -----------------------
+class EvaluationTests(SimpleTestCase):
+    boxes = Detections([0, 1], [0.9, 0.8], [[0, 0, 10, 10], [20, 20, 40, 40]])
+    elsewhere = Detections([0, 1], [0.9, 0.8], [[100, 100, 110, 110], [200, 200, 220, 220]])
+
+    def test_matched_iou_of_identical_and_disjoint_sets(self):
+        self.assertEqual(mean_matched_iou(self.boxes, self.boxes), 1.0)
+        self.assertEqual(mean_matched_iou(self.elsewhere, self.boxes), 0.0)
+
+    def test_matched_iou_only_matches_the_same_class(self):
+        swapped = Detections([1, 0], [0.9, 0.8], self.boxes.boxes)
+
+        self.assertEqual(mean_matched_iou(swapped, self.boxes), 0.0)
+
+    def test_matched_iou_averages_over_reference_boxes(self):
+        # half of the first box, nothing for the second: (0.5 + 0) / 2
+        pred = Detections([0], [0.9], [[0, 0, 10, 5]])
+
+        self.assertEqual(mean_matched_iou(pred, self.boxes), 0.25)
+
+    def test_matched_iou_of_empty_sets(self):
+        self.assertEqual(mean_matched_iou(Detections.empty(), Detections.empty()), 1.0)
+        self.assertEqual(mean_matched_iou(Detections.empty(), self.boxes), 0.0)
+        self.assertEqual(mean_matched_iou(self.boxes, Detections.empty()), 0.0)
+
+    def test_average_precision_of_identical_and_disjoint_sets(self):
+        self.assertEqual(average_precision([self.boxes], [self.boxes]), 1.0)
+        self.assertEqual(average_precision([self.elsewhere], [self.boxes]), 0.0)
+
+    def test_average_precision_of_empty_sets(self):
+        self.assertEqual(average_precision([Detections.empty()], [self.boxes]), 0.0)
+        self.assertEqual(average_precision([Detections.empty()], [Detections.empty()]), 1.0)
+        self.assertEqual(average_precision([self.boxes], [Detections.empty()]), 0.0)
+
+    def test_average_precision_ranks_by_confidence(self):
+        refs = Detections([0, 0], [1, 1], [[0, 0, 10, 10], [20, 20, 30, 30]])
+        # hit, miss, hit: precision 1 up to recall 0.5, then 2/3 up to recall 1
+        preds = Detections([0, 0, 0], [0.9, 0.8, 0.7], [[0, 0, 10, 10], [50, 50, 60, 60], [20, 20, 30, 30]])
+
+        self.assertAlmostEqual(average_precision([preds], [refs]), 0.5 * 1 + 0.5 * 2 / 3)
+
+    def test_average_precision_is_averaged_over_reference_classes(self):
+        # class 0 found in the second image, class 1 missed
+        refs = [Detections([0], [1], [[0, 0, 10, 10]]),
+                Detections([0, 1], [1, 1], [[0, 0, 10, 10], [20, 20, 40, 40]])]
+        preds = [Detections([0], [0.9], [[0, 0, 10, 10]]), Detections([0], [0.8], [[0, 0, 10, 10]])]
+
+        self.assertEqual(average_precision(preds, refs), 0.5)
+
+
+# -----------------------
+# Residency / eviction
+# -----------------------
+class PlanEvictionTests(SimpleTestCase):
+    def residency(self, *models):
+        """ Host budget of 2 GB holding `models`: (name, memory_gb, load_seconds) loaded at t=0. """
+        residency = ResidencyManager(host_budget_gb=2.0)
+        with mock.patch("furniture_detector.model.residency.time.monotonic", return_value=0.0):
+            for name, memory_gb, load_seconds in models:
+                residency.add(name, "cpu", memory_gb, load_seconds)
+        return residency
+
+    def plan(self, residency, required_gb, **kwargs):
+        with mock.patch("furniture_detector.model.residency.time.monotonic", return_value=10.0):
+            return residency.plan_eviction("new", "cpu", required_gb, **kwargs)
+
+    def test_nothing_evicted_when_it_fits(self):
+        self.assertEqual(self.plan(self.residency(("a", 1.0, 1.0)), 1.0), [])
+
+    def test_cheapest_to_reload_goes_first(self):
+        residency = self.residency(("slow", 1.0, 10.0), ("fast", 1.0, 1.0))
+
+        self.assertEqual(self.plan(residency, 1.0), ["fast"])
+
+    def test_least_recently_used_goes_first_at_equal_cost(self):
+        residency = self.residency(("a", 1.0, 1.0), ("b", 1.0, 1.0))
+        with mock.patch("furniture_detector.model.residency.time.monotonic", return_value=5.0):
+            residency.touch("a")
+
+        self.assertEqual(self.plan(residency, 1.0), ["b"])
+
+    def test_pinned_and_excluded_models_are_kept(self):
+        residency = self.residency(("pinned", 0.5, 1.0), ("leased", 0.5, 1.0), ("idle", 1.0, 1.0))
+        residency.pin("pinned")
+
+        self.assertEqual(self.plan(residency, 2.0, exclude=["leased"]), ["idle"])
+        self.assertEqual(residency.decisions[-2]["action"], "over_budget")
+
+    def test_only_the_same_device_is_considered(self):
+        residency = self.residency(("a", 1.0, 1.0))
+        residency.add("gpu", "cuda", 1.0, 1.0)
+
+        self.assertEqual(self.plan(residency, 2.0), ["a"])
+
+
+# -----------------------
+# Model loading and leases
+# -----------------------
+class ModelManagerTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_load(self):
+        register_fake("single_flight", klass=SlowLoadDetector)
+        self.addCleanup(forget_model, "single_flight")
+        SlowLoadDetector.loads = 0
+        instances = []
+
+        threads = [threading.Thread(target=lambda: instances.append(ModelManager.get_model("single_flight")))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(SlowLoadDetector.loads, 1)
+        self.assertEqual(len(instances), 4)
+        self.assertTrue(all(instance is instances[0] for instance in instances))
+
+    def test_failed_load_is_raised_to_every_caller_and_retried(self):
+        register_fake("load_fails")
+        self.addCleanup(forget_model, "load_fails")
+        with mock.patch.object(FakeDetector, "load_model", side_effect=RuntimeError("no weights")):
+            with self.assertRaises(RuntimeError):
+                ModelManager.get_model("load_fails")
+
+        self.assertTrue(ModelManager.get_model("load_fails").loaded)
+
+    def test_unload_of_a_leased_model_waits_for_the_lease(self):
+        register_fake("leased")
+        self.addCleanup(forget_model, "leased")
+
+        with ModelManager.lease("leased", TEST_CATEGORY) as model:
+            ModelManager.unload_model("leased")
+            self.assertTrue(model.loaded)
+            self.assertIn("leased", ModelManager._instances)
+
+        self.assertFalse(model.loaded)
+        self.assertNotIn("leased", ModelManager._instances)
+
+    def test_nested_leases_release_on_the_last_one(self):
+        register_fake("leased_twice")
+        self.addCleanup(forget_model, "leased_twice")
+
+        with ModelManager.lease("leased_twice", TEST_CATEGORY) as model:
+            with ModelManager.lease("leased_twice", TEST_CATEGORY):
+                ModelManager.unload_model("leased_twice")
+            self.assertTrue(model.loaded)
+
+        self.assertFalse(model.loaded)
+
+    def test_unleased_model_unloads_immediately(self):
+        register_fake("unleased")
+        self.addCleanup(forget_model, "unleased")
+        model = ModelManager.get_model("unleased")
+
+        ModelManager.unload_model("unleased")
+
+        self.assertFalse(model.loaded)
+
+
+# -----------------------
+# Lazy model imports
+# -----------------------
+class LazyImportTests(SimpleTestCase):
+    def test_web_and_task_modules_do_not_import_model_libraries(self):
+        # a fresh interpreter: this test process has loaded them already
+        code = (
+            "import django, sys; django.setup(); "
+            "import core.urls, furniture_detector.urls, furniture_detector.views, furniture_detector.tasks; "
+            "print(','.join(m for m in ('torch', 'ultralytics', 'cv2') if m in sys.modules))"
+        )
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": "core.settings"}
+        result = subprocess.run([sys.executable, "-c", code], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, check=True)
+
+        self.assertEqual(result.stdout.strip(), "")
+
+
+# -----------------------
+# Per-core replicas
+# -----------------------
+class EchoDetector(FakeDetector):
+    """ Detects one box of class `int(path)`; predict_image waits for `release` when it is cleared. """
+    release = threading.Event()
+    threads = []
+
+    def predict_image(self, image_path, save_path: str = None) -> Detections:
+        self.release.wait(5)
+        return self.predict_batch([image_path])[0]
+
+    def predict_batch(self, image_paths: list, save_path: str = None) -> list:
+        self.threads.append(threading.current_thread().name)
+        return [Detections([int(path)], [0.9], [[0, 0, 10, 10]]) for path in image_paths]
+
+
+class ReplicaPoolTests(SimpleTestCase):
+    def setUp(self):
+        # no CPU pinning or torch thread limits in tests
+        for target, kwargs in (("_limit_current_thread", {}), ("available_cpus", {"return_value": [0, 1, 2, 3]})):
+            patcher = mock.patch(f"furniture_detector.model.replicas.{target}", **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        EchoDetector.release.set()
+        EchoDetector.threads = []
+        self.pool = ReplicaPool(EchoDetector, replicas=2, name="echo")
+        self.pool.load_model(batch_size=4)
+        self.addCleanup(self.pool.unload_model)
+
+    def test_replicas_get_disjoint_cpus(self):
+        self.assertEqual([r.cpus for r in self.pool.replicas], [[0, 1], [2, 3]])
+        self.assertTrue(all(r.instance.loaded for r in self.pool.replicas))
+
+    def test_calls_go_to_the_least_pending_replica(self):
+        EchoDetector.release.clear()
+        self.addCleanup(EchoDetector.release.set)
+
+        futures = [self.pool._call("predict_image", "1"), self.pool._call("predict_image", "2")]
+
+        self.assertEqual([r["pending"] for r in self.pool.stats()], [1, 1])
+        EchoDetector.release.set()
+        self.assertEqual([f.result(timeout=5).class_ids.tolist() for f in futures], [[1], [2]])
+        self.assertEqual(sorted(EchoDetector.threads), ["replica-echo-0", "replica-echo-1"])
+
+    def test_batches_are_split_across_replicas_in_order(self):
+        results = self.pool.predict_batch([str(i) for i in range(5)])
+
+        self.assertEqual([d.class_ids.tolist() for d in results], [[0], [1], [2], [3], [4]])
+        self.assertEqual(sorted(EchoDetector.threads), ["replica-echo-0", "replica-echo-1"])
+
+    def test_unload_stops_every_replica(self):
+        replicas = self.pool.replicas
+
+        self.pool.unload_model()
+
+        self.assertEqual(len(self.pool), 0)
+        self.assertFalse(any(r.instance.loaded or r._thread.is_alive() for r in replicas))
+        with self.assertRaises(RuntimeError):
+            self.pool.predict_image("1")
+
+
+# -----------------------
+# Progress events
+# -----------------------
+class ProgressEmitterTests(SimpleTestCase):
+    def setUp(self):
+        self.sent = []
+        layer = mock.Mock()
+
+        async def group_send(group, event):
+            self.sent.append((group, event))
+
+        layer.group_send = group_send
+        self.emitter = ProgressEmitter(min_interval=60)
+        patcher = mock.patch.object(self.emitter, "_channel_layer", return_value=layer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: self.emitter._loop.call_soon_threadsafe(self.emitter._loop.stop))
+
+    def test_pending_events_of_one_kind_are_coalesced_to_the_latest(self):
+        self.emitter.emit("s1", "task_started", task_id="t1")
+        self.emitter.flush()
+        # within the throttle interval: these wait and replace each other
+        for done in range(1, 6):
+            self.emitter.emit("s1", "folder_progress", task_id="t1", processed=done)
+        self.emitter.flush()
+
+        events = [event for _, event in self.sent]
+        self.assertEqual([e["event"] for e in events], ["task_started", "folder_progress"])
+        self.assertEqual(events[1]["processed"], 5)
+        self.assertEqual(self.emitter.stats()["coalesced"], 4)
+
+    def test_distinct_events_keep_their_order(self):
+        self.emitter.emit("s1", "task_started", task_id="t1")
+        self.emitter.flush()
+        self.emitter.emit("s1", "picture_done", task_id="t1", picture_id="p1")
+        self.emitter.emit("s1", "picture_done", task_id="t1", picture_id="p2")
+        self.emitter.emit("s1", "task_done", task_id="t1")
+        self.emitter.flush()
+
+        self.assertEqual([e.get("picture_id") for _, e in self.sent[1:]], ["p1", "p2", None])
+        self.assertEqual({group for group, _ in self.sent}, {"progress_s1"})
+        self.assertEqual(self.emitter.stats()["coalesced"], 0)
+
+    def test_coalesced_events_keep_the_place_of_the_first(self):
+        self.emitter.emit("s1", "task_started", task_id="t1")
+        self.emitter.flush()
+        self.emitter.emit("s1", "folder_progress", task_id="t1", processed=1)
+        self.emitter.emit("s1", "picture_done", task_id="t1", picture_id="p1")
+        self.emitter.emit("s1", "folder_progress", task_id="t1", processed=2)
+        self.emitter.flush()
+
+        events = [event for _, event in self.sent[1:]]
+        self.assertEqual([e["event"] for e in events], ["folder_progress", "picture_done"])
+        self.assertEqual(events[0]["processed"], 2)
+
+    def test_sessions_are_not_coalesced_together(self):
+        self.emitter.emit("s1", "folder_progress", task_id="t1", processed=1)
+        self.emitter.emit("s2", "folder_progress", task_id="t1", processed=2)
+        self.emitter.flush()
+
+        self.assertEqual(sorted(group for group, _ in self.sent), ["progress_s1", "progress_s2"])
+
+
+# -----------------------
+# Upload storage
+# -----------------------
+class StoreUploadTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=media.name, UPLOAD_KEEP_ORIGINAL=False)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def upload(self, size, orientation=None):
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        Image.new("RGB", size, (120, 80, 40)).save(buffer, format="JPEG", exif=exif)
+        return SimpleUploadedFile("photo.jpg", buffer.getvalue(), content_type="image/jpeg")
+
+    @override_settings(UPLOAD_MAX_SIDE=100)
+    def test_downscaled_to_the_longest_side(self):
+        stored = store_upload(self.upload((400, 200)), "p1")
+
+        self.assertEqual(stored.scale_factor, 0.25)
+        self.assertEqual((stored.original_width, stored.original_height), (400, 200))
+        with Image.open(stored.path) as img:
+            self.assertEqual(img.size, (100, 50))
+
+    @override_settings(UPLOAD_MAX_SIDE=100)
+    def test_exif_rotation_is_applied_before_scaling(self):
+        # orientation 6: stored landscape, displayed (and detected) portrait
+        stored = store_upload(self.upload((400, 200), orientation=6), "p1")
+
+        self.assertEqual((stored.original_width, stored.original_height), (200, 400))
+        self.assertEqual(stored.scale_factor, 0.25)
+        with Image.open(stored.path) as img:
+            self.assertEqual(img.size, (50, 100))
+
+    @override_settings(UPLOAD_MAX_SIDE=100)
+    def test_per_axis_factors_when_rounding_changes_the_aspect_ratio(self):
+        stored = store_upload(self.upload((300, 101)), "p1")
+
+        with Image.open(stored.path) as img:
+            self.assertEqual(img.size, (100, 34))
+        self.assertEqual(stored.scale_factor, 100 / 300)
+        self.assertEqual(stored.scale_factor_y, 34 / 101)
+
+    @override_settings(UPLOAD_MAX_SIDE=1000, UPLOAD_KEEP_ORIGINAL=True)
+    def test_small_uploads_are_kept_as_uploaded(self):
+        upload = self.upload((400, 200))
+        content = upload.read()
+
+        stored = store_upload(upload, "p1")
+
+        self.assertEqual((stored.scale_factor, stored.scale_factor_y), (1.0, 1.0))
+        self.assertEqual((stored.original_width, stored.original_height), (400, 200))
+        self.assertIsNone(stored.original_path)
+        with open(stored.path, "rb") as f:
+            self.assertEqual(f.read(), content)
+
+    def test_detections_are_mapped_back_per_axis(self):
+        picture = Picture(id="p1", image_path="", scale_factor=0.5, scale_factor_y=0.25)
+
+        results = save_detections(picture, "not_configured",
+                                  Detections([3], [0.9], [[10, 10, 20, 20]], names={3: "sofa"}))
+
+        self.assertEqual(results[0]["bbox"], [20, 40, 40, 80])
+
+    @override_settings(UPLOAD_MAX_SIDE=0)
+    def test_stored_as_uploaded_without_a_max_side(self):
+        upload = self.upload((400, 200))
+        content = upload.read()
+
+        stored = store_upload(upload, "p1")
+
+        self.assertEqual(stored.scale_factor, 1.0)
+        with open(stored.path, "rb") as f:
+            self.assertEqual(f.read(), content)
+
+
+# -----------------------
+# Async uploads
+# -----------------------
+@override_settings(DETECTION_MODEL_NAME="async_upload", UPLOAD_MAX_SIDE=0)
+class AsyncUploadTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        self.settings_override = override_settings(MEDIA_ROOT=media.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        for target in ("process_image", "send_progress"):
+            patcher = mock.patch(f"furniture_detector.views.{target}")
+            setattr(self, target, patcher.start())
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(ModelManager, "get_model_version", return_value="v1")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(detection_cache.clear)
+
+    def image(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (8, 8), (200, 10, 10)).save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def post(self, content, **fields):
+        upload = SimpleUploadedFile("photo.png", content, content_type="image/png")
+        data = {"session_id": "s1", "task_id": "t1", "file": upload, **fields}
+        return self.client.post(reverse("upload_async"), data)
+
+    def test_only_posts_are_accepted(self):
+        response = self.client.get(reverse("upload_async"))
+
+        self.assertEqual(response.status_code, 405)
+
+    def test_upload_is_stored_and_queued(self):
+        response = self.post(self.image())
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertFalse(body["cached"])
+        picture = Picture.objects.get(id=body["picture_id"])
+        self.assertEqual(picture.model_version, "v1")
+        self.assertTrue(os.path.exists(picture.image_path))
+        self.process_image.delay.assert_called_once()
+
+    def test_missing_ids_and_invalid_images_are_refused(self):
+        self.assertEqual(self.post(self.image(), task_id="").status_code, 400)
+        self.assertEqual(self.post(b"not an image").status_code, 400)
+
+        self.assertFalse(Picture.objects.exists())
+        self.assertEqual(os.listdir(self.media), [])
+        self.process_image.delay.assert_not_called()
+
+    def test_cached_detections_are_served_without_queueing(self):
+        content = self.image()
+        detections = [{"class_id": 3, "name": "sofa", "confidence": 0.9, "bbox": [0, 0, 4, 4]}]
+        detection_cache.put(hashlib.sha256(content).hexdigest(), "async_upload", "v1", detections)
+
+        response = self.post(content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["cached"], response.json()["results"]), (True, detections))
+        self.assertEqual(Picture.objects.get(id=response.json()["picture_id"]).detected_data, detections)
+        self.assertEqual(Furniture.objects.filter(task_id="t1").count(), 1)
+        self.process_image.delay.assert_not_called()
+        self.send_progress.assert_called_once()
+
+
+# -----------------------
+# Video uploads
+# -----------------------
+MP4_HEAD = b"\x00\x00\x00\x18ftypmp42" + b"\x00" * 64
+
+
+class UploadVideoTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        self.settings_override = override_settings(MEDIA_ROOT=media.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        patcher = mock.patch("furniture_detector.views.process_video")
+        self.process_video = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, name, content, content_type="video/mp4"):
+        video = SimpleUploadedFile(name, content, content_type=content_type)
+        return self.client.post(reverse("upload_video"), {"session_id": "s1", "file": video})
+
+    def test_video_is_stored_and_queued(self):
+        response = self.post("clip.mp4", MP4_HEAD)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(os.listdir(self.media), [f"{response.json()['video_id']}.mp4"])
+        self.process_video.delay.assert_called_once()
+
+    def test_other_files_are_refused_before_writing(self):
+        for name, content, content_type in [
+            ("notes.txt", b"hello", "text/plain"),
+            ("clip.mp4", b"#!/bin/sh\necho not a video", "video/mp4"),
+            ("clip.mp4", MP4_HEAD, "text/html"),
+            ("clip.exe", MP4_HEAD, "video/mp4"),
+        ]:
+            with self.subTest(name=name, content_type=content_type):
+                self.assertEqual(self.post(name, content, content_type).status_code, 400)
+
+        self.assertEqual(os.listdir(self.media), [])
+        self.process_video.delay.assert_not_called()
+
+    @override_settings(UPLOAD_VIDEO_MAX_BYTES=32)
+    def test_large_videos_are_refused(self):
+        self.assertEqual(self.post("clip.mp4", MP4_HEAD).status_code, 400)
+        self.assertEqual(os.listdir(self.media), [])
+
+
+# -----------------------
+# Query detections
+# -----------------------
+class ListDetectionsTests(TestCase):
+    def setUp(self):
+        for session_id, task_id in (("s1", "t1"), ("s1", "t2"), ("s2", "t3")):
+            task = Task.objects.create(id=task_id, session_id=session_id)
+            picture = Picture.objects.create(id=f"p-{task_id}", image_path="", task=task)
+            Furniture.objects.bulk_create([
+                Furniture(name=name, class_id=class_id, confidence=confidence, x1=0, y1=0, x2=10, y2=10,
+                          picture=picture, task=task)
+                for name, class_id, confidence in (("sofa", 3, 0.9), ("chair", 0, 0.6), ("sofa", 3, 0.4))
+            ])
+
+    def get(self, **params):
+        response = self.client.get(reverse("detections"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_filters_combine(self):
+        self.assertEqual(self.get(session_id="s1")["count"], 6)
+        self.assertEqual(self.get(task_id="t3")["count"], 3)
+        self.assertEqual(self.get(picture_id="p-t1", name="sofa")["count"], 2)
+        self.assertEqual(self.get(session_id="s1", class_id=0)["count"], 2)
+
+        results = self.get(task_id="t1", min_confidence=0.5)["results"]
+        self.assertEqual([(r["name"], r["confidence"]) for r in results], [("sofa", 0.9), ("chair", 0.6)])
+        self.assertEqual(results[0]["bbox"], [0, 0, 10, 10])
+
+    def test_pages_follow_confidence_order(self):
+        first = self.get(session_id="s1", page_size=4)
+        second = self.get(session_id="s1", page_size=4, page=2)
+
+        self.assertEqual(first["count"], 6)
+        self.assertIsNotNone(first["next"])
+        self.assertIsNone(second["next"])
+        confidences = [r["confidence"] for r in first["results"] + second["results"]]
+        self.assertEqual(confidences, [0.9, 0.9, 0.6, 0.6, 0.4, 0.4])
+
+    def test_invalid_parameters_are_refused(self):
+        for params in ({"class_id": "sofa"}, {"min_confidence": "high"}):
+            with self.subTest(**params):
+                response = self.client.get(reverse("detections"), params)
+                self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(self.client.get(reverse("detections"), {"page": 9}).status_code, 404)
+
+
+# -----------------------
+# Inference server
+# -----------------------
+class InferenceServerTests(SimpleTestCase):
+    def setUp(self):
+        register_fake("served", klass=RecordingDetector, loader_kwargs={"batch_size": 8})
+        self.addCleanup(forget_model, "served")
+        RecordingDetector.images = []
+        RecordingDetector.batches = []
+        RecordingDetector.release.set()
+        self.addCleanup(RecordingDetector.release.set)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.server = InferenceServer(os.path.join(directory.name, "inference.sock"))
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def connect(self, timeout=5):
+        client = InferenceClient(self.server.socket_path, timeout=timeout)
+        self.addCleanup(client.close)
+        return client
+
+    def test_predict_round_trip(self):
+        image = np.full((4, 6, 3), 7, dtype=np.uint8)
+
+        detections = self.connect().predict_image(image, "served", TEST_CATEGORY)
+
+        self.assertEqual(detections.class_ids.tolist(), [3])
+        self.assertEqual(detections.names, {3: "sofa"})
+        np.testing.assert_array_equal(RecordingDetector.images[0], image)
+
+    def test_timeout_then_reconnect(self):
+        client = self.connect(timeout=0.2)
+        first = np.full((4, 6, 3), 1, dtype=np.uint8)
+        RecordingDetector.release.clear()
+
+        with self.assertRaises(OSError):
+            client.predict_image(first, "served", TEST_CATEGORY)
+        RecordingDetector.release.set()
+        client.timeout = 5
+        detections = client.predict_image(np.full((4, 6, 3), 2, dtype=np.uint8), "served", TEST_CATEGORY)
+
+        self.assertEqual(detections.class_ids.tolist(), [3])
+        # the request that timed out kept its own pixels
+        np.testing.assert_array_equal(RecordingDetector.images[0], first)
+        self.assertEqual(RecordingDetector.images[-1][0, 0, 0], 2)
+
+    def test_a_batch_is_one_request_and_one_forward_pass(self):
+        images = [np.full((4, 6, 3), value, dtype=np.uint8) for value in (1, 2, 3)]
+
+        results = self.connect().predict_batch(images, "served", TEST_CATEGORY)
+
+        self.assertEqual([r.class_ids.tolist() for r in results], [[3], [3], [3]])
+        self.assertEqual(RecordingDetector.batches, [3])
+        self.assertEqual([int(image[0, 0, 0]) for image in RecordingDetector.images], [1, 2, 3])
+
+    def test_server_errors_are_raised_by_the_client(self):
+        with self.assertRaises(RuntimeError), self.assertLogs("furniture_detector.model.inference_server", "ERROR"):
+            self.connect().predict_image(np.zeros((2, 2, 3), np.uint8), "not_configured", TEST_CATEGORY)
+        self.assertTrue(self.connect().ping()["ok"])
+
+
+# -----------------------
+# Batch uploads
+# -----------------------
+class FailingPathDetector(FakeDetector):
+    """ Batches always fail; single images whose path contains `fail` too. """
+
+    def predict_batch(self, image_paths: list, save_path: str = None) -> list:
+        raise RuntimeError("batch failed")
+
+    def predict_image(self, image_path, save_path: str = None) -> Detections:
+        if "fail" in str(image_path):
+            raise ValueError("unreadable")
+        return super().predict_image(image_path)
+
+
+@override_settings(DETECTION_MODEL_NAME="batch_upload", UPLOAD_MAX_SIDE=0, UPLOAD_BATCH_CHUNK_SIZE=2)
+class BatchUploadTests(TestCase):
+    def setUp(self):
+        # tasks run their models in the "detection" category
+        register_fake("batch_upload", category="detection")
+        self.addCleanup(forget_model, "batch_upload")
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=media.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        # the chord runs in this process: chunks, then finish_batch
+        eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", eager)
+        self.events = []
+        patcher = mock.patch("furniture_detector.tasks.send_progress",
+                             side_effect=lambda session_id, event, **kwargs: self.events.append((event, kwargs)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def images(self, count):
+        files = []
+        for i in range(count):
+            buffer = io.BytesIO()
+            Image.new("RGB", (8, 8), (i, 0, 0)).save(buffer, format="PNG")
+            files.append(SimpleUploadedFile(f"{i}.png", buffer.getvalue(), content_type="image/png"))
+        return files
+
+    def upload(self, count):
+        response = self.client.post(reverse("upload_batch"),
+                                    {"session_id": "s1", "task_id": "batch", "files": self.images(count)})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def finished(self):
+        return [kwargs for event, kwargs in self.events if event == "batch_finished"]
+
+    def test_every_chunk_is_saved_and_finished_once(self):
+        body = self.upload(5)
+
+        self.assertEqual(body["submitted"], 5)
+        self.assertEqual(Furniture.objects.filter(task_id="batch").count(), 5)
+        self.assertEqual([e for e, _ in self.events].count("batch_progress"), 3)
+        self.assertEqual(len(self.finished()), 1)
+        self.assertEqual(self.finished()[0]["processed"], 5)
+        self.assertEqual(Task.objects.get(id="batch").status, "batch_finished")
+
+    def test_a_picture_that_fails_to_save_does_not_stop_the_batch(self):
+        save = save_detections
+        calls = []
+
+        def flaky_save(picture, *args, **kwargs):
+            calls.append(picture.id)
+            if len(calls) == 2:
+                raise ValueError("No class name for class ids [3]")
+            return save(picture, *args, **kwargs)
+
+        with mock.patch("furniture_detector.tasks.save_detections", side_effect=flaky_save), \
+                self.assertLogs("furniture_detector.tasks", "ERROR"):
+            self.upload(3)
+
+        finished = self.finished()
+        self.assertEqual(len(finished), 1)
+        self.assertEqual(finished[0]["failed"], [calls[1]])
+        self.assertEqual(finished[0]["processed"], 2)
+        failures = [kwargs for event, kwargs in self.events if event == "picture_failed"]
+        self.assertEqual([f["picture_id"] for f in failures], [calls[1]])
+        self.assertEqual(Task.objects.get(id="batch").status, "batch_finished")
+
+    def test_failed_batches_are_retried_per_picture(self):
+        register_fake("batch_upload", klass=FailingPathDetector, category="detection")
+        task = Task.objects.create(id="direct", session_id="s1")
+        for picture_id in ("ok", "fail"):
+            Picture.objects.create(id=picture_id, image_path=f"/{picture_id}.jpg", task=task)
+
+        with self.assertLogs("furniture_detector.tasks", "ERROR"):
+            result = process_batch("direct", "s1", ["ok", "fail"], "batch_upload")
+
+        self.assertEqual((result["processed"], result["failed"]), (1, ["fail"]))
+        self.assertEqual(Picture.objects.get(id="ok").detected_data[0]["name"], "sofa")
+
+    def test_a_model_that_fails_to_load_fails_its_pictures_not_the_chunk(self):
+        task = Task.objects.create(id="direct", session_id="s1")
+        Picture.objects.create(id="p1", image_path="/p1.jpg", task=task)
+
+        with mock.patch.object(FakeDetector, "load_model", side_effect=RuntimeError("no weights")), \
+                self.assertLogs("furniture_detector.tasks", "ERROR"):
+            result = process_batch("direct", "s1", ["p1"], "batch_upload")
+
+        self.assertEqual(result["failed"], ["p1"])
+
+    def test_prefork_workers_run_images_without_the_batcher(self):
+        set_concurrent_tasks(False)
+        self.addCleanup(set_concurrent_tasks, True)
+        task = Task.objects.create(id="direct", session_id="s1")
+        Picture.objects.create(id="p1", image_path="/p1.jpg", task=task)
+
+        with mock.patch("furniture_detector.tasks.get_batcher") as get_batcher:
+            result = process_image("direct", "p1", "s1", "/p1.jpg", "batch_upload")
+
+        get_batcher.assert_not_called()
+        self.assertEqual(result["results"][0]["name"], "sofa")
+
+
+# -----------------------
+# Profiling
+# -----------------------
+def spin_for_the_sampler(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+@override_settings(PROFILE_INTERVAL_MS=1, PROFILE_TORCH=False)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        self.settings_override = override_settings(MEDIA_ROOT=media.name, MEDIA_URL="/media/")
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.task = Task.objects.create(id="profiled", session_id="s1")
+        os.makedirs(os.path.join(self.media, "uploads"))
+
+    def picture(self, picture_id):
+        return Picture.objects.create(id=picture_id, task=self.task,
+                                      image_path=os.path.join(self.media, "uploads", f"{picture_id}.jpg"))
+
+    def test_sampler_records_the_watched_thread(self):
+        sampler = profiling.StackSampler(interval=0.001)
+        sampler.start()
+        spin_for_the_sampler(0.1)
+        sampler.stop()
+
+        self.assertGreater(sampler.samples, 0)
+        self.assertTrue(all(stack.startswith("MainThread;") for stack in sampler.stacks))
+        top = sampler.top_functions()[0]
+        self.assertTrue(top["function"].startswith("spin_for_the_sampler (furniture_detector/tests.py:"))
+        self.assertGreater(top["self_pct"], 50)
+
+        path = os.path.join(self.media, "stacks.txt")
+        sampler.write_collapsed(path)
+        with open(path) as f:
+            stack, count = f.readline().rsplit(" ", 1)
+        self.assertIn(";spin_for_the_sampler (", stack)
+        self.assertEqual(int(count), max(sampler.stacks.values()))
+
+    def test_artifacts_are_written_next_to_the_picture(self):
+        picture = self.picture("p1")
+        timer = StageTimer()
+
+        with profiling.capture(picture, timer):
+            spin_for_the_sampler(0.05)
+            timer.mark("inference")
+
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media, "uploads"))),
+                         ["p1.profile.json", "p1.stacks.txt"])
+        summary = profiling.load_summary(picture.image_path)
+        self.assertEqual((summary["picture_id"], summary["task_id"], summary["error"]), ("p1", "profiled", None))
+        self.assertEqual(list(summary["stages"]), ["profiler_setup", "inference"])
+        self.assertIsNone(summary["top_operators"])
+        self.assertEqual(summary["artifacts"], {"stacks": "p1.stacks.txt"})
+
+    def test_failed_runs_are_profiled_too(self):
+        picture = self.picture("p1")
+
+        with self.assertRaises(ValueError):
+            with profiling.capture(picture, StageTimer()):
+                raise ValueError("unreadable")
+
+        self.assertEqual(profiling.load_summary(picture.image_path)["error"], "ValueError('unreadable')")
+
+    def test_task_profile_serves_artifact_urls(self):
+        self.picture("p0")
+        with profiling.capture(self.picture("p1"), StageTimer()):
+            pass
+
+        response = self.client.get(reverse("task_profile", args=["profiled"]))
+
+        self.assertEqual(response.status_code, 200)
+        profiles = response.json()["profiles"]
+        self.assertEqual([p["picture_id"] for p in profiles], ["p1"])
+        self.assertEqual(profiles[0]["artifacts"], {"stacks": "http://testserver/media/uploads/p1.stacks.txt"})
+
+    def test_task_profile_without_profiled_pictures_is_404(self):
+        self.picture("p1")
+
+        self.assertEqual(self.client.get(reverse("task_profile", args=["profiled"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("task_profile", args=["missing"])).status_code, 404)
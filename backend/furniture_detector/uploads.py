@@ -0,0 +1,93 @@
+from typing import NamedTuple, Optional
+from django.conf import settings
+from PIL import Image, ImageOps
+from .model import metrics
+import hashlib
+import os
+
+
+class StoredUpload(NamedTuple):
+    path: str                     # image the model runs on
+    content_hash: str             # sha256 of the uploaded bytes
+    scale_factor: float = 1.0     # stored image width / original image width
+    original_width: Optional[int] = None
+    original_height: Optional[int] = None
+    original_path: Optional[str] = None
+    scale_factor_y: float = 1.0   # stored image height / original image height
+
+
+@metrics.timed("upload_write")
+def store_upload(image, picture_id: str) -> StoredUpload:
+    """
+    Writes an uploaded image to MEDIA_ROOT and hashes its bytes on the way.
+
+    With UPLOAD_MAX_SIDE set, uploads with a longer side are decoded once and
+    only a copy downscaled to that longest side is stored for the model (the
+    original is kept too if UPLOAD_KEEP_ORIGINAL); smaller ones are stored as
+    uploaded. The returned per-axis scale factors map detections back to
+    original-image coordinates.
+    """
+    path = os.path.join(settings.MEDIA_ROOT, f'{picture_id}.jpg')
+    max_side = settings.UPLOAD_MAX_SIDE
+
+    if not max_side:
+        return StoredUpload(path=path, content_hash=_write(image, path))
+
+    image.seek(0)
+    with Image.open(image) as img:
+        # orientation as the model would see it (cv2 applies EXIF rotation too)
+        orientation = img.getexif().get(0x0112, 1)
+        rotated = orientation in (5, 6, 7, 8)
+        original_width, original_height = (img.height, img.width) if rotated else img.size
+
+    scale = max_side / max(original_width, original_height)
+    if scale >= 1.0:
+        # nothing to downscale: the upload is the model-ready image
+        return StoredUpload(path=path, content_hash=_write(image, path),
+                            original_width=original_width, original_height=original_height)
+
+    original_path = None
+    if settings.UPLOAD_KEEP_ORIGINAL:
+        original_path = os.path.join(settings.MEDIA_ROOT, f'{picture_id}_original{_extension(image)}')
+    content_hash = _write(image, original_path)
+
+    target = (max(1, round(original_width * scale)), max(1, round(original_height * scale)))
+    image.seek(0)
+    with Image.open(image) as img:
+        # JPEG: let the decoder do most of the downscaling (DCT scaling) instead of
+        # decoding every pixel of a 12-48 MP photo
+        img.draft('RGB', target[::-1] if rotated else target)
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        if img.size != target:
+            img = img.resize(target, Image.BILINEAR, reducing_gap=2.0)
+        img.save(path, format='JPEG', quality=90)
+
+    return StoredUpload(
+        path=path,
+        content_hash=content_hash,
+        # rounding each side to whole pixels changes the aspect ratio slightly
+        scale_factor=target[0] / original_width,
+        scale_factor_y=target[1] / original_height,
+        original_width=original_width,
+        original_height=original_height,
+        original_path=original_path,
+    )
+
+
+def _write(image, path: Optional[str]) -> str:
+    """ Writes the upload's bytes to `path` (only hashes them without one). Returns their sha256. """
+    hasher = hashlib.sha256()
+    if path is None:
+        for chunk in image.chunks():
+            hasher.update(chunk)
+        return hasher.hexdigest()
+    with open(path, 'wb+') as f:
+        for chunk in image.chunks():
+            hasher.update(chunk)
+            f.write(chunk)
+    return hasher.hexdigest()
+
+
+def _extension(image) -> str:
+    ext = os.path.splitext(getattr(image, 'name', '') or '')[1].lower()
+    return ext if ext else '.jpg'
@@ -3,5 +3,12 @@ from . import views
 
 urlpatterns = [
     path('upload/', views.upload_image, name='upload'),
+    path('upload/async/', views.upload_image_async, name='upload_async'),
+    path('upload/batch/', views.upload_batch, name='upload_batch'),
+    path('video/', views.upload_video, name='upload_video'),
+    path('detections/', views.list_detections, name='detections'),
     path('dimensions/', views.calculate_dimensions, name='dimensions'),
+    path('dimensions/picture/', views.picture_dimensions, name='picture_dimensions'),
+    path('tasks/<str:task_id>/profile/', views.task_profile, name='task_profile'),
+    path('cache/', views.detection_cache_stats, name='detection_cache_stats'),
 ]
@@ -1,12 +1,24 @@
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from .serializers import *
-from .models import Task, Picture
+from .models import Furniture, Task, Picture
+import os
+import time
 import uuid
 from django.conf import settings
-import os
-from .tasks import process_image
+from .cache import detection_cache, dimension_cache
+from .dimensions import estimate_dimensions, reference_index
+from .model.detections import Detections
+from . import profiling
+from .model.registry import ModelManager
+from .tasks import named_detections, process_image, process_video, send_progress, store_furniture, submit_batch
+from .uploads import store_upload
 
 # -----------------------
 # Upload image
@@ -17,6 +29,8 @@ def upload_image(request):
 
     session_id = request.data.get('session_id')
     task_id = request.data.get('task_id')
+    # profile=1 runs the upload under the profiler, see GET tasks/<task_id>/profile/
+    profile = profiling.requested(request.data.get('profile'))
 
     if not session_id or not task_id:
         return Response({"error": "Session id and task id must be provided"}, status=400)
@@ -28,21 +42,253 @@ def upload_image(request):
             id=task_id, defaults={"session_id": session_id}
         )
         picture_id = str(uuid.uuid4())
-        path = os.path.join(settings.MEDIA_ROOT, f'{picture_id}.jpg')
-        with open(path, 'wb+') as f:
-            for chunk in image.chunks():
-                f.write(chunk)
+        upload = store_upload(image, picture_id)
+        path = upload.path
 
-        picture = Picture.objects.create(id=picture_id, image_path=path)
+        model_name = settings.DETECTION_MODEL_NAME
+        model_version = ModelManager.get_model_version(model_name)
+        # a profiled upload is always processed, even if its detections are cached
+        cached = None if profile else detection_cache.lookup(upload.content_hash, model_name, model_version)
+
+        picture = Picture.objects.create(
+            id=picture_id, image_path=path, detected_data=cached, task=task,
+            content_hash=upload.content_hash, model_name=model_name, model_version=model_version,
+            original_path=upload.original_path, original_width=upload.original_width,
+            original_height=upload.original_height,
+            scale_factor=upload.scale_factor, scale_factor_y=upload.scale_factor_y,
+        )
 
-        process_image.delay(task.id, picture.id, session_id, path)
+        if cached is not None:
+            store_furniture([picture])
+            send_progress(session_id, "decoding_finished", task_id=task.id, picture_id=picture.id, cached=True)
+            return Response({"task_id": task.id, "picture_id": picture.id, "cached": True, "results": cached})
 
-        return Response({"task_id": task.id, "picture_id": picture.id})
+        process_image.delay(task.id, picture.id, session_id, path, model_name, queued_at=time.time(),
+                            profile=profile or profiling.sampled())
+
+        return Response({"task_id": task.id, "picture_id": picture.id, "cached": False})
 
     return Response(serializer.errors, status=400)
 
 
 
+# -----------------------
+# Upload image (async)
+# -----------------------
+def _receive_upload(request, picture_id):
+    """
+    Blocking part of an upload: multipart parsing, image validation and the
+    write to MEDIA_ROOT. Run off the event loop by `upload_image_async`.
+    """
+    serializer = UploadSerializer(data=request.FILES)
+    if not serializer.is_valid():
+        return serializer.errors, None
+    return None, store_upload(serializer.validated_data['file'], picture_id)
+
+
+@csrf_exempt
+async def upload_image_async(request):
+    """
+    Same contract as `upload_image`, as a native async view for the ASGI stack.
+    The ASGI handler receives the body without holding a thread; file I/O and
+    the Celery publish run in the thread pool only for as long as they take,
+    and the ORM calls are async, so slow clients don't pin worker threads.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    # POST fields are parsed from the spooled body, off the event loop
+    data = await sync_to_async(lambda: request.POST, thread_sensitive=False)()
+    session_id = data.get('session_id')
+    task_id = data.get('task_id')
+    profile = profiling.requested(data.get('profile'))
+
+    if not session_id or not task_id:
+        return JsonResponse({"error": "Session id and task id must be provided"}, status=400)
+
+    picture_id = str(uuid.uuid4())
+    errors, upload = await sync_to_async(_receive_upload, thread_sensitive=False)(request, picture_id)
+    if errors:
+        return JsonResponse(errors, status=400)
+
+    task, created = await Task.objects.aget_or_create(
+        id=task_id, defaults={"session_id": session_id}
+    )
+
+    model_name = settings.DETECTION_MODEL_NAME
+    model_version = await sync_to_async(ModelManager.get_model_version, thread_sensitive=False)(model_name)
+    cached = None if profile else await detection_cache.alookup(upload.content_hash, model_name, model_version)
+
+    picture = await Picture.objects.acreate(
+        id=picture_id, image_path=upload.path, detected_data=cached, task=task,
+        content_hash=upload.content_hash, model_name=model_name, model_version=model_version,
+        original_path=upload.original_path, original_width=upload.original_width,
+        original_height=upload.original_height,
+        scale_factor=upload.scale_factor, scale_factor_y=upload.scale_factor_y,
+    )
+
+    if cached is not None:
+        await sync_to_async(store_furniture)([picture])
+        send_progress(session_id, "decoding_finished", task_id=task.id, picture_id=picture.id, cached=True)
+        return JsonResponse({"task_id": task.id, "picture_id": picture.id, "cached": True, "results": cached})
+
+    await sync_to_async(process_image.delay, thread_sensitive=False)(
+        task.id, picture.id, session_id, upload.path, model_name, queued_at=time.time(),
+        profile=profile or profiling.sampled(),
+    )
+
+    return JsonResponse({"task_id": task.id, "picture_id": picture.id, "cached": False})
+
+
+
+# -----------------------
+# Upload batch of images
+# -----------------------
+@api_view(['POST'])
+def upload_batch(request):
+    """
+    Multipart form with session_id, task_id and any number of `files`
+    (up to UPLOAD_BATCH_MAX_FILES), e.g. every photo of a room scan.
+    Files are written concurrently, all pictures are created with one query and
+    the uncached ones are processed by a single Celery chord that reports
+    `batch_finished` once on progress_<session_id>.
+    """
+    serializer = BatchUploadSerializer(data=request.data)
+
+    session_id = request.data.get('session_id')
+    task_id = request.data.get('task_id')
+
+    if not session_id or not task_id:
+        return Response({"error": "Session id and task id must be provided"}, status=400)
+
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=400)
+
+    files = serializer.validated_data['files']
+    task, created = Task.objects.get_or_create(
+        id=task_id, defaults={"session_id": session_id}
+    )
+
+    picture_ids = [str(uuid.uuid4()) for _ in files]
+    with ThreadPoolExecutor(max_workers=min(8, len(files))) as pool:
+        uploads = list(pool.map(store_upload, files, picture_ids))
+
+    model_name = settings.DETECTION_MODEL_NAME
+    model_version = ModelManager.get_model_version(model_name)
+
+    pictures = []
+    for picture_id, upload in zip(picture_ids, uploads):
+        cached = detection_cache.lookup(upload.content_hash, model_name, model_version)
+        pictures.append(Picture(
+            id=picture_id, image_path=upload.path, detected_data=cached, task=task,
+            content_hash=upload.content_hash, model_name=model_name, model_version=model_version,
+            original_path=upload.original_path, original_width=upload.original_width,
+            original_height=upload.original_height,
+            scale_factor=upload.scale_factor, scale_factor_y=upload.scale_factor_y,
+        ))
+    Picture.objects.bulk_create(pictures)
+    store_furniture([p for p in pictures if p.detected_data is not None])
+
+    pending = [p.id for p in pictures if p.detected_data is None]
+    cached_count = len(pictures) - len(pending)
+    if pending:
+        submit_batch(task.id, session_id, pending, model_name, total=len(pictures), cached=cached_count,
+                     chunk_size=settings.UPLOAD_BATCH_CHUNK_SIZE)
+    else:
+        send_progress(session_id, "batch_finished", task_id=task.id, total=len(pictures),
+                      processed=len(pictures), cached=cached_count, failed=[])
+
+    return Response({
+        "task_id": task.id,
+        "submitted": len(pending),
+        "pictures": [
+            {"picture_id": p.id, "cached": p.detected_data is not None, "results": p.detected_data}
+            for p in pictures
+        ],
+    })
+
+
+
+# -----------------------
+# Upload video
+# -----------------------
+@api_view(['POST'])
+def upload_video(request):
+    """
+    Multipart form with session_id and a video `file`. Frame detections are
+    pushed to progress_<session_id> as `frame_detections` events; optional
+    `target_fps` caps how many frames per second are inferred.
+    """
+    session_id = request.data.get('session_id')
+    if not session_id or request.FILES.get('file') is None:
+        return Response({"error": "Session id and a video file must be provided"}, status=400)
+
+    try:
+        target_fps = float(request.data.get('target_fps') or settings.STREAM_TARGET_FPS)
+    except ValueError:
+        return Response({"error": "target_fps must be a number"}, status=400)
+
+    # type and size are checked before anything is written under MEDIA_ROOT
+    serializer = VideoUploadSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=400)
+    video = serializer.validated_data['file']
+
+    video_id = str(uuid.uuid4())
+    extension = os.path.splitext(video.name)[1].lower()
+    path = os.path.join(settings.MEDIA_ROOT, f'{video_id}{extension}')
+    with open(path, 'wb+') as f:
+        for chunk in video.chunks():
+            f.write(chunk)
+
+    process_video.delay(session_id, path, settings.DETECTION_MODEL_NAME, target_fps=target_fps)
+
+    return Response({"video_id": video_id, "session_id": session_id})
+
+
+
+# -----------------------
+# Query detections
+# -----------------------
+class DetectionPagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+@api_view(['GET'])
+def list_detections(request):
+    """
+    Stored detections (Furniture rows), highest confidence first, paginated
+    (?page=, ?page_size=). Filters, all optional:
+        session_id, task_id, picture_id, name, class_id, min_confidence
+    e.g. ?session_id=X&name=sofa or ?task_id=Y&min_confidence=0.8
+    """
+    params = request.query_params
+    queryset = Furniture.objects.all()
+
+    if params.get('session_id'):
+        queryset = queryset.filter(task__session_id=params['session_id'])
+    if params.get('task_id'):
+        queryset = queryset.filter(task_id=params['task_id'])
+    if params.get('picture_id'):
+        queryset = queryset.filter(picture_id=params['picture_id'])
+    if params.get('name'):
+        queryset = queryset.filter(name=params['name'])
+    try:
+        if params.get('class_id'):
+            queryset = queryset.filter(class_id=int(params['class_id']))
+        if params.get('min_confidence'):
+            queryset = queryset.filter(confidence__gte=float(params['min_confidence']))
+    except ValueError:
+        return Response({"error": "class_id must be an integer and min_confidence a number"}, status=400)
+
+    paginator = DetectionPagination()
+    page = paginator.paginate_queryset(queryset.order_by('-confidence', 'id'), request)
+    return paginator.get_paginated_response(FurnitureSerializer(page, many=True).data)
+
+
+
 # -----------------------
 # Calculate dimensions
 # -----------------------
@@ -63,3 +309,97 @@ def calculate_dimensions(request):
 
     scale = ref_len / detected_len
     return Response({"scale_factor": scale})
+
+
+# -----------------------
+# Dimensions of all detections of a picture
+# -----------------------
+@api_view(['POST'])
+def picture_dimensions(request):
+    """
+    Body JSON:
+    {
+        "picture_id": "...",
+        "reference_index": 2,          # detection used as reference, or:
+        "reference_class": "chair",    # its most confident detection (class name or id)
+        "reference_length": 45,        # real size of the reference, e.g. cm
+        "reference_axis": "width"      # width (default), height or longest
+    }
+    Returns width / height of every detection of the picture in the reference's units.
+    """
+    picture_id = request.data.get("picture_id")
+    index = request.data.get("reference_index")
+    reference_class = request.data.get("reference_class")
+    axis = request.data.get("reference_axis", "width")
+
+    if not picture_id or (index is None) == (reference_class is None):
+        return Response({"error": "picture_id and one of reference_index / reference_class must be provided"},
+                        status=400)
+    try:
+        reference_length = float(request.data.get("reference_length", 0))
+        index = int(index) if index is not None else None
+    except (TypeError, ValueError):
+        return Response({"error": "reference_length must be a number and reference_index an integer"}, status=400)
+    if reference_length <= 0:
+        return Response({"error": "Invalid values"}, status=400)
+
+    picture = get_object_or_404(
+        Picture.objects.only("id", "detected_data", "model_name", "model_version"), id=picture_id
+    )
+    if picture.detected_data is None:
+        return Response({"error": "Picture has not been processed yet"}, status=409)
+
+    def compute():
+        # names are stored with the detections; pictures processed before that use the model's
+        detections = named_detections(picture.model_name, Detections.from_dicts(picture.detected_data))
+        class_names = detections.names
+        reference = reference_index(detections, class_names, index=index, reference_class=reference_class)
+        return estimate_dimensions(detections, class_names, reference, reference_length, axis=axis)
+
+    key = (picture.id, picture.model_name, picture.model_version,
+           index, str(reference_class) if reference_class is not None else None, reference_length, axis)
+    try:
+        result = dimension_cache.get_or_compute(key, compute)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+
+    return Response({"picture_id": picture.id, **result})
+
+
+
+# -----------------------
+# Profiles of a task
+# -----------------------
+@api_view(['GET'])
+def task_profile(request, task_id):
+    """
+    Summaries of the task's profiled pictures (uploads with profile=1 or sampled
+    by PROFILE_SAMPLE_RATE): wall time per stage, top Python functions and torch
+    operators, and URLs of the full artifacts.
+    """
+    task = get_object_or_404(Task, id=task_id)
+    profiles = []
+    for picture in task.pictures.only("id", "image_path").order_by("id"):
+        summary = profiling.load_summary(picture.image_path)
+        if summary is None:
+            continue
+        folder = os.path.relpath(os.path.dirname(picture.image_path), settings.MEDIA_ROOT)
+        summary["artifacts"] = {
+            name: request.build_absolute_uri(
+                settings.MEDIA_URL + os.path.normpath(os.path.join(folder, filename)).replace(os.sep, "/")
+            )
+            for name, filename in summary["artifacts"].items()
+        }
+        profiles.append(summary)
+
+    if not profiles:
+        return Response({"error": "No profiled pictures for this task"}, status=404)
+    return Response({"task_id": task.id, "profiles": profiles})
+
+
+# -----------------------
+# Detection cache stats
+# -----------------------
+@api_view(['GET'])
+def detection_cache_stats(request):
+    return Response(detection_cache.stats())
@@ -0,0 +1,151 @@
+"""
+Celery worker lifecycle hooks.
+
+Models listed by `ModelManager.preload_list()` are loaded and warmed up before
+the worker takes tasks:
+- prefork pool: in every child, on `worker_process_init` (the parent waits for
+  it, see CELERY_WORKER_PROC_ALIVE_TIMEOUT)
+- threads / gevent / solo pools: once in the worker process, on `worker_init`
+
+Readiness is logged, and written to WORKER_READY_FILE if set, only once warmup is
+done: prefork children each leave a marker in `<WORKER_READY_FILE>.children/`
+once preloaded, and the parent writes the file when every child has one.
+Micro-batching (model.batching) only groups images of tasks running at the same
+time in one process: with prefork / solo pools it is turned off and tasks run
+the model directly; use `-P threads` (or gevent) with --concurrency > 1 to batch.
+Without -Q, the worker consumes the default queue plus the queues of its models
+(see queues.subscribe_worker), so it only gets jobs for models it keeps resident.
+With METRICS_WORKER_PORT set, the worker serves Prometheus metrics (of all its
+children in multiprocess mode) on that port.
+"""
+from celery.signals import (
+    worker_init, worker_process_init, worker_process_shutdown, worker_ready, worker_shutdown,
+)
+from django.conf import settings
+import logging
+import os
+import shutil
+import threading
+import time
+from .model import metrics
+from .model.batching import set_concurrent_tasks
+from .model.registry import ModelManager
+from .progress import progress_emitter
+from .queues import subscribe_worker
+
+logger = logging.getLogger(__name__)
+
+# pool processes of a prefork worker (set on worker_init), 0 for the other pools
+_prefork_children = 0
+
+
+def _pool_name(worker) -> str:
+    pool_cls = getattr(worker, "pool_cls", None)
+    return str(pool_cls if isinstance(pool_cls, str) else getattr(pool_cls, "__module__", ""))
+
+
+def _is_prefork(worker) -> bool:
+    return "prefork" in _pool_name(worker)
+
+
+def _runs_tasks_concurrently(worker) -> bool:
+    """ Whether one process of this worker runs several tasks at once (threads / gevent / eventlet). """
+    name = _pool_name(worker)
+    return not ("prefork" in name or "solo" in name) and (getattr(worker, "concurrency", 1) or 1) > 1
+
+
+def preload_models():
+    if settings.INFERENCE_SERVER_SOCKET:
+        # models live in the inference server, not in workers
+        return
+
+    model_names = ModelManager.preload_list()
+    if not model_names:
+        return
+
+    start = time.perf_counter()
+    timings = ModelManager.preload(model_names, warmup=True)
+    logger.info(f"Worker pid {os.getpid()} preloaded {len(timings)} models in "
+                f"{time.perf_counter() - start:.2f}s: {timings}")
+
+
+def _markers_dir() -> str:
+    return f"{settings.WORKER_READY_FILE}.children"
+
+
+def _write_ready_file():
+    logger.info("Worker ready: models preloaded and warmed up")
+    if settings.WORKER_READY_FILE:
+        with open(settings.WORKER_READY_FILE, "w") as f:
+            f.write(str(time.time()))
+
+
+def _write_ready_file_when_children_are(children: int, poll: float = 0.5):
+    """ Waits for a marker of every prefork child, then reports the worker ready. """
+    markers = _markers_dir()
+    while not (os.path.isdir(markers) and len(os.listdir(markers)) >= children):
+        time.sleep(poll)
+    _write_ready_file()
+
+
+@worker_init.connect
+def on_worker_init(sender=None, **kwargs):
+    global _prefork_children
+    subscribe_worker(sender)
+    # before prefork children are forked, so they inherit it
+    set_concurrent_tasks(_runs_tasks_concurrently(sender))
+    if _is_prefork(sender):
+        _prefork_children = sender.concurrency
+    if settings.WORKER_READY_FILE:
+        # markers of a previous run's children
+        shutil.rmtree(_markers_dir(), ignore_errors=True)
+    if settings.METRICS_WORKER_PORT:
+        # in the parent: prefork children inherit nothing from it but the multiprocess directory
+        metrics.start_server(settings.METRICS_WORKER_PORT)
+        logger.info(f"Serving metrics on port {settings.METRICS_WORKER_PORT}")
+    if not _is_prefork(sender):
+        preload_models()
+
+
+@worker_process_init.connect
+def on_worker_process_init(**kwargs):
+    preload_models()
+    if settings.WORKER_READY_FILE:
+        os.makedirs(_markers_dir(), exist_ok=True)
+        with open(os.path.join(_markers_dir(), str(os.getpid())), "w") as f:
+            f.write(str(time.time()))
+
+
+@worker_ready.connect
+def on_worker_ready(**kwargs):
+    if not _prefork_children:
+        _write_ready_file()
+        return
+    if not settings.WORKER_READY_FILE:
+        logger.info("Worker consuming, pool processes report their own preloading")
+        return
+    # children may still be preloading: the consumer is up before they are
+    logger.info(f"Worker consuming, waiting for {_prefork_children} pool processes to preload")
+    threading.Thread(target=_write_ready_file_when_children_are, args=(_prefork_children,),
+                     name="worker-ready", daemon=True).start()
+
+
+@worker_process_shutdown.connect
+def on_worker_process_shutdown(**kwargs):
+    # don't lose progress events still queued in the background emitter
+    progress_emitter.flush()
+    metrics.mark_process_dead()
+    if settings.WORKER_READY_FILE:
+        # a replaced child must preload again before it counts
+        marker = os.path.join(_markers_dir(), str(os.getpid()))
+        if os.path.exists(marker):
+            os.remove(marker)
+
+
+@worker_shutdown.connect
+def on_worker_shutdown(**kwargs):
+    progress_emitter.flush()
+    if settings.WORKER_READY_FILE:
+        if os.path.exists(settings.WORKER_READY_FILE):
+            os.remove(settings.WORKER_READY_FILE)
+        shutil.rmtree(_markers_dir(), ignore_errors=True)